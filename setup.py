@@ -95,14 +95,19 @@ setup(
             'terane/outputs/store/backend-segment-term.c',
             'terane/outputs/store/backend-txn.c',
             ],
-            # link against libdb
-            libraries=['db'],
+            # link against libdb and zlib
+            libraries=['db', 'z'],
             # set search paths for headers and libraries
             include_dirs=extra_include_dirs,
             library_dirs=extra_library_dirs,
             runtime_library_dirs=extra_runtime_dirs,
             # turn off optimization for better stack traces
             extra_compile_args=['-O0', '-Wall']
+            ),
+        Extension('terane.inputs.udp', [
+            'terane/inputs/udp.c',
+            ],
+            extra_compile_args=['-Wall']
             )
         ],
     entry_points={
@@ -116,6 +121,7 @@ setup(
         'terane.plugin': [
             # protocol plugins
             'protocol:xmlrpc=terane.protocols.xmlrpc:XMLRPCProtocolPlugin',
+            'protocol:metrics=terane.protocols.metrics:MetricsProtocolPlugin',
             # input plugins
             'input:file=terane.inputs.file:FileInputPlugin',
             'input:syslog=terane.inputs.syslog:SyslogInputPlugin',
@@ -15,10 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import os, datetime
+import os, datetime, threading
 from dateutil.tz import tzutc
 from zope.interface import implements
+from zope.component import getUtility
 from terane.manager import IManager, Manager
+from terane.sched import IScheduler, CLASS_INGEST
 from terane.settings import ConfigureError
 from terane.bier.interfaces import *
 from terane.bier.event import Event
@@ -38,7 +40,11 @@ class EventManager(Manager):
         self._pluginstore = pluginstore
         self._fields = dict()
         self._idstore = None
-        self._idcache = []
+        self._idlock = threading.Lock()
+        self._nextid = None
+        self._limitid = None
+        self._lastid = None
+        self._reserving = None
 
     def configure(self, settings):
         """
@@ -46,30 +52,39 @@ class EventManager(Manager):
         """
         section = settings.section('server')
         self._backingfile = section.getString('id cache file', '/var/lib/terane/idgen')
-        self.cachesize = section.getInt('id cache size', 256)
-        if self.cachesize < 0:
-            raise ConfigureError("'id cache size' cannot be smaller than 0")
+        self.cachesize = section.getInt('id cache size', 65536)
+        if self.cachesize < 2:
+            raise ConfigureError("'id cache size' cannot be smaller than 2")
 
     def startService(self):
         """
         Read the last document identifier from the backing file, and
-        fill the cache with new identifiers.
+        reserve the first range of identifiers.
         """
         Manager.startService(self)
         self._idstore = os.open(self._backingfile, os.O_RDWR | os.O_CREAT, 0600)
-        self._refillcache()
-        logger.debug("loaded %i entries into id cache" % self.cachesize)
+        last = self._readlast()
+        if last == 0:
+            last = long(1)
+        self._nextid = last
+        self._lastid = last
+        self._limitid = self._reserve(last + self.cachesize)
+        logger.debug("reserved %i entries for id cache", self.cachesize)
 
     def stopService(self):
         """
         Write back the last document identifier, and sync the backing
-        file to disk.
-        """
-        self._writelast(self._idcache.pop(0))
-        os.close(self._idstore)
-        self._idstore = None
-        self._idcache = []
-        return Manager.stopService(self)
+        file to disk.  If a reservation is in progress, then wait for it
+        to finish first.
+        """
+        def _close(result):
+            self._writelast(self._nextid)
+            os.close(self._idstore)
+            self._idstore = None
+            return Manager.stopService(self)
+        if self._reserving != None:
+            return self._reserving.addBoth(_close)
+        return _close(None)
 
     def getField(self, name):
         """
@@ -96,29 +111,44 @@ class EventManager(Manager):
 
     def _allocateOffset(self):
         """
-        Return a new 64-bit long document identifier.
-        """
-        try:
-            # try to use the cache first
-            return long(self._idcache.pop(0))
-        except IndexError:
-            # if the cache is empty, the fill it back up
-            self._refillcache()
-            return long(self._idcache.pop(0))
-
-    def _refillcache(self):
-        """
-        Generate a new cache of document identifiers.
-        """
-        if len(self._idcache) > 0:
-            raise Exception("ID generator failed to refill cache: cache not empty")
-        last = self._readlast()
-        if last == 0:
-            self._idcache = range(1, 1 + self.cachesize)
-            self._writelast(1 + self.cachesize)
-        else:
-            self._idcache = range(last, last + self.cachesize)
-            self._writelast(last + self.cachesize)
+        Return a new 64-bit long document identifier.  Identifiers are handed
+        out from a reserved range; once half of the range is used, the next
+        range is reserved in an ingest thread so the reactor never waits on
+        the backing file.
+        """
+        offset = self._nextid
+        if offset >= self._limitid:
+            # the asynchronous reservation has fallen behind, so we have no
+            # choice but to reserve synchronously
+            logger.debug("id cache is exhausted, reserving synchronously")
+            self._limitid = self._reserve(offset + self.cachesize)
+        self._nextid = offset + 1
+        if self._reserving == None and self._limitid - self._nextid < self.cachesize / 2:
+            self._reserving = getUtility(IScheduler).deferToThread(CLASS_INGEST,
+                self._reserve, self._limitid + self.cachesize)
+            self._reserving.addCallbacks(self._reserved, self._reserveFailed)
+        return offset
+
+    def _reserve(self, limit):
+        """
+        Reserve all document identifiers smaller than limit by storing limit
+        in the backing file.  Returns the new limit.  This method may be
+        called from a thread.
+        """
+        with self._idlock:
+            if limit > self._lastid:
+                self._writelast(limit)
+                self._lastid = limit
+            return self._lastid
+
+    def _reserved(self, limit):
+        self._reserving = None
+        if limit > self._limitid:
+            self._limitid = limit
+
+    def _reserveFailed(self, failure):
+        self._reserving = None
+        logger.error("ID generator failed to reserve identifiers: %s", failure.getErrorMessage())
 
     def _readlast(self):
         """
@@ -19,6 +19,7 @@ import datetime, copy, re
 from collections import MutableMapping
 from dateutil.tz import tzutc
 from zope.interface import implements
+from twisted.internet.defer import gatherResults
 from terane.signals import ICopyable
 
 class Assertion(object):
@@ -243,3 +244,55 @@ class Event(MutableMapping):
         if not isinstance(assertion, Assertion):
             raise TypeError("parameter must be of type Assertion")
         del self._values[assertion.fieldname]
+
+class EventBatch(list):
+    """
+    A list of events which an input signals as a single unit, so that routes
+    and outputs can process many events at once.  If the input calls
+    trackWrites() before signalling the batch, then each route registers the
+    write of its copy of the batch, and whenWritten() returns a Deferred
+    which fires once every output has stored the events.
+    """
+
+    implements(ICopyable)
+
+    def __init__(self, events=(), writes=None):
+        list.__init__(self, events)
+        self._writes = writes
+
+    def copy(self):
+        # copies share the list of writes, so the input sees every route
+        return EventBatch([event.copy() for event in self], self._writes)
+
+    def trackWrites(self):
+        """
+        Start tracking the writes of the batch.  This must be called before
+        the batch is signalled.
+        """
+        self._writes = []
+
+    def addWrite(self, d):
+        """
+        Register a write of the batch.
+
+        :param d: A Deferred which fires when the events are stored, or fails
+          if the events could not be stored.
+        :type d: :class:`twisted.internet.defer.Deferred`
+        """
+        if self._writes != None:
+            self._writes.append(d)
+        else:
+            # nobody is waiting for the write, and failures are already logged
+            d.addErrback(lambda failure: None)
+
+    def whenWritten(self):
+        """
+        Returns a Deferred which fires when every registered write has
+        finished, or fails with the first failure if any write failed.
+
+        :returns: The Deferred.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        if self._writes == None:
+            raise ValueError("writes are not tracked for this batch")
+        return gatherResults(self._writes, consumeErrors=True)
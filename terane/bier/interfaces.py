@@ -170,18 +170,30 @@ class ISearcher(Interface):
         start from the first term.  If endTerm is None, then end at the last term.
         If startEx or endEx are True, then exclude the start or end terms, respectively.
         """
+    def getProfile():
+        """
+        Returns the amount of work performed by the searcher so far, keyed by
+        segment name.  Each value is a dict containing the number of postings
+        'scanned', the number of 'skipped' postings, and the number of 'events'
+        retrieved.
+
+        :returns: The searcher profile.
+        :rtype: dict
+        """
     def close():
         """
         Frees any resources associated with the searcher.
         """
 
 class IEventStore(Interface):
-    def getEvent(evid):
+    def getEvent(evid, fields=None):
         """
         Returns the event specified by evid.
 
         :param evid: The event identifier.
         :type evid: :class:`terane.bier.evid.EVID`
+        :param fields: If not None, then only retrieve the specified fields.
+        :type fields: list or None
         :returns: A dict mapping qualified fields to values.
         :rtype: dict
         """
@@ -221,9 +233,14 @@ class IWriter(Interface):
         """
           
 class IIndex(Interface):
-    def newSearcher():
+    def newSearcher(cancellation=None):
         """
-        Returns an object implementing ISearcher.
+        Returns an object implementing ISearcher.  If cancellation is not None,
+        then the searcher and its posting lists check it before reading each
+        posting, and fail with SearchCancelled once the search is cancelled.
+
+        :param cancellation: The cancellation for the search, or None.
+        :type cancellation: :class:`terane.bier.searching.Cancellation`
         """
     def newWriter():
         """
@@ -237,6 +254,12 @@ class IIndex(Interface):
         """
         Returns a dict with Index statistics.
         """
+    def getFacets(fieldname):
+        """
+        Returns a dict mapping each value of the specified columnar field to
+        the number of events containing the value.  Indices which don't store
+        column counts return an empty dict.
+        """
 
 class IEventFactory(Interface):
     def makeEvent():
@@ -113,7 +113,7 @@ class Term(object):
         :rtype: int
         """
         length = yield searcher.postingsLength(self.field, self.value, startId, endId)
-        logger.trace("%s: postingsLength() => %i" % (self, length))
+        logger.trace("%s: postingsLength() => %i", self, length)
         returnValue(length)
 
     @inlineCallbacks
@@ -139,7 +139,7 @@ class Term(object):
         :rtype: tuple
         """
         posting = yield self._postings.nextPosting()
-        logger.trace("%s: nextPosting() => %s" % (self, posting[0])) 
+        logger.trace("%s: nextPosting() => %s", self, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -154,7 +154,7 @@ class Term(object):
         :rtype: tuple
         """
         posting = yield self._postings.skipPosting(targetId)
-        logger.trace("%s: skipPosting(%s) => %s" % (self, targetId, posting[0]))
+        logger.trace("%s: skipPosting(%s) => %s", self, targetId, posting[0])
         returnValue(posting)
 
     def close(self):
@@ -181,7 +181,7 @@ class RangeGreaterThan(Term):
     def matchesLength(self, searcher, startId, endId):
         length = yield searcher.postingsLengthBetween(self.field,
             self.value, None, self.exclusive, False, startId, endId)
-        logger.trace("%s: postingsLength() => %i" % (self, length))
+        logger.trace("%s: postingsLength() => %i", self, length)
         returnValue(length)
 
     @inlineCallbacks
@@ -210,7 +210,7 @@ class RangeLessThan(Term):
     def matchesLength(self, searcher, startId, endId):
         length = yield searcher.postingsLengthBetween(self.field,
             None, self.value, False, self.exclusive, startId, endId)
-        logger.trace("%s: postingsLength() => %i" % (self, length))
+        logger.trace("%s: postingsLength() => %i", self, length)
         returnValue(length)
 
     @inlineCallbacks
@@ -247,7 +247,7 @@ class Every(Term):
         :rtype: int
         """
         length = yield searcher.postingsLength(None, None, startId, endId)
-        logger.trace("%s: postingsLength() => %i" % (self, length))
+        logger.trace("%s: postingsLength() => %i", self, length)
         returnValue(length)
 
     @inlineCallbacks
@@ -343,7 +343,7 @@ class AND(object):
             length = yield child.matchesLength(searcher, startId, endId)
             bisect.insort_right(self._lengths, (length,child))
         length = self._lengths[0][0]
-        logger.trace("%s: matchesLength() => %i" % (self, length))
+        logger.trace("%s: matchesLength() => %i", self, length)
         returnValue(length)
 
     @inlineCallbacks
@@ -387,7 +387,7 @@ class AND(object):
                     break
             if posting[0] != None:
                 break
-        logger.trace("%s: nextPosting() => %s" % (self, posting[0])) 
+        logger.trace("%s: nextPosting() => %s", self, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -405,7 +405,7 @@ class AND(object):
                 posting = yield child.skipPosting(targetId)
                 if posting[0] == None:
                     break
-        logger.trace("%s: skipPosting(%s) => %s" % (self, targetId, posting[0]))
+        logger.trace("%s: skipPosting(%s) => %s", self, targetId, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -564,7 +564,7 @@ class OR(object):
         self._lastId = posting[0]
         # forget the evid so we don't return it again
         self._smallestPostings[curr] = (None,None,None)
-        logger.trace("%s: nextPosting() => %s" % (self, posting[0])) 
+        logger.trace("%s: nextPosting() => %s", self, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -589,7 +589,7 @@ class OR(object):
                 self._smallestPostings[i] = posting
                 if posting[0] == targetId:
                     break    
-        logger.trace("%s: skipPosting(%s) => %s" % (self, targetId, posting[0]))
+        logger.trace("%s: skipPosting(%s) => %s", self, targetId, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -661,7 +661,7 @@ class NOT(object):
         :rtype: :class:`terane.bier.evid.EVID`
         """
         posting = yield self._iter.nextPosting()
-        logger.trace("%s: nextPosting() => %s" % (self, posting[0])) 
+        logger.trace("%s: nextPosting() => %s", self, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -674,7 +674,7 @@ class NOT(object):
         :rtype: :class:`terane.bier.evid.EVID`
         """
         posting = yield self._iter.skipPosting(targetId)
-        logger.trace("%s: skipPosting(%s) => %s" % (self, targetId, posting[0]))
+        logger.trace("%s: skipPosting(%s) => %s", self, targetId, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -773,7 +773,7 @@ class Sieve(object):
             target = yield self._filterIter.skipPosting(posting[0])
             if posting[0] != target[0]:
                 break
-        logger.trace("%s: nextPosting() => %s" % (self, posting[0])) 
+        logger.trace("%s: nextPosting() => %s", self, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -793,7 +793,7 @@ class Sieve(object):
             target = yield self._filterIter.skipPosting(posting[0])
             if posting[0] == target[0]:
                 posting = (None,None,None)
-        logger.trace("%s: skipPosting(%s) => %s" % (self, targetId, posting[0]))
+        logger.trace("%s: skipPosting(%s) => %s", self, targetId, posting[0])
         returnValue(posting)
 
     @inlineCallbacks
@@ -859,7 +859,7 @@ class Phrase(object):
             length = yield searcher.postingsLength(self.field, term, startId, endId)
             bisect.insort_right(self._lengths, (length,term,position))
         length = self._lengths[0][0]
-        logger.trace("%s: matchesLength() => %i" % (self, length))
+        logger.trace("%s: matchesLength() => %i", self, length)
         returnValue(length)
 
     @inlineCallbacks
@@ -896,7 +896,7 @@ class Phrase(object):
             smallest = 0
             posting = yield self._iters[0].nextPosting()
             if posting == (None, None, None):
-                logger.trace("%s: nextPosting() => %s" % (self, posting[0])) 
+                logger.trace("%s: nextPosting() => %s", self, posting[0])
                 returnValue(posting)
             postings.append(posting)
             for i in range(len(self._iters))[1:]:
@@ -907,7 +907,7 @@ class Phrase(object):
             if len(postings) != len(self._iters):
                 continue
             if self._positionsMatch(postings) == True:
-                logger.trace("%s: nextPosting() => %s" % (self, posting[0])) 
+                logger.trace("%s: nextPosting() => %s", self, posting[0])
                 returnValue(posting)
 
     @inlineCallbacks
@@ -924,13 +924,13 @@ class Phrase(object):
         for i in range(len(self._iters)):
             posting = yield self._iters[i].skipPosting(targetId)
             if posting[0] == None:
-                logger.trace("%s: skipPosting(%s) => None" % (self, targetId))
+                logger.trace("%s: skipPosting(%s) => None", self, targetId)
                 returnValue((None, None, None))
             postings.append(posting)
         if self._positionsMatch(postings) == True:
-            logger.trace("%s: skipPosting(%s) => %s" % (self, targetId, postings[0][0]))
+            logger.trace("%s: skipPosting(%s) => %s", self, targetId, postings[0][0])
             returnValue(postings[0])
-        logger.trace("%s: skipPosting(%s) => None" % (self, targetId))
+        logger.trace("%s: skipPosting(%s) => None", self, targetId)
         returnValue((None, None, None))
 
     def _positionsMatch(self, postings):
@@ -941,7 +941,7 @@ class Phrase(object):
         for i in range(len(postings)):
             positions.append((self._lengths[i][2], postings[i][1]['pos']))
         positions = map(lambda x: x[1], sorted(positions))
-        logger.trace("%s: _positionsMatch(%s): positions=%s" % (self, postings[0][0], positions))
+        logger.trace("%s: _positionsMatch(%s): positions=%s", self, postings[0][0], positions)
         for firstPos in positions[0]:
             positionsMatch = True
             for i in range(1, len(positions)):
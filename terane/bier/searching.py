@@ -27,6 +27,57 @@ logger = getLogger('terane.bier.searching')
 class SearcherError(Exception):
     pass
 
+class SearchCancelled(SearcherError):
+    """
+    The search was cancelled, or ran past its deadline.
+    """
+    pass
+
+class IndexWarming(SearcherError):
+    """
+    The index is still being opened, and can't be searched yet.
+    """
+    pass
+
+class Cancellation(object):
+    """
+    Shared by a search and the searchers and posting lists it creates, so a
+    cancellation or deadline is noticed at the next posting boundary, even
+    from within a thread.
+    """
+
+    def __init__(self, deadline=None):
+        """
+        :param deadline: The time (in seconds since the epoch) after which the
+          search is cancelled, or None for no deadline.
+        :type deadline: float
+        """
+        self.deadline = deadline
+        self.reason = None
+
+    def cancel(self, reason="search was cancelled"):
+        """
+        Cancel the search.
+
+        :param reason: The reason the search was cancelled.
+        :type reason: str
+        """
+        if self.reason == None:
+            self.reason = reason
+
+    def check(self):
+        """
+        Raise SearchCancelled if the search was cancelled or has passed its
+        deadline.
+
+        :raises SearchCancelled: The search was cancelled.
+        """
+        if self.reason != None:
+            raise SearchCancelled(self.reason)
+        if self.deadline != None and time.time() > self.deadline:
+            self.reason = "search exceeded its deadline"
+            raise SearchCancelled(self.reason)
+
 class Period(object):
     """
     A time range within which to constain a query.
@@ -97,7 +148,7 @@ class SearcherWorker(object):
     to be scheduled. 
     """
 
-    def __init__(self, indices, query, period, lastId=None, reverse=False, fields=None, limit=100):
+    def __init__(self, indices, query, period, lastId=None, reverse=False, fields=None, limit=100, deadline=None):
         """
         :param indices: A list of indices to search.
         :type indices: A list of objects implementing :class:`terane.bier.index.IIndex`
@@ -113,6 +164,9 @@ class SearcherWorker(object):
         :type fields: list or None
         :param limit: Only returned the specified number of events.
         :type limit: int
+        :param deadline: The time (in seconds since the epoch) after which the
+          search is cancelled, or None for no deadline.
+        :type deadline: float
         """
         # determine the evids to use as start and end keys
         if reverse == False:
@@ -135,31 +189,48 @@ class SearcherWorker(object):
         self.events = []
         self.fields = []
         self.runtime = 0.0
+        self.profile = {'indices': {}, 'getevents': 0}
+        self._cancellation = Cancellation(deadline)
+
+    def cancel(self, reason="search was cancelled"):
+        """
+        Cancel the search.  The search stops at the next posting boundary,
+        releasing its posting lists and searchers.
+
+        :param reason: The reason the search was cancelled.
+        :type reason: str
+        """
+        self._cancellation.cancel(reason)
 
     def next(self):
         start = time.time()
         searchers = []
         postingLists = []
         try:
+            self._cancellation.check()
             # get a searcher and posting list for each index
             for index in self._indices:
                 # we create a copy of the original query, which can possibly be optimized
                 # with index-specific knowledge.
                 query = copy.deepcopy(self._query)
                 # get the posting list to iterate through
-                searcher = yield index.newSearcher()
+                searcher = yield index.newSearcher(self._cancellation)
                 if not ISearcher.providedBy(searcher):
                     raise TypeError("searcher does not implement ISearcher")
+                # remember the searcher right away, so it is closed even if
+                # the search is cancelled while the query is optimized
+                searchers.append((index.name,searcher))
+                self.profile['indices'][index.name] = {'matcher': None, 'segments': {}}
                 query = yield query.optimizeMatcher(searcher)
-                logger.debug("optimized query for index '%s': %s" % (index.name,str(query)))
+                logger.debug("optimized query for index '%s': %s", index.name, query)
                 # if the query optimized out entirely, then skip to the next index
                 if query == None:
-                    yield searcher.close()
                     continue
+                # record the optimized matcher tree in the profile
+                self.profile['indices'][index.name]['matcher'] = str(query)
                 postingList = yield query.iterMatches(searcher, self._startId, self._endId)
                 if not IPostingList.providedBy(postingList):
                     raise TypeError("posting list does not implement IPostingList")
-                searchers.append(searcher)
                 postingLists.append(postingList)
             if len(postingLists) == 0:
                 raise StopIteration()
@@ -174,6 +245,7 @@ class SearcherWorker(object):
                 if len(self.events) == self._limit:
                     self.runtime = time.time() - start
                     raise StopIteration()
+                self._cancellation.check()
                 # check each child iter for the lowest evid
                 for currList in range(len(postingLists)):
                     if currList == None:
@@ -219,7 +291,9 @@ class SearcherWorker(object):
                 # retrieve the event
                 if not IEventStore.providedBy(store):
                     raise TypeError("store does not implement IEventStore")
-                event = yield store.getEvent(evid)
+                # only the requested fields are decoded by the store
+                event = yield store.getEvent(evid, self._fields)
+                self.profile['getevents'] += 1
                 defaultfield, defaultvalue, fields = event
                 if defaultfield not in self.fields:
                     self.fields.append(defaultfield)
@@ -227,14 +301,13 @@ class SearcherWorker(object):
                 for fieldname in fields.keys():
                     if fieldname not in self.fields:
                         self.fields.append(fieldname)
-                # filter out unwanted fields
-                if self._fields != None:
-                    fields = dict([(k,v) for k,v in fields.items() if k in self._fields])
                 self.events.append(((evid.ts,evid.offset), defaultfield, defaultvalue, fields))
-                logger.trace("added event %s to results" % evid)
+                logger.trace("added event %s to results", evid)
         finally:
             for postingList in postingLists:
                 if postingList != None:
                     yield postingList.close()
-            for searcher in searchers:
+            for name,searcher in searchers:
+                self.profile['indices'][name]['segments'] = searcher.getProfile()
                 yield searcher.close()
+            self.runtime = time.time() - start
@@ -28,20 +28,24 @@ class WriterError(Exception):
 
 class WriterWorker(object):
     """
-    A worker which writes an event to the specified index.  Instances of this
-    class must be submitted to a :class:`terane.sched.Task` to be scheduled.
+    A worker which writes one or more events to the specified index.  Instances
+    of this class must be submitted to a :class:`terane.sched.Task` to be
+    scheduled.
     """
 
-    def __init__(self, event, index):
+    def __init__(self, events, index):
         """
-        :param event: The event to write.
-        :type event: :class:`terane.bier.event.Event`
-        :param index: The index which will receive the event.
+        :param events: The event or list of events to write.
+        :type events: :class:`terane.bier.event.Event` or list
+        :param index: The index which will receive the events.
         :type index: Object implementing :class:`terane.bier.interfaces.IIndex`
         """
-        if not isinstance(event, Event):
-            raise TypeError("event is not an Event")
-        self.event = event
+        if isinstance(events, Event):
+            events = [events]
+        for event in events:
+            if not isinstance(event, Event):
+                raise TypeError("event is not an Event")
+        self.events = events
         # verify that the index provides the appropriate interface
         if not IIndex.providedBy(index):
             raise TypeError("index does not implement IIndex")
@@ -52,24 +56,26 @@ class WriterWorker(object):
 
     def next(self):
         writer = None
-        evid = EVID.fromEvent(self.event)
         try:
-            # store the event
+            # all events in the batch are stored using the same writer
             writer = yield self.index.newWriter()
             if not IWriter.providedBy(writer):
                 raise TypeError("index writer does not implement IWriter")
-            fields = dict([(fn,v) for fn,ft,v in self.event])
-            logger.trace("[writer %s] creating event %s" % (self,evid))
-            yield writer.newEvent(evid, fields)
-            # process the value of each field in the event
-            for fieldname, fieldtype, value in self.event:
-                logger.trace("[writer %s] using field %s:%s" % (self,fieldname,fieldtype))
-                field = yield writer.getField(fieldname, fieldtype)
-                # store a posting for each term in each field
-                for term,meta in field.parseValue(value):
-                    logger.trace("[writer %s] creating posting %s:%s:%s" % (self,field,term,evid))
-                    yield writer.newPosting(field, term, evid, meta)
-            logger.debug("[writer %s] committed event %s" % (self,str(evid)))
+            for event in self.events:
+                # store the event
+                evid = EVID.fromEvent(event)
+                fields = dict([(fn,v) for fn,ft,v in event])
+                logger.trace("[writer %s] creating event %s", self,evid)
+                yield writer.newEvent(evid, fields)
+                # process the value of each field in the event
+                for fieldname, fieldtype, value in event:
+                    logger.trace("[writer %s] using field %s:%s", self,fieldname,fieldtype)
+                    field = yield writer.getField(fieldname, fieldtype)
+                    # store a posting for each term in each field
+                    for term,meta in field.parseValue(value):
+                        logger.trace("[writer %s] creating posting %s:%s:%s", self,field,term,evid)
+                        yield writer.newPosting(field, term, evid, meta)
+                logger.debug("[writer %s] committed event %s", self,evid)
         finally:
             if writer != None:
                 yield writer.close()
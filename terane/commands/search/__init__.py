@@ -52,6 +52,9 @@ def search_main():
         settings.addOption("t", "timezone", "search", "timezone",
             help="Convert timestamps to specified timezone", metavar="TZ"
             )
+        settings.addSwitch('', "profile", "search", "profile",
+            help="Display the query profile"
+            )
         settings.addOption('', "log-config", "search", "log config file",
             help="use logging configuration file FILE", metavar="FILE"
             )
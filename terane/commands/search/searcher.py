@@ -45,6 +45,7 @@ class Searcher(object):
             self.tz = dateutil.tz.gettz(self.tz)
         # get the list of fields to display
         self.fields = section.getList(str, "display fields", None)
+        self.profile = section.getBoolean("profile", False)
         # concatenate the command args into the query string
         self.query = ' '.join(settings.args())
         # configure server logging
@@ -58,7 +59,7 @@ class Searcher(object):
         proxy = Proxy("http://%s/XMLRPC" % self.host, user=self.username,
             password=self.password, allowNone=True)
         deferred = proxy.callRemote('iterEvents', self.query, None, self.indices,
-            self.limit, self.reverse, self.fields)
+            self.limit, self.reverse, self.fields, self.profile)
         deferred.addCallback(self.printResult)
         deferred.addErrback(self.printError)
         reactor.run()
@@ -81,6 +82,9 @@ class Searcher(object):
                         print "\t%s=%s" % (fieldname,value)
             print ""
             print "found %i matches in %f seconds." % (len(data), meta['runtime'])
+            if 'profile' in meta:
+                print ""
+                print pformat(meta['profile'])
         else:
             print "no matches found."
         reactor.stop()
@@ -138,6 +138,7 @@ class Server(MultiService):
         scheduler = Scheduler()
         provideUtility(scheduler, IScheduler)
         scheduler.setServiceParent(self)
+        scheduler.configure(self.settings)
         # configure the statistics manager
         stats.setServiceParent(self)
         stats.configure(self.settings)
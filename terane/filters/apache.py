@@ -15,11 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import re, time, dateutil.parser
+import re, time
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.filters import Filter, IFilter, FilterError
 from terane.bier.event import Contract, Assertion
+from terane.timestamps import parseCLFTimestamp
 from terane.loggers import getLogger
 
 logger = getLogger("terane.filters.apache")
@@ -61,7 +62,7 @@ class ApacheCommonFilter(Filter):
             raise FilterError("regex did not match 'date'")
         # parse the timestamp
         try:
-            event.ts = dateutil.parser.parse(date, dayfirst=True, fuzzy=True)
+            event.ts = parseCLFTimestamp(date)
         except Exception, e:
             raise FilterError("failed to parse date '%s': %s" % (date, e))
         # extract each field
@@ -108,7 +109,7 @@ class ApacheCombinedFilter(Filter):
         return self._contract
 
     def filter(self, event):
-        line = event[self._contract.message]
+        line = event[self._contract.field_message]
         m = self._regex.match(line)
         if m == None:
             raise FilterError("incoming line '%s' didn't match regex" % line)
@@ -117,7 +118,7 @@ class ApacheCombinedFilter(Filter):
             raise FilterError("regex did not match 'date'")
         # parse the timestamp
         try:
-            event.ts = dateutil.parser.parse(date, dayfirst=True, fuzzy=True)
+            event.ts = parseCLFTimestamp(date)
         except Exception, e:
             raise FilterError("failed to parse date '%s': %s" % (date, e))
         # extract each field
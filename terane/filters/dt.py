@@ -15,11 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import re, time, email.utils, datetime
+import re, time
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.filters import Filter, IFilter, FilterError, StopFiltering
 from terane.bier.event import Contract, Assertion
+from terane.timestamps import parseSyslogTimestamp, parseRFC2822Timestamp
 from terane.loggers import getLogger
 
 logger = getLogger("terane.filters.datetime")
@@ -47,8 +48,7 @@ class RFC2822DatetimeFilter(Filter):
 
     def filter(self, event):
         try:
-            ts = email.utils.parsedate_tz(event[self._assertion])
-            event.ts = datetime.datetime.fromtimestamp(time.mktime(ts))
+            event.ts = parseRFC2822Timestamp(event[self._assertion])
             return event
         except Exception, e:
             raise FilterError("failed to update ts: %s" %  e)
@@ -76,17 +76,7 @@ class SyslogDatetimeFilter(Filter):
 
     def filter(self, event):
         try:
-            date = event[self._assertion]
-            # if there is no leading zero in front of the day, then add it
-            if date[4] == ' ':
-                date = list(date)
-                date[4] = '0'
-                date = ''.join(date)
-            # append the year to the date string
-            date += ' %i' % time.localtime()[0]
-            # parse the date string into a struct_time
-            ts = time.strptime(date, "%b %d %H:%M:%S %Y")
-            event.ts = datetime.datetime.fromtimestamp(time.mktime(ts))
+            event.ts = parseSyslogTimestamp(event[self._assertion])
             return event
         except Exception, e:
             raise FilterError("failed to update ts: %s" %  e)
@@ -15,11 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import re, time, dateutil.parser
+import re, time
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.filters import Filter, IFilter, FilterError
 from terane.bier.event import Contract
+from terane.timestamps import parseMysqlTimestamp
 from terane.loggers import getLogger
 
 logger = getLogger("terane.filters.mysql")
@@ -32,7 +33,7 @@ class MysqlServerFilter(Filter):
     implements(IFilter)
 
     def configure(self, section):
-        self._regex = re.compile(r'(?P<date>\d{6})\w+(?P<time>\d\d:\d\d\:\d\d)\w+(?P<msg>.*)')
+        self._regex = re.compile(r'(?P<date>\d{6})\s+(?P<time>\d?\d:\d\d:\d\d)\s+(?P<msg>.*)')
         self._contract = Contract().sign()
 
     def getContract(self):
@@ -45,8 +46,7 @@ class MysqlServerFilter(Filter):
         if m != None:
             try:
                 # override the default timestamp
-                date = "%s %s" % m.group('date','time')
-                event.ts = datetime.datetime.strptime(date, '%y%m%d %%H:%M:%S')
+                event.ts = parseMysqlTimestamp("%s %s" % m.group('date','time'))
             except Exception, e:
                 raise FilterError("failed to parse timestamp: %s" % e)
             # put the rest of the line into the default field
@@ -15,48 +15,157 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import re
+import re, sre_parse, sre_constants
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.filters import Filter, IFilter, FilterError, StopFiltering
 from terane.bier.event import Contract
-
+from terane.settings import ConfigureError
 from terane.loggers import getLogger
 
 logger = getLogger("terane.filters.regex")
 
-class RegexFilter(Filter):
+def _findLiterals(subpattern):
+    """
+    Walk the parse tree of a regular expression, returning a list of the
+    literal strings which must appear in every string matching the pattern.
+    """
+    literals = []
+    current = []
+    for op,av in subpattern:
+        # a run of literal characters, ignoring anchors since they are zero-width
+        if op == sre_constants.LITERAL and av < 128:
+            current.append(unichr(av))
+            continue
+        if op == sre_constants.AT:
+            continue
+        if current:
+            literals.append(u''.join(current))
+            current = []
+        # the contents of a group are required
+        if op == sre_constants.SUBPATTERN:
+            literals.extend(_findLiterals(av[-1]))
+        # the contents of a repeat are required if it must match at least once
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] > 0:
+            literals.extend(_findLiterals(av[2]))
+    if current:
+        literals.append(u''.join(current))
+    return literals
 
-    implements(IFilter)
+def _requiredLiteral(regex):
+    """
+    Return the longest literal string which must appear in every string
+    matching the compiled regex, or None if there is no such literal.
+    """
+    if regex.flags & re.IGNORECASE:
+        return None
+    literals = _findLiterals(sre_parse.parse(regex.pattern, regex.flags))
+    if len(literals) == 0:
+        return None
+    return max(literals, key=len)
 
-    def configure(self, section):
-        self._infield = section.getString('regex field', '_raw')
-        regex = section.getString('regex pattern', None)
-        if regex == None:
-            raise ConfigureError("[filter:%s] missing required parameter 'regex pattern'" % self.name)
+class _RegexFilterBase(Filter):
+
+    def _compile(self, pattern):
         try:
-            self._regex = re.compile(regex)
+            return re.compile(pattern)
         except Exception, e:
-            raise ConfigureError("[filter:%s] failed to compile regex pattern '%s': %s" % (self.name,regex,str(e)))
-        self._outfields = self._regex.groupindex.keys()
+            raise ConfigureError("[filter:%s] failed to compile regex pattern '%s': %s" % (self.name,pattern,str(e)))
+
+    def _makeContract(self, section, regexes):
+        self._infield = section.getString('regex field', 'message')
+        self._contract = Contract()
+        fieldnames = set((u'message', u'hostname', u'input'))
+        try:
+            if not self._infield in fieldnames:
+                self._contract.addAssertion(unicode(self._infield), u'text', expects=True)
+                fieldnames.add(self._infield)
+            for regex in regexes:
+                for fieldname in regex.groupindex.keys():
+                    if not fieldname in fieldnames:
+                        self._contract.addAssertion(unicode(fieldname), u'text', guarantees=False)
+                        fieldnames.add(fieldname)
+        except TypeError, e:
+            raise ConfigureError("[filter:%s] invalid field name: %s" % (self.name, e))
+        self._assertion = getattr(self._contract, 'field_' + self._infield)
+        self._contract.sign()
+
+    def getContract(self):
+        return self._contract
+
+    def _update(self, event, m):
+        for fieldname,value in m.groupdict().iteritems():
+            if value != None:
+                event[getattr(self._contract, 'field_' + fieldname)] = value
+        return event
+
+class RegexFilter(_RegexFilterBase):
+    """
+    Match the value of the source field against a regular expression, storing
+    the value of each named group in the field of the same name.  Events which
+    don't match are dropped.
+    """
 
-    def infields(self):
-        # this filter requires the following incoming fields
-        return set((self._infield,))
+    implements(IFilter)
 
-    def outfields(self):
-        # this filter guarantees values for the following outgoing fields
-        return set(self._outfields)
+    def configure(self, section):
+        pattern = section.getString('regex pattern', None)
+        if pattern == None:
+            raise ConfigureError("[filter:%s] missing required parameter 'regex pattern'" % self.name)
+        self._regex = self._compile(pattern)
+        self._makeContract(section, [self._regex])
 
-    def filter(self, fields):
-        if not self._infield in fields:
+    def filter(self, event):
+        if not self._assertion in event:
             raise FilterError("input is missing '%s' field" % self._infield)
-        m = self.regex.match(fields[self._infield])
+        m = self._regex.match(event[self._assertion])
         if m == None:
-            raise StopFiltering("input '%s' didn't match regex" % fields[self._infield])
-        fields.update(m.groupdict())
-        return fields
+            raise StopFiltering()
+        return self._update(event, m)
+
+class MultiRegexFilter(_RegexFilterBase):
+    """
+    Match the value of the source field against a table of named regular
+    expressions, storing the named groups of the first pattern which matches.
+    The longest literal string required by each pattern is extracted when the
+    filter is configured, and a pattern is only tried if its literal appears
+    in the value, so most patterns are ruled out by a cheap substring search.
+    Events which don't match any pattern are dropped.
+    """
+
+    implements(IFilter)
+
+    def configure(self, section):
+        names = section.getList(str, 'regex patterns', None)
+        if names == None:
+            raise ConfigureError("[filter:%s] missing required parameter 'regex patterns'" % self.name)
+        self._patterns = []
+        for name in names:
+            pattern = section.getString('regex pattern %s' % name, None)
+            if pattern == None:
+                raise ConfigureError("[filter:%s] missing required parameter 'regex pattern %s'" % (self.name,name))
+            regex = self._compile(pattern)
+            literal = _requiredLiteral(regex)
+            if literal == None:
+                logger.debug("[filter:%s] pattern %s has no required literal" % (self.name,name))
+            self._patterns.append((name, regex, literal))
+        self._makeContract(section, [regex for name,regex,literal in self._patterns])
+
+    def filter(self, event):
+        if not self._assertion in event:
+            raise FilterError("input is missing '%s' field" % self._infield)
+        value = event[self._assertion]
+        for name,regex,literal in self._patterns:
+            if literal != None and not literal in value:
+                continue
+            m = regex.match(value)
+            if m != None:
+                return self._update(event, m)
+        raise StopFiltering()
 
 class RegexFilterPlugin(Plugin):
     implements(IPlugin)
-    components = [(RegexFilter, IFilter, 'regex')]
+    components = [
+        (RegexFilter, IFilter, 'regex'),
+        (MultiRegexFilter, IFilter, 'regex_multi'),
+        ]
@@ -15,11 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import re, time, dateutil.parser
+import re, time
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.filters import Filter, IFilter, FilterError
 from terane.bier.event import Contract
+from terane.timestamps import parseSyslogTimestamp
 from terane.loggers import getLogger
 
 logger = getLogger("terane.filters.syslog")
@@ -49,7 +50,7 @@ class SyslogFilter(Filter):
             raise FilterError("[filter:%s] line is not in syslog format" % self.name)
         # parse the timestamp
         try:
-            event.ts = dateutil.parser.parse(ts)
+            event.ts = parseSyslogTimestamp(ts)
         except Exception, e:
             raise FilterError("[filter:%s] failed to parse ts '%s': %s" % (self.name, ts, e))
         event[self._contract.field_hostname] = hostname
@@ -15,16 +15,20 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import os, sys
+import os, sys, time, datetime
+from dateutil.tz import tzutc
 from twisted.internet import reactor
-from twisted.spread.pb import PBServerFactory, IPerspective, Avatar
+from twisted.spread.pb import PBServerFactory, IPerspective, Avatar, Error
 from twisted.cred.portal import Portal, IRealm
 from twisted.cred.checkers import AllowAnonymousAccess
 from twisted.cred.error import Unauthorized
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, FirstError, gatherResults, succeed
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.inputs import Input, IInput
+from terane.signals import Signal
+from terane.bier.event import Contract, Assertion, EventBatch
+from terane.stats import getHistogram, getCounter
 from terane.loggers import getLogger
 
 logger = getLogger('terane.inputs.collect')
@@ -34,14 +38,100 @@ class Collector(Avatar):
     def __init__(self, avatarId, plugin):
         self._id = avatarId
         self._plugin = plugin
+        self._sources = set()
+
+    def logout(self):
+        # forget the acknowledgement state of every stream on this connection
+        for source in self._sources:
+            self._plugin._acked.pop(source, None)
+            self._plugin._committed.pop(source, None)
+            self._plugin._writes.pop(source, None)
+        self._sources = set()
 
     def perspective_collect(self, event):
-        try:
-            logger.debug("collected remote event from %s: %s" % (self._id,event))
-            for input in self._plugin._inputs:
-                input._write(event.copy())
-        except Exception, e:
-            logger.debug(str(e))
+        """
+        Forwarders which send single untyped events are no longer supported,
+        since the field types can't be recovered.  The event is rejected, and
+        the forwarder receives an error.
+        """
+        logger.warning("rejected event from legacy forwarder %s, the forwarder must be upgraded" % self._id)
+        raise Error("collecting single events is not supported, upgrade the forwarder to use collectBatch")
+
+    def perspective_collectBatch(self, source, records):
+        """
+        Receive a batch of spooled records from a forwarder.  Each record is
+        a (seq, record) tuple.  Records which have already been received are
+        ignored, and if there is a gap in the sequence numbers then the rest
+        of the batch is dropped so the forwarder will replay it.  The batch is
+        acknowledged once the outputs have stored the records, and after every
+        earlier batch from source was acknowledged.  If the records could not
+        be stored, then the forwarder receives an error, and the records are
+        accepted again when the forwarder replays them.
+
+        :param source: The unique identifier of the forwarder stream.
+        :type source: str
+        :param records: A list of (seq, record) tuples.
+        :type records: list
+        :returns: A Deferred which fires with the highest contiguous sequence
+          number stored from source.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        plugin = self._plugin
+        acked = plugin._acked.get(source, None)
+        self._sources.add(source)
+        accepted = []
+        for seq,record in records:
+            # ignore records we have already received
+            if acked != None and seq <= acked:
+                continue
+            # there is a gap, so stop and wait for the forwarder to replay
+            if acked != None and seq != acked + 1:
+                logger.debug("gap in batch from %s: expected %i, got %i" % (source, acked + 1, seq))
+                break
+            accepted.append(record)
+            acked = seq
+        if acked == None:
+            acked = 0
+        plugin._acked[source] = acked
+        writes = [input._write(accepted) for input in plugin._inputs]
+        # a batch is never acknowledged before an earlier batch which failed
+        previous = plugin._writes.get(source, None)
+        if previous != None:
+            writes.insert(0, previous)
+        written = Deferred()
+        plugin._writes[source] = written
+        d = gatherResults(writes, consumeErrors=True)
+        d.addCallbacks(self._batchWritten, self._batchFailed,
+            callbackArgs=(source, acked, written), errbackArgs=(source, written))
+        return d
+
+    def _batchWritten(self, result, source, acked, written):
+        plugin = self._plugin
+        if source in self._sources:
+            plugin._committed[source] = acked
+        if plugin._writes.get(source, None) is written:
+            del plugin._writes[source]
+        written.callback(None)
+        return acked
+
+    def _batchFailed(self, failure, source, written):
+        plugin = self._plugin
+        # accept the records again when the forwarder replays them
+        if source in self._sources:
+            committed = plugin._committed.get(source, None)
+            if committed != None:
+                plugin._acked[source] = committed
+            else:
+                plugin._acked.pop(source, None)
+        # fail the later batches which are waiting for this one
+        if plugin._writes.get(source, None) is written:
+            del plugin._writes[source]
+        else:
+            written.errback(failure)
+        if failure.check(FirstError):
+            failure = failure.value.subFailure
+        logger.debug("failed to store batch from %s: %s" % (source, failure.getErrorMessage()))
+        raise Error("failed to store batch: %s" % failure.getErrorMessage())
 
 class CollectorRealm:
     implements(IRealm)
@@ -52,18 +142,68 @@ class CollectorRealm:
     def requestAvatar(self, avatarId, mind, *interfaces):
         if IPerspective not in interfaces:
             raise Unauthorized()
-        return IPerspective, Collector(avatarId, self._plugin), lambda:None
+        avatar = Collector(avatarId, self._plugin)
+        return IPerspective, avatar, avatar.logout
         
 class CollectInput(Input):
 
     implements(IInput)
 
+    def __init__(self, plugin, name, eventfactory):
+        Input.__init__(self, plugin, name, eventfactory)
+        self.setName(name)
+        self._evfactory = eventfactory
+        self._dispatcher = Signal()
+        self._assertions = {}
+        self._contract = Contract().sign()
+        self._readtime = getHistogram('terane.input.read.seconds', input=name)
+        self._receivedevents = getCounter('terane.input.received.events', input=name)
+        plugin._inputs.append(self)
+
+    def getContract(self):
+        return self._contract
+
+    def getDispatcher(self):
+        return self._dispatcher
+
     def startService(self):
         Input.startService(self)
         logger.debug("[input:%s] started input" % self.name)
 
-    def _write(self, event):
-        self.on_received_event.signal(event)
+    def _getAssertion(self, fieldname, fieldtype):
+        try:
+            return self._assertions[(fieldname,fieldtype)]
+        except KeyError:
+            assertion = Assertion(fieldname, fieldtype)
+            self._assertions[(fieldname,fieldtype)] = assertion
+            return assertion
+
+    def _write(self, records):
+        """
+        Convert the records produced by
+        :func:`terane.outputs.forward.serializeEvent` into new events and
+        signal them as a single batch.  Returns a Deferred which fires once
+        the outputs have stored the events.
+        """
+        start = time.time()
+        events = EventBatch()
+        for record in records:
+            try:
+                ts,fields = record
+                event = self._evfactory.makeEvent()
+                event.ts = datetime.datetime.fromtimestamp(ts, tzutc())
+                for fieldname,fieldtype,value in fields:
+                    event[self._getAssertion(fieldname, fieldtype)] = value
+                events.append(event)
+            except Exception, e:
+                logger.debug("[input:%s] failed to collect record: %s" % (self.name, e))
+        self._readtime.since(start)
+        if len(events) == 0:
+            return succeed(None)
+        self._receivedevents += len(events)
+        events.trackWrites()
+        self._dispatcher.emitSignal(events)
+        return events.whenWritten()
 
     def stopService(self):
         Input.stopService(self)
@@ -75,8 +215,14 @@ class CollectInputPlugin(Plugin):
 
     components = [(CollectInput, IInput, 'collect')]
 
-    def configure(self, section):
+    def __init__(self):
+        Plugin.__init__(self)
         self._inputs = []
+        self._acked = {}
+        self._committed = {}
+        self._writes = {}
+
+    def configure(self, section):
         self._listener = None
         self._address = section.getString('collect address', '0.0.0.0')
         self._port = section.getInt('collect port', 8643)
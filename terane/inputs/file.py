@@ -6,28 +6,93 @@
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation, either version 3 of the License, or
 # (at your option) any later version.
-# 
+#
 # Terane is distributed in the hope that it will be useful,
 # but WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
-# 
+#
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import os, sys, socket
+import os, sys, time, socket, glob, fnmatch, zlib
 from twisted.internet import reactor
-from twisted.internet.defer import Deferred
+from twisted.internet.task import LoopingCall
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.inputs import Input, IInput
 from terane.signals import Signal
-from terane.bier.event import Contract, Assertion
+from terane.bier.event import Contract, Assertion, EventBatch
+from terane.settings import ConfigureError
+from terane.stats import getHistogram, getCounter
 from terane.loggers import getLogger
 
+try:
+    from twisted.internet import inotify
+    from twisted.python.filepath import FilePath
+except ImportError:
+    inotify = None
+
 logger = getLogger('terane.inputs.file')
 
+# the number of bytes at the start of a file which are checksummed, so we can
+# tell whether an inode in the checkpoint file has been reused.
+_CHECKSUM_LENGTH = 1024
+
+class _TailedFile(object):
+    """
+    The state of a single file being tailed by a FileInput.
+
+    :param path: The path the file was opened from.
+    :type path: str
+    :param f: The open file object.
+    :type f: file
+    :param position: The offset at which to start reading.
+    :type position: int
+    """
+
+    def __init__(self, path, f, position):
+        self.path = path
+        self.file = f
+        stats = os.fstat(f.fileno())
+        self.dev = stats.st_dev
+        self.ino = stats.st_ino
+        self.position = position
+        self.skipcount = 0
+        self.buffer = ''
+        self.closer = None
+        self.cklen = 0
+        self.crc = 0
+
+    def updateChecksum(self):
+        """
+        Checksum the first bytes of the file, if we haven't seen all of them yet.
+        """
+        if self.cklen < _CHECKSUM_LENGTH:
+            self.file.seek(0)
+            data = self.file.read(_CHECKSUM_LENGTH)
+            self.cklen = len(data)
+            self.crc = zlib.crc32(data) & 0xffffffff
+
+    def verifyChecksum(self, cklen, crc):
+        """
+        Returns True if the first cklen bytes of the file match the checksum.
+        """
+        self.file.seek(0)
+        data = self.file.read(cklen)
+        return len(data) == cklen and zlib.crc32(data) & 0xffffffff == crc
+
 class FileInput(Input):
+    """
+    Tail every file which matches one or more glob patterns.  On Linux,
+    inotify watches are placed on the directories containing the files, so
+    a file is only read when it has been modified.  If inotify is not
+    available, then every file is checked once per polling interval.
+
+    The read offset of each file is periodically saved to a checkpoint file,
+    so when the input is restarted it resumes reading where it left off,
+    even if a file was rotated in the meantime.
+    """
 
     implements(IInput)
 
@@ -36,22 +101,30 @@ class FileInput(Input):
         self.setName(name)
         self._evfactory = evfactory
         self._dispatcher = Signal()
+        self._notifier = None
+        self._watched = set()
+        self._files = {}
+        self._rotated = set()
+        self._changed = set()
         self._delayed = None
-        self._deferred = None
-        self._file = None
-        self._prevstats = None
-        self._position = None
-        self._skipcount = 0
-        self._errno = None
-        self._contract = Contract().sign() 
+        self._scanner = None
+        self._errors = {}
+        self._checkpoints = {}
+        self._checkpointer = None
+        self._lastcheckpoint = None
+        self._contract = Contract().sign()
+        self._readtime = getHistogram('terane.input.read.seconds', input=name)
+        self._receivedevents = getCounter('terane.input.received.events', input=name)
 
     def configure(self, section):
-        self._path = section.getString('file path', None)
-        if self._path == None:
-            raise Exception("[input:%s] missing required parameter 'file path'" % self.name)
-        logger.debug("[input:%s] path is %s" % (self.name,self._path))
+        self._patterns = section.getList(str, 'file path', None)
+        if self._patterns == None:
+            raise ConfigureError("[input:%s] missing required parameter 'file path'" % self.name)
+        self._patterns = [os.path.abspath(p) for p in self._patterns]
+        logger.debug("[input:%s] path is %s" % (self.name,', '.join(self._patterns)))
         self._interval = section.getInt('polling interval', 5)
         logger.debug("[input:%s] polling interval is %i seconds" % (self.name,self._interval))
+        self._useinotify = section.getBoolean('use inotify', True)
         self._linemax = section.getInt('maximum line length', 1024 * 1024)
         logger.debug("[input:%s] maximum line length is %i bytes" % (self.name,self._linemax))
         self._loopchunk = section.getInt('loop chunk length', 1024 * 1024)
@@ -60,6 +133,12 @@ class FileInput(Input):
         if self._loopchunk < self._linemax:
             self._loopchunk = self._linemax
         logger.debug("[input:%s] loop chunk length is %i bytes" % (self.name,self._loopchunk))
+        self._checkpointfile = section.getPath('checkpoint file',
+            os.path.join('/var/lib/terane/checkpoint', self.name))
+        logger.debug("[input:%s] checkpoint file is %s" % (self.name,self._checkpointfile))
+        self._checkpointinterval = section.getFloat('checkpoint interval', 1.0)
+        if self._checkpointinterval <= 0:
+            raise ConfigureError("[input:%s] checkpoint interval must be greater than 0" % self.name)
 
     def getContract(self):
         return self._contract
@@ -69,203 +148,454 @@ class FileInput(Input):
 
     def startService(self):
         Input.startService(self)
-        self._check()
-        self._schedule(False)
+        self._hostname = socket.gethostname()
+        if self._useinotify and inotify != None:
+            try:
+                self._notifier = inotify.INotify()
+                self._notifier.startReading()
+                logger.debug("[input:%s] using inotify to watch for changes" % self.name)
+            except Exception, e:
+                logger.info("[input:%s] inotify is not available, falling back to polling: %s" %
+                    (self.name, e))
+                self._notifier = None
+        # if there is no checkpoint, then this input has never run before, so
+        # files which exist when the input starts are read from the end.
+        # otherwise, files which aren't in the checkpoint were created while
+        # the input was stopped, and are read from the beginning.
+        hascheckpoint = self._loadCheckpoints()
+        self._scan(not hascheckpoint)
+        self._resumeRotated()
+        self._checkpointer = LoopingCall(self._checkpoint)
+        self._checkpointer.start(self._checkpointinterval, False)
+        if self._notifier == None:
+            self._scanner = LoopingCall(self._poll)
+        else:
+            self._scanner = LoopingCall(self._scan, False)
+        self._scanner.start(self._interval, False)
         logger.debug("[input:%s] started input" % self.name)
 
-    def _schedule(self, value):
+    def _scan(self, initial):
         """
-        Schedule the next check of self._path for new data.  If value is True,
-        then schedule the next loop immediately, otherwise, pause for one loop
-        interval.
+        Expand each glob pattern, start watching the directories which contain
+        matching files, and open any matching files which are not being tailed.
 
-        :param value: A boolean indicating whether or not to loop immediately.
-        :type value: bool
+        :param initial: True if this is the first scan after the input started.
+        :type initial: bool
         """
-        if self._delayed and self._delayed.active():
-            raise Exception("[input:%s] attempted to reschedule twice" % self.name)
-        self._deferred = Deferred()
-        self._deferred.addCallback(self._tail)
-        self._deferred.addCallbacks(self._schedule, self._tailError)
-        self._deferred.addErrback(self._scheduleError)
-        if value == True:
-            self._delayed = reactor.callLater(0.00000001, self._deferred.callback, None)
-        else:
-            self._delayed = reactor.callLater(self._interval, self._deferred.callback, None)
-        logger.trace("[input:%s] rescheduled tail" % self.name)
+        for pattern in self._patterns:
+            if self._notifier != None:
+                dirpattern = os.path.dirname(pattern)
+                if glob.has_magic(dirpattern):
+                    dirpaths = glob.glob(dirpattern)
+                else:
+                    dirpaths = [dirpattern]
+                for dirpath in dirpaths:
+                    self._watch(dirpath)
+            for path in glob.glob(pattern):
+                if not path in self._files and os.path.isfile(path):
+                    self._openFile(path, initial)
 
-    def _tailError(self, failure):
-        logger.debug("[input:%s] error tailing file: %s" % (self.name,str(failure)))
-        self._schedule(False)
-        return failure
+    def _watch(self, dirpath):
+        if dirpath in self._watched:
+            return
+        mask = (inotify.IN_MODIFY | inotify.IN_CREATE | inotify.IN_MOVED_TO |
+            inotify.IN_MOVED_FROM | inotify.IN_DELETE | inotify.IN_MOVE_SELF)
+        try:
+            self._notifier.watch(FilePath(dirpath), mask, callbacks=[self._notify])
+            self._watched.add(dirpath)
+            logger.debug("[input:%s] watching directory %s" % (self.name,dirpath))
+        except Exception, e:
+            self._logError(dirpath, "failed to watch directory %s: %s" % (dirpath, e))
 
-    def _scheduleError(self, failure):
-        logger.debug("[input:%s] error scheduling tail: %s" % (self.name,str(failure)))
-        return failure
+    def _matches(self, path):
+        for pattern in self._patterns:
+            if fnmatch.fnmatchcase(path, pattern):
+                return True
+        return False
 
-    def _check(self):
+    def _notify(self, ignored, filepath, mask):
+        """
+        Called by the INotify instance when a watched directory or one of its
+        children changes.
         """
-        Return file statistics about self._path.  If there was an error, None is
-        returned and self._errno is set.
+        path = filepath.path
+        if mask & inotify.IN_Q_OVERFLOW:
+            logger.info("[input:%s] inotify queue overflowed, checking all files" % self.name)
+            self._poll()
+            return
+        # the watched directory itself went away
+        if mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF | inotify.IN_IGNORED):
+            if path in self._watched:
+                self._watched.discard(path)
+                if mask & inotify.IN_MOVE_SELF:
+                    try:
+                        self._notifier.ignore(filepath)
+                    except KeyError:
+                        pass
+                logger.debug("[input:%s] stopped watching directory %s" % (self.name,path))
+            return
+        # the file was moved or deleted, or another file was moved over it
+        if mask & (inotify.IN_MOVED_FROM | inotify.IN_DELETE | inotify.IN_MOVED_TO | inotify.IN_CREATE):
+            if path in self._files:
+                self._rotateFile(self._files[path])
+            if mask & (inotify.IN_MOVED_TO | inotify.IN_CREATE) and self._matches(path):
+                if os.path.isfile(path):
+                    self._openFile(path, False)
+            return
+        if mask & inotify.IN_MODIFY and path in self._files:
+            self._markChanged(self._files[path])
 
-        :returns: A tuple with the file statistics, or None if there was an error.
-        :rtype: tuple or None
+    def _poll(self):
         """
-        try:
-            logger.trace("[input:%s] checking for file modification" % self.name)
-            # open the file if necessary
-            if self._file == None:
-                self._file = open(self._path, 'r')
-                currstats = os.stat(self._path)
-                # if this is the first file open, then start reading from
-                # the end of the file
-                if self._prevstats == None:
-                    self._position = currstats.st_size
-                # otherwise start reading from the beginning of the file
-                else:
-                    self._position = 0
-                self._skipcount = 0
-                self._prevstats = currstats
-            # get the current file stats
-            else:
-                currstats = os.stat(self._path)
-            return currstats
-        except (IOError,OSError), (errno, errstr):
-            if errno != self._errno:
-                logger.warning("[input:%s] failed to tail file: %s" % (self.name,errstr))
-                self._errno = errno
-            return None
-
-    def _tail(self, unused):
+        Check every file for modification, and detect rotation by comparing
+        the inode of the open file with the inode at the file path.  This is
+        only used if inotify is not available.
         """
+        self._scan(False)
+        for tailed in self._files.values():
+            try:
+                stats = os.stat(tailed.path)
+            except (IOError,OSError), e:
+                stats = None
+            if stats == None or stats.st_dev != tailed.dev or stats.st_ino != tailed.ino:
+                self._rotateFile(tailed)
+                if stats != None and self._matches(tailed.path):
+                    self._openFile(tailed.path, False)
+            elif stats.st_size != tailed.position + len(tailed.buffer):
+                self._markChanged(tailed)
 
-        :param unused: This parameter is not used for anything, but Twisted
-          requires a parameter to be passed to a callback.
-        :type: object
-        :returns: True if _tail() should be called again immediately, otherwise
-          False to indicate we should pause for one loop interval.
+    def _logError(self, path, message):
+        if self._errors.get(path) != message:
+            logger.warning("[input:%s] %s" % (self.name,message))
+            self._errors[path] = message
+
+    def _loadCheckpoints(self):
+        """
+        Load the saved offsets from the checkpoint file.
+
+        :returns: True if the checkpoint file exists, otherwise False.
         :rtype: bool
         """
-        # get the current file statistics
-        _currstats = self._check()
-        if _currstats == None:
+        self._checkpoints = {}
+        try:
+            f = open(self._checkpointfile, 'r')
+        except (IOError,OSError), e:
             return False
+        with f:
+            for line in f:
+                try:
+                    dev,ino,offset,cklen,crc,path = line.rstrip('\n').split(' ', 5)
+                    self._checkpoints[(int(dev, 16), int(ino, 16))] = (
+                        int(offset, 16), int(cklen, 16), int(crc, 16), path)
+                except ValueError:
+                    logger.warning("[input:%s] ignoring invalid checkpoint: %s" %
+                        (self.name, line.strip()))
+        logger.debug("[input:%s] loaded %i checkpoints from %s" %
+            (self.name, len(self._checkpoints), self._checkpointfile))
+        return True
+
+    def _resumeRotated(self):
+        """
+        Look for checkpointed files which were renamed while the input was
+        stopped, and read whatever was written to them after the checkpoint.
+        Only the directory each file was originally in is searched.
+        """
+        checkpoints = self._checkpoints
+        self._checkpoints = {}
+        dirs = {}
+        for (dev,ino),(offset,cklen,crc,prevpath) in checkpoints.items():
+            dirpath = os.path.dirname(prevpath)
+            if not dirpath in dirs:
+                inodes = {}
+                try:
+                    for name in os.listdir(dirpath):
+                        path = os.path.join(dirpath, name)
+                        try:
+                            stats = os.stat(path)
+                            inodes[(stats.st_dev, stats.st_ino)] = path
+                        except (IOError,OSError), e:
+                            pass
+                except (IOError,OSError), e:
+                    pass
+                dirs[dirpath] = inodes
+            path = dirs[dirpath].get((dev, ino))
+            if path == None:
+                logger.info("[input:%s] checkpointed file %s no longer exists" %
+                    (self.name, prevpath))
+                continue
+            try:
+                tailed = _TailedFile(path, open(path, 'r'), offset)
+            except (IOError,OSError), e:
+                self._logError(path, "failed to tail file %s: %s" % (path, e.strerror))
+                continue
+            if not tailed.verifyChecksum(cklen, crc):
+                tailed.file.close()
+                continue
+            logger.info("[input:%s] %s was rotated to %s, reading from offset %i" %
+                (self.name, prevpath, path, offset))
+            self._rotated.add(tailed)
+            tailed.closer = reactor.callLater(0, self._closeFile, tailed)
+
+    def _checkpoint(self):
+        """
+        Save the current offset of every open file to the checkpoint file.
+        The file is only rewritten if an offset has changed since the last
+        checkpoint.
+        """
+        lines = []
+        for tailed in self._files.values() + list(self._rotated):
+            try:
+                tailed.updateChecksum()
+            except (IOError,OSError), e:
+                continue
+            lines.append("%x %x %x %x %08x %s\n" % (tailed.dev, tailed.ino,
+                tailed.position, tailed.cklen, tailed.crc, tailed.path))
+        data = ''.join(sorted(lines))
+        if data == self._lastcheckpoint:
+            return
+        try:
+            dirpath = os.path.dirname(self._checkpointfile)
+            if not os.path.exists(dirpath):
+                os.makedirs(dirpath)
+            tmppath = self._checkpointfile + '.tmp'
+            with open(tmppath, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmppath, self._checkpointfile)
+            self._lastcheckpoint = data
+            self._errors.pop(self._checkpointfile, None)
+        except (IOError,OSError), e:
+            self._logError(self._checkpointfile, "failed to write checkpoint file %s: %s" %
+                (self._checkpointfile, e))
 
-        # check if the file inode and/or underlying block device changed
-        f = self._file
+    def _openFile(self, path, atEnd):
+        """
+        Start tailing the file at path.
+
+        :param path: The path of the file to tail.
+        :type path: str
+        :param atEnd: If True, then start reading at the end of the file,
+          otherwise start reading at the beginning.
+        :type atEnd: bool
+        """
         try:
-            if self._prevstats.st_dev != _currstats.st_dev:
-                raise Exception("[input:%s] vfs device changed" % self.name)
-            if self._prevstats.st_ino != _currstats.st_ino:
-                raise Exception("[input:%s] vfs inode changed" % self.name)
-        except Exception, e:
-            logger.info(str(e))
-            _currstats = os.fstat(self._file.fileno())
-            self._file = None
-            
+            f = open(path, 'r')
+            stats = os.fstat(f.fileno())
+        except (IOError,OSError), e:
+            self._logError(path, "failed to tail file %s: %s" % (path, e.strerror))
+            return
+        self._errors.pop(path, None)
+        checkpoint = self._checkpoints.pop((stats.st_dev, stats.st_ino), None)
+        # if a rotated file was renamed to a path which also matches, then
+        # keep tailing it from where we left off instead of reading it again.
+        for tailed in list(self._rotated) + self._files.values():
+            if tailed.dev == stats.st_dev and tailed.ino == stats.st_ino:
+                f.close()
+                if tailed in self._rotated:
+                    self._rotated.discard(tailed)
+                    tailed.closer.cancel()
+                    tailed.closer = None
+                    tailed.path = path
+                    self._files[path] = tailed
+                    logger.debug("[input:%s] tailing %s from offset %i" %
+                        (self.name,path,tailed.position))
+                    self._markChanged(tailed)
+                return
+        if atEnd:
+            position = stats.st_size
+        else:
+            position = 0
+        tailed = _TailedFile(path, f, position)
+        if checkpoint != None:
+            offset,cklen,crc,prevpath = checkpoint
+            if tailed.verifyChecksum(cklen, crc):
+                tailed.position = min(offset, stats.st_size)
+                if tailed.position < stats.st_size:
+                    self._markChanged(tailed)
+            else:
+                logger.info("[input:%s] %s doesn't match its checkpoint, reading from offset %i" %
+                    (self.name,path,tailed.position))
+        self._files[path] = tailed
+        logger.debug("[input:%s] tailing %s from offset %i" % (self.name,path,position))
+        if position == 0:
+            self._markChanged(tailed)
+
+    def _rotateFile(self, tailed):
+        """
+        The file is no longer at its path.  Read any data already written to it,
+        then give the writer one polling interval to finish writing before
+        reading the remainder and closing it.
+        """
+        del self._files[tailed.path]
+        self._changed.discard(tailed)
+        logger.info("[input:%s] file %s was rotated" % (self.name,tailed.path))
+        self._readFile(tailed, False)
+        self._rotated.add(tailed)
+        tailed.closer = reactor.callLater(self._interval, self._closeFile, tailed)
+
+    def _closeFile(self, tailed):
+        self._rotated.discard(tailed)
+        while self._readFile(tailed, True):
+            pass
+        tailed.file.close()
+        logger.debug("[input:%s] closed rotated file %s" % (self.name,tailed.path))
+
+    def _markChanged(self, tailed):
+        """
+        Schedule the file to be read on the next reactor iteration.
+        """
+        self._changed.add(tailed)
+        if self._delayed == None:
+            self._delayed = reactor.callLater(0, self._readChanged)
+
+    def _readChanged(self):
+        self._delayed = None
+        changed = self._changed
+        self._changed = set()
+        for tailed in changed:
+            try:
+                # if there is more data than fits in a loop chunk, then read
+                # the remainder on the next pass.
+                if self._readFile(tailed, False):
+                    self._markChanged(tailed)
+            except (IOError,OSError), e:
+                self._logError(tailed.path, "error tailing file %s: %s" % (tailed.path, e))
+
+    def _readFile(self, tailed, final):
+        """
+        Read a block of data from the file, starting at the end of the last
+        block read, and split it into lines.
+
+        :param tailed: The file to read from.
+        :type tailed: :class:`terane.inputs.file._TailedFile`
+        :param final: True if this is the last time the file will be read.
+        :type final: bool
+        :returns: True if there is more data to read than was read in this
+          pass, otherwise False.
+        :rtype: bool
+        """
+        start = time.time()
+        f = tailed.file
+        size = os.fstat(f.fileno()).st_size
+        # the offset of the first byte after the incomplete line
+        offset = tailed.position + len(tailed.buffer)
+
         # check if the file has shrunk
-        if self._position > _currstats.st_size:
-            logger.info("[input:%s] file shrank by %i bytes" %
-                (self.name, self._position - _currstats.st_size))
+        if offset > size:
+            logger.info("[input:%s] file %s shrank by %i bytes" %
+                (self.name, tailed.path, offset - size))
             # reset position to the new end of the file
-            self._position = _currstats.st_size
+            tailed.position = size
+            tailed.buffer = ''
+            tailed.skipcount = 0
             return False
 
-        # calculate the total bytes available to read
-        toread = _currstats.st_size - self._position
         # calculate the bytes we will read this loop iteration
+        toread = size - offset
         if toread > self._loopchunk:
             toread = self._loopchunk
             loopimmediately = True
         else:
             loopimmediately = False
-        # seek to the next byte to read
-        f.seek(self._position)
-        # loop reading lines until EOF or incomplete line
-        while True:
-        
-            # save the current position as the start of a new line
-            self._position = f.tell()
-            # if we have no more bytes to read, then break from the loop
-            if toread == 0:
-                break
-
-            # calculate the amount of bytes to read for this line
-            if toread > self._linemax:
-                bufsize = self._linemax
-            else:
-                bufsize = toread
-            line = f.readline(bufsize)
-            toread -= len(line)
-
-            # check if the line is incomplete (not newline-terminated).
-            # this could occur for three reasons:
-            #
-            # 1. we have reached the end of the file, and the last line did
-            #    not end with a newline.  if we switched to reading from a new
-            #    file (e.g. the file was rotated), and we are not currently in
-            #    ignore mode (_skipcount is greater than 0) due to a long line,
-            #    then we consider this data a full event and write it.  if we
-            #    are still in ignore mode, then the data is dropped.  when we
-            #    open the new file on the next iteration of _tail(), _skipcount
-            #    is reset to 0.
-            # 2. the line exceeds the maximum acceptable length for an event.
-            #    we enable ignore mode (if its not already enabled) by adding
-            #    the length of the line to _skipcount.  data will thus be dropped
-            #    until we reach the next newline.
-            # 3. we have reached the end of the file, and the last line did
-            #    not end with a newline.  if we are still reading from this
-            #    file (self._file is not None), then we return to the top of the
-            #    loop without writing data.
-            if not line.endswith('\n'):
-                # case 1: we switched to reading from a new file
-                if self._file == None and self._skipcount == 0:
-                    self._write(line)
-                # case 2: line exceeds _linemax, drop data until the next newline
-                elif len(line) == self._linemax:
-                    self._skipcount += len(line)
-                # case 3: event has not been completely written to disk yet
-                else:
-                    continue
-            # if the line is newline-terminated
+        if toread > 0:
+            f.seek(offset)
+            data = f.read(toread)
+        else:
+            data = ''
+        if data == '' and not final:
+            return loopimmediately
+
+        # split the block into lines.  the last element is the incomplete line
+        # at the end of the block, or an empty string if the block ends with
+        # a newline.
+        lines = (tailed.buffer + data).split('\n')
+        partial = lines.pop()
+        position = tailed.position
+        complete = []
+        for line in lines:
+            position += len(line) + 1
+            # if we were ignoring a long line, then this is the end of it
+            if tailed.skipcount > 0:
+                logger.debug("[input:%s] dropped long line (%i bytes)" %
+                    (self.name, tailed.skipcount + len(line)))
+                tailed.skipcount = 0
+            elif len(line) >= self._linemax:
+                logger.debug("[input:%s] dropped long line (%i bytes)" %
+                    (self.name, len(line)))
             else:
-                # if we weren't ignoring the current line, then write it
-                if self._skipcount == 0:
-                    self._write(line)
-                else:
-                    self._skipcount += len(line)
-                    logger.debug("[input:%s] dropped long line (%i bytes)" %
-                        (self.name,self._skipcount))
-                    # we found the start of the new event, so stop ignoring data
-                    self._skipcount = 0
-
-        # save the old file stats
-        self._prevstats = _currstats
+                complete.append(line)
+
+        # handle the incomplete line at the end of the block:
+        #
+        # 1. if we are ignoring a long line, or the incomplete line exceeds
+        #    the maximum acceptable length for an event, then we drop data
+        #    (by adding its length to skipcount) until we reach the next
+        #    newline.
+        # 2. if this is the final read of a rotated file, then we consider
+        #    the data a full event and write it.
+        # 3. otherwise the event has not been completely written to disk yet,
+        #    so we keep it in the buffer and wait for the rest of the line.
+        if tailed.skipcount > 0 or len(partial) >= self._linemax:
+            tailed.skipcount += len(partial)
+            position += len(partial)
+            partial = ''
+        elif final and partial != '':
+            complete.append(partial)
+            position += len(partial)
+            partial = ''
+        tailed.position = position
+        tailed.buffer = partial
+
+        if len(complete) > 0:
+            self._write(complete, start)
         return loopimmediately
 
-    def _write(self, line):
-        # ignore lines consisting entirely of whitespace
-        line = line.strip()
-        if line.isspace():
-            return
-        logger.trace("[input:%s] received line: %s" % (self.name,line))
-        event = self._evfactory.makeEvent()
-        event[self._contract.field_message] = line
-        event[self._contract.field_hostname] = socket.gethostname()
-        event[self._contract.field_input] = self.name
-        self._dispatcher.emitSignal(event)
+    def _write(self, lines, start):
+        logger.trace("[input:%s] received %i lines", self.name,len(lines))
+        contract = self._contract
+        events = EventBatch()
+        for line in lines:
+            # ignore lines consisting entirely of whitespace
+            line = line.strip()
+            if line == '':
+                continue
+            event = self._evfactory.makeEvent()
+            event[contract.field_message] = line
+            event[contract.field_hostname] = self._hostname
+            event[contract.field_input] = self.name
+            events.append(event)
+        self._readtime.since(start)
+        if len(events) > 0:
+            self._receivedevents += len(events)
+            self._dispatcher.emitSignal(events)
 
     def stopService(self):
         if not self.running:
             return
-        if self._delayed and self._delayed.active():
+        if self._checkpointer != None and self._checkpointer.running:
+            self._checkpointer.stop()
+        self._checkpointer = None
+        self._checkpoint()
+        if self._scanner != None and self._scanner.running:
+            self._scanner.stop()
+        self._scanner = None
+        if self._delayed != None and self._delayed.active():
             self._delayed.cancel()
-        if self._file:
-            self._file.close()
-        self._file = None
-        self._prevstats = None
-        self._position = None
-        self._deferred = None
+        self._delayed = None
+        if self._notifier != None:
+            self._notifier.loseConnection()
+        self._notifier = None
+        self._watched = set()
+        for tailed in self._rotated:
+            if tailed.closer.active():
+                tailed.closer.cancel()
+            tailed.file.close()
+        self._rotated = set()
+        for tailed in self._files.values():
+            tailed.file.close()
+        self._files = {}
+        self._changed = set()
         Input.stopService(self)
         logger.debug("[input:%s] stopped input" % self.name)
 
@@ -15,31 +15,222 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import os, sys, time, re
-from twisted.internet import reactor
-from twisted.internet.protocol import DatagramProtocol
-from twisted.internet.defer import Deferred
+import os, sys, time, re, socket, errno
+from twisted.internet import reactor, udp
+from twisted.internet.protocol import DatagramProtocol, Protocol, ServerFactory
+from twisted.internet.task import LoopingCall
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.inputs import Input, IInput
+from terane.filters import FilterError, StopFiltering
 from terane.signals import Signal
-from terane.bier.event import Contract
+from terane.bier.event import Contract, Assertion, EventBatch
+from terane.stats import getStat, getVolatileStat, getHistogram, getCounter
+from terane.timestamps import parseSyslogTimestamp, parseRFC3339Timestamp
+from terane.settings import ConfigureError
 from terane.loggers import getLogger
 
+try:
+    from terane.inputs.udp import recvmmsg
+except ImportError:
+    recvmmsg = None
+
 logger = getLogger('terane.inputs.syslog')
 
+class SyslogUDPPort(udp.Port):
+    """
+    A UDP port which reads every datagram waiting in the socket receive buffer
+    (up to maxDatagrams) each time the socket becomes readable, and passes
+    them to the protocol in a single call to datagramsReceived().  If the
+    terane.inputs.udp extension is available, then datagrams are read using
+    recvmmsg(), otherwise recvfrom() is called once per datagram.
+
+    :param port: The port to listen on.
+    :type port: int
+    :param proto: The protocol which receives the datagrams.
+    :type proto: :class:`terane.inputs.syslog.SyslogUDPReceiver`
+    :param interface: The address to bind to.
+    :type interface: str
+    :param maxPacketSize: The maximum size of a datagram, in bytes.
+    :type maxPacketSize: int
+    :param maxDatagrams: The maximum number of datagrams to read per wakeup.
+    :type maxDatagrams: int
+    :param rcvbuf: The requested size of the socket receive buffer, in bytes.
+    :type rcvbuf: int
+    """
+
+    def __init__(self, port, proto, interface, maxPacketSize, maxDatagrams, rcvbuf):
+        udp.Port.__init__(self, port, proto, interface, maxPacketSize, reactor)
+        self.maxDatagrams = maxDatagrams
+        self.rcvbuf = rcvbuf
+
+    def _bindSocket(self):
+        udp.Port._bindSocket(self)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        except socket.error, e:
+            logger.warning("failed to set udp receive buffer size: %s" % e)
+        # linux doubles the requested size to allow for bookkeeping overhead,
+        # and silently caps it at net.core.rmem_max
+        actual = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if actual < self.rcvbuf:
+            logger.warning("udp receive buffer is %i bytes, less than the requested %i bytes; "
+                "consider raising net.core.rmem_max" % (actual, self.rcvbuf))
+        else:
+            logger.debug("udp receive buffer is %i bytes" % actual)
+
+    def doRead(self):
+        datagrams = []
+        fd = self.socket.fileno()
+        while len(datagrams) < self.maxDatagrams:
+            if recvmmsg != None:
+                try:
+                    received = recvmmsg(fd, min(self.maxDatagrams - len(datagrams), 64),
+                        self.maxPacketSize)
+                except OSError, e:
+                    logger.debug("failed to receive datagrams: %s" % e)
+                    break
+            else:
+                try:
+                    received = [self.socket.recvfrom(self.maxPacketSize)]
+                except socket.error, e:
+                    if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        logger.debug("failed to receive datagram: %s" % e)
+                    break
+            if len(received) == 0:
+                break
+            datagrams.extend(received)
+        if len(datagrams) > 0:
+            try:
+                self.protocol.datagramsReceived(datagrams)
+            except Exception, e:
+                logger.exception(e)
+
+    def kernelDrops(self):
+        """
+        Returns the number of datagrams the kernel has dropped for this socket
+        because the receive buffer was full, or None if it is not known.
+        """
+        try:
+            inode = os.fstat(self.socket.fileno()).st_ino
+            for path in ('/proc/net/udp', '/proc/net/udp6'):
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'r') as f:
+                    f.readline()
+                    for line in f:
+                        fields = line.split()
+                        # the inode is the 10th column and drops is the last
+                        if len(fields) >= 13 and int(fields[9]) == inode:
+                            return int(fields[-1])
+        except (IOError,OSError,ValueError), e:
+            pass
+        return None
+
 class SyslogUDPReceiver(DatagramProtocol):
     
     def __init__(self, plugin):
         self._plugin = plugin
 
-    def datagramReceived(self, data, (host,port)):
-        try:
-            logger.trace("received msg from %s:%i: %s" % (host,port,data))
-            for input in self._plugin._inputs:
-                input._process(host, port, data)
-        except Exception, e:
-            logger.debug(str(e))
+    def datagramReceived(self, data, addr):
+        self.datagramsReceived([(data, addr)])
+
+    def datagramsReceived(self, datagrams):
+        logger.trace("received %i datagrams", len(datagrams))
+        self._plugin.receiveddatagrams += len(datagrams)
+        for input in self._plugin._inputs:
+            input._processBatch(datagrams)
+
+class SyslogTCPReceiver(Protocol):
+    """
+    Receives syslog messages over a TCP connection.  Messages may be framed
+    using either octet counting or non-transparent (newline-terminated)
+    framing, as described in RFC6587.  Every message which is completed by
+    a single read is passed to the syslog inputs as one batch.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._addr = None
+
+    def connectionMade(self):
+        factory = self.factory
+        if factory.connections >= factory.maxconnections:
+            logger.warning("[%s] refusing tcp syslog connection, too many connections" %
+                factory.plugin.name)
+            self.transport.loseConnection()
+            return
+        factory.connections += 1
+        factory.plugin.tcpconnections <<= factory.connections
+        peer = self.transport.getPeer()
+        self._addr = (peer.host, peer.port)
+        logger.trace("accepted tcp syslog connection from %s:%i", *self._addr)
+
+    def connectionLost(self, reason):
+        if self._addr != None:
+            self.factory.connections -= 1
+            self.factory.plugin.tcpconnections <<= self.factory.connections
+            self._addr = None
+        self._buffer = ''
+
+    def _protocolError(self, message):
+        logger.debug("closing tcp syslog connection from %s:%i: %s" %
+            (self._addr[0], self._addr[1], message))
+        self._buffer = ''
+        self.transport.loseConnection()
+
+    def dataReceived(self, data):
+        if self._addr == None:
+            return
+        maxsize = self.factory.maxsize
+        buffer = self._buffer + data
+        offset = 0
+        messages = []
+        while offset < len(buffer):
+            # octet counting: MSG-LEN SP SYSLOG-MSG
+            if buffer[offset].isdigit():
+                sp = buffer.find(' ', offset, offset + 11)
+                if sp < 0:
+                    if len(buffer) - offset > 10:
+                        return self._protocolError("invalid message length")
+                    break
+                length = buffer[offset:sp]
+                if not length.isdigit():
+                    return self._protocolError("invalid message length")
+                length = int(length)
+                if length > maxsize:
+                    return self._protocolError("message length %i is too long" % length)
+                if len(buffer) < sp + 1 + length:
+                    break
+                messages.append(buffer[sp + 1:sp + 1 + length])
+                offset = sp + 1 + length
+            # non-transparent framing: SYSLOG-MSG LF
+            else:
+                nl = buffer.find('\n', offset)
+                if nl < 0:
+                    if len(buffer) - offset > maxsize:
+                        return self._protocolError("message is too long")
+                    break
+                line = buffer[offset:nl]
+                if line.strip('\r\0') != '':
+                    messages.append(line)
+                offset = nl + 1
+        self._buffer = buffer[offset:]
+        if len(messages) > 0:
+            self.factory.plugin.receivedmessages += len(messages)
+            batch = [(message, self._addr) for message in messages]
+            for input in self.factory.plugin._inputs:
+                input._processBatch(batch)
+
+class SyslogTCPFactory(ServerFactory):
+
+    protocol = SyslogTCPReceiver
+
+    def __init__(self, plugin, maxsize, maxconnections):
+        self.plugin = plugin
+        self.maxsize = maxsize
+        self.maxconnections = maxconnections
+        self.connections = 0
 
 class SyslogInput(Input):
 
@@ -47,27 +238,38 @@ class SyslogInput(Input):
 
     def __init__(self, plugin, name, eventfactory):
         Input.__init__(self, plugin, name, eventfactory)
+        self.setName(name)
+        self._evfactory = eventfactory
         self._linematcher = re.compile(r'(?P<ts>[A-Za-z]{3} [ \d]\d \d\d:\d\d\:\d\d) (?P<hostname>\S*) (?P<msg>.*)')
         self._PRImatcher = re.compile(r'<(?P<pri>[0-9]{1,3})>')
         self._TIMESTAMPmatcher = re.compile(r'(?P<timestamp>[A-Za-z]{3} [ \d]\d \d\d:\d\d\:\d\d )')
         self._TAGmatcher = re.compile(r'^(\S+)\[(\d+)\]:$|^(\S+):$')
+        # SD-NAME is 1 to 32 printable US-ASCII characters except '=', ']' and '"'
+        self._SDNAMEmatcher = re.compile(r'^[\x21\x23-\x3c\x3e-\x5c\x5e-\x7e]{1,32}$')
         self._dispatcher = Signal()
+        self._sdassertions = {}
+        self._readtime = getHistogram('terane.input.read.seconds', input=name)
+        self._receivedevents = getCounter('terane.input.received.events', input=name)
+        plugin._inputs.append(self)
 
     def _updateselected(self, selector):
             # split the selector into the facility list and serverity
             facilities,severity = selector.split('.', 1)
             # parse the facility list
             if facilities == '*':
-                facilities = _facilities.values()
+                facilities = range(0, len(_facilitynames))
             else:
                 try:
                     facilities = [_facilities[f] for f in facilities.split(',') if not f == '']
                 except KeyError, e:
-                    raise InputError("[filter:%s] selector %s has invalid facility %s" % (self.name,selector,e))
+                    raise ConfigureError("[input:%s] selector %s has invalid facility %s" % (self.name,selector,e))
                 except Exception, e:
-                    raise InputError("[filter:%s] failed to parse facilities for selector %s: %s" % (self.name,selector,e))
+                    raise ConfigureError("[input:%s] failed to parse facilities for selector %s: %s" % (self.name,selector,e))
             # parse the severity, first checking for a modifier
-            if severity[0] in ('=','!'):
+            if severity.startswith('!='):
+                modifier = severity[0:2]
+                severity = severity[2:]
+            elif severity[0] in ('=','!'):
                 modifier = severity[0]
                 severity = severity[1:]
             else:
@@ -88,7 +290,7 @@ class SyslogInput(Input):
                 self._selected -= delset
             else:
                 if severity not in _severities:
-                    raise InputError("[filter:%s] selector %s has invalid severity %s" % (self.name,selector,severity))
+                    raise ConfigureError("[input:%s] selector %s has invalid severity %s" % (self.name,selector,severity))
                 severity = _severities[severity]
                 # log msgs of the specified severity for the specified facilities
                 if modifier == '=':
@@ -100,7 +302,7 @@ class SyslogInput(Input):
                 elif modifier == '!=':
                     delset = set()
                     for facility in facilities:
-                        addset.add((facility * 8) + severity)
+                        delset.add((facility * 8) + severity)
                     self._selected -= delset
                 # ignore msgs of equal or greater importance than the specified severity for the specified facilities
                 elif modifier == '!':
@@ -121,7 +323,7 @@ class SyslogInput(Input):
         allowed = section.getString('syslog udp allowed clients', '').strip()
         self._selected = set()
         # parse each selector, separated by semicolons
-        selectors = section.getString('syslog selectors', '').strip()
+        selectors = section.getString('syslog selectors', '*.*').strip()
         if not selectors == '':
             for selector in [s.strip() for s in selectors.split(';') if not s == '']:
                 self._updateselected(selector)
@@ -130,7 +332,12 @@ class SyslogInput(Input):
         self._contract.addAssertion(u'syslog_severity', u'literal', guarantees=True)
         self._contract.addAssertion(u'syslog_pid', u'int', guarantees=False)
         self._contract.addAssertion(u'syslog_tag', u'text', guarantees=False)
+        self._contract.addAssertion(u'syslog_msgid', u'literal', guarantees=False)
+        self._contract.addAssertion(u'syslog_sd', u'text', guarantees=False)
         self._contract.sign()
+        self._maxSDFields = section.getInt('syslog sd fields', 64)
+        if self._maxSDFields < 0:
+            raise ConfigureError("[input:%s] syslog sd fields must be greater than or equal to 0" % self.name)
 
     def getContract(self):
         return self._contract
@@ -142,63 +349,83 @@ class SyslogInput(Input):
         Input.startService(self)
         logger.debug("[input:%s] started input" % self.name)
 
+    def _processBatch(self, datagrams):
+        """
+        Parse a batch of datagrams, and signal the resulting events as a
+        single batch.
+
+        :param datagrams: A list of (data, (host, port)) tuples.
+        :type datagrams: list
+        """
+        start = time.time()
+        events = EventBatch()
+        for data,(host,port) in datagrams:
+            try:
+                events.append(self._process(host, port, data.rstrip('\r\n\0')))
+            except StopFiltering:
+                pass
+            except Exception, e:
+                logger.debug("[input:%s] dropped message from %s: %s" % (self.name,host,e))
+        self._readtime.since(start)
+        if len(events) > 0:
+            self._receivedevents += len(events)
+            self._dispatcher.emitSignal(events)
+
     def _process(self, host, port, data):
         # FIXME: check access restrictions
-        event = self._dispatcher.newEvent()
+        event = self._evfactory.makeEvent()
+        event[self._contract.field_input] = self.name
         event[self._contract.field_hostname] = host
         # parse the PRI section
         m = self._PRImatcher.match(data)
         if m == None:
-            raise FilterError("[filter:%s] line has invalid PRI section" % self.name)
+            raise FilterError("[input:%s] line has invalid PRI section" % self.name)
         pri = m.group('pri')
         # trim the PRI section off
         data = data[len(pri)+2:]
         # make sure that the PRI value is in decimal (a leading '0' would indicate octal)
         if len(pri) > 1 and pri[0] == '0':
-            raise FilterError("[filter:%s] line has invalid PRI section" % self.name)
+            raise FilterError("[input:%s] line has invalid PRI section" % self.name)
         # verify that we are interested in this particular priority
         pri = int(pri)
         if not pri in self._selected:
-            raise StopFiltering("[filter:%s] not interested in msg with priority %i" % (self.name,pri))
+            raise StopFiltering("[input:%s] not interested in msg with priority %i" % (self.name,pri))
         # parse the facility and severity from the priority
         facility = pri / 8
         severity = pri % 8
         if facility < 0 or facility > 23:
-            raise FilterError("[filter:%s] line has invalid facility %i" % (self.name,facility))
+            raise FilterError("[input:%s] line has invalid facility %i" % (self.name,facility))
         if severity < 0 or severity > 7:
-            raise FilterError("[filter:%s] line has invalid severity %i" % (self.name,severity))
-        # notify each input about the new syslog message
-        event[self._contract.field_syslog_facility] = facility
-        event[self._contract.field_syslog_severity] = severity
+            raise FilterError("[input:%s] line has invalid severity %i" % (self.name,severity))
+        event[self._contract.field_syslog_facility] = _facilitynames[facility]
+        event[self._contract.field_syslog_severity] = _severitynames[severity]
         # parse the HEADER section
         # this is a RFC5424-compliant syslog message
-        if data[0].isdigit():
-            raise FilterError("[filter:%s] can't parse RFC5424 syslog messages" % self.name)
+        if data[:1].isdigit():
+            return self._process5424(event, data)
         # this is a BSD syslog message
         m = self._TIMESTAMPmatcher.match(data)
         if m == None:
-            raise FilterError("[filter:%s] line has an invalid timestamp" % self.name)
+            raise FilterError("[input:%s] line has an invalid timestamp" % self.name)
         timestamp = m.group('timestamp')
-        if timestamp == None:
-            raise FilterError("[filter:%s] line has an invalid timestamp" % self.name)
         # trim the TIMESTAMP section off
         data = data[len(timestamp):]
         # parse the timestamp
         try:
-            event.ts = dateutils.parser.parse(timestamp)
+            event.ts = parseSyslogTimestamp(timestamp[:-1])
         except Exception, e:
-            raise FilterError("[filter:%s] failed to parse date '%s': %s" % (self.name, timestamp, e))
+            raise FilterError("[input:%s] failed to parse date '%s': %s" % (self.name, timestamp, e))
         # the remainder of the data consists of the HOSTNAME, a space, then the MSG
         try:
             hostname,msg = data.split(' ', 1)
-        except:
-            raise FilterError("[filter:%s] line has no syslog body")
+            tag,content = msg.split(' ', 1)
+        except ValueError:
+            raise FilterError("[input:%s] line has no syslog body" % self.name)
         event[self._contract.field_hostname] = hostname
         # split the message into tag and content
-        tag,content = msg.split(' ', 1)
         m = self._TAGmatcher.match(tag)
         if m == None:
-            raise FilterError("[filter:%s] line has an invalid tag" % self.name)
+            raise FilterError("[input:%s] line has an invalid tag" % self.name)
         data = m.groups()
         if data[0] != None and data[1] != None:
             event[self._contract.field_syslog_tag] = data[0]
@@ -206,9 +433,122 @@ class SyslogInput(Input):
         elif data[2] != None:
             event[self._contract.field_syslog_tag] = data[2]
         else:
-            raise FilterError("[filter:%s] line has an invalid tag" % self.name)
+            raise FilterError("[input:%s] line has an invalid tag" % self.name)
         event[self._contract.field_message] = content
-        self._dispatcher.signalEvent(event)
+        return event
+
+    def _process5424(self, event, data):
+        """
+        Parse the remainder of an RFC5424 message following the PRI section.
+        """
+        # VERSION SP TIMESTAMP SP HOSTNAME SP APP-NAME SP PROCID SP MSGID SP STRUCTURED-DATA [SP MSG]
+        try:
+            version,timestamp,hostname,appname,procid,msgid,data = data.split(' ', 6)
+        except ValueError:
+            raise FilterError("[input:%s] line has an invalid RFC5424 header" % self.name)
+        if version != '1':
+            raise FilterError("[input:%s] unsupported syslog version %s" % (self.name,version))
+        if timestamp != '-':
+            try:
+                event.ts = parseRFC3339Timestamp(timestamp)
+            except Exception, e:
+                raise FilterError("[input:%s] failed to parse date '%s': %s" % (self.name, timestamp, e))
+        if hostname != '-':
+            event[self._contract.field_hostname] = hostname
+        if appname != '-':
+            event[self._contract.field_syslog_tag] = appname
+        if procid.isdigit():
+            event[self._contract.field_syslog_pid] = int(procid)
+        if msgid != '-':
+            event[self._contract.field_syslog_msgid] = msgid
+        # parse the STRUCTURED-DATA section
+        if data.startswith('-'):
+            msg = data[1:]
+        elif data.startswith('['):
+            msg = self._processStructuredData(event, data)
+        else:
+            raise FilterError("[input:%s] line has invalid structured data" % self.name)
+        if msg.startswith(' '):
+            msg = msg[1:]
+        # the message is UTF-8 if it starts with a byte order mark
+        if msg.startswith('\xef\xbb\xbf'):
+            msg = msg[3:].decode('utf-8', 'replace')
+        event[self._contract.field_message] = msg
+        return event
+
+    def _getSDAssertion(self, sdid, name):
+        """
+        Returns the Assertion for the structured data parameter, creating
+        it if necessary.  The field name is syslog_sd_<SD-ID>_<PARAM-NAME>,
+        with any characters which aren't allowed in a field name replaced
+        by underscores.  Returns None if the input already has the maximum
+        number of structured data fields.
+        """
+        try:
+            return self._sdassertions[(sdid,name)]
+        except KeyError:
+            if len(self._sdassertions) >= self._maxSDFields:
+                return None
+            fieldname = re.sub(r'[^A-Za-z0-9_]', '_', u"syslog_sd_%s_%s" % (sdid,name))
+            assertion = Assertion(unicode(fieldname), u'literal')
+            self._sdassertions[(sdid,name)] = assertion
+            return assertion
+
+    def _processStructuredData(self, event, data):
+        """
+        Parse each SD-ELEMENT in the structured data, storing each parameter
+        in its own field.  Parameters whose SD-ID or PARAM-NAME is not a valid
+        SD-NAME are dropped.  Once the input has the maximum number of
+        structured data fields, parameters without a field of their own are
+        stored together in the syslog_sd field, in the structured data format.
+
+        :returns: The remainder of the data following the structured data.
+        :rtype: str
+        """
+        overflow = []
+        i = 0
+        try:
+            while data[i:i+1] == '[':
+                # SD-ID
+                j = i + 1
+                while data[j] not in ' ]':
+                    j += 1
+                sdid = data[i+1:j]
+                valid = self._SDNAMEmatcher.match(sdid) != None
+                params = []
+                # each SD-PARAM is PARAM-NAME="PARAM-VALUE"
+                while data[j] == ' ':
+                    eq = data.index('=', j)
+                    name = data[j+1:eq]
+                    if data[eq+1] != '"':
+                        raise FilterError("[input:%s] line has invalid structured data" % self.name)
+                    k = eq + 2
+                    value = []
+                    while data[k] != '"':
+                        # '"', '\\' and ']' are escaped with a backslash
+                        if data[k] == '\\' and data[k+1] in '"\\]':
+                            k += 1
+                        value.append(data[k])
+                        k += 1
+                    j = k + 1
+                    if not valid or self._SDNAMEmatcher.match(name) == None:
+                        continue
+                    value = ''.join(value).decode('utf-8', 'replace')
+                    assertion = self._getSDAssertion(sdid, name)
+                    if assertion != None:
+                        event[assertion] = value
+                    else:
+                        params.append(u' %s="%s"' % (name, re.sub(r'(["\\\]])', r'\\\1', value)))
+                if data[j] != ']':
+                    raise FilterError("[input:%s] line has invalid structured data" % self.name)
+                if len(params) > 0:
+                    overflow.append(u"[%s%s]" % (sdid, u''.join(params)))
+                i = j + 1
+        except (IndexError, ValueError):
+            raise FilterError("[input:%s] line has invalid structured data" % self.name)
+        if len(overflow) > 0:
+            event[self._contract.field_syslog_sd] = u''.join(overflow)
+        return data[i:]
 
     def stopService(self):
         Input.stopService(self)
@@ -220,22 +560,65 @@ class SyslogInputPlugin(Plugin):
 
     components = [(SyslogInput, IInput, 'syslog')]
 
-    def configure(self, section):
+    def __init__(self):
+        Plugin.__init__(self)
+        self._inputs = []
         self._udplistener = None
+        self._tcplistener = None
+        self._dropchecker = None
+
+    def configure(self, section):
         self._udpaddress = section.getString('syslog udp address', '0.0.0.0')
         self._udpport = section.getInt('syslog udp port', 514)
-        self._inputs = []
+        self._udprcvbuf = section.getInt('syslog udp receive buffer', 8 * 1024 * 1024)
+        self._udpmaxdatagrams = section.getInt('syslog udp batch size', 1024)
+        self._udpmaxsize = section.getInt('syslog udp maximum message size', 8192)
+        self._tcpenabled = section.getBoolean('syslog tcp enabled', False)
+        self._tcpaddress = section.getString('syslog tcp address', '0.0.0.0')
+        self._tcpport = section.getInt('syslog tcp port', 514)
+        self._tcpmaxsize = section.getInt('syslog tcp maximum message size', 64 * 1024)
+        self._tcpmaxconnections = section.getInt('syslog tcp maximum connections', 4096)
+        self.receiveddatagrams = getStat("terane.input.syslog.receiveddatagrams", 0)
+        self.receivedmessages = getStat("terane.input.syslog.receivedmessages", 0)
+        self.tcpconnections = getVolatileStat("terane.input.syslog.tcpconnections", 0)
+        self.kerneldrops = getVolatileStat("terane.input.syslog.kerneldrops", 0)
 
     def startService(self):
         Plugin.startService(self)
         if len(self._inputs) > 0:
             receiver = SyslogUDPReceiver(self)
-            self._udplistener = reactor.listenUDP(self._udpport, receiver, interface=self._udpaddress)
+            self._udplistener = SyslogUDPPort(self._udpport, receiver, self._udpaddress,
+                self._udpmaxsize, self._udpmaxdatagrams, self._udprcvbuf)
+            self._udplistener.startListening()
+            if recvmmsg == None:
+                logger.info("[%s] recvmmsg() is not available, reading one datagram at a time" % self.name)
             logger.info("[%s] listening for udp syslog messages on %s:%i" % (self.name,self._udpaddress,self._udpport))
+            self._dropchecker = LoopingCall(self._checkDrops)
+            self._dropchecker.start(10, False)
+            if self._tcpenabled:
+                factory = SyslogTCPFactory(self, self._tcpmaxsize, self._tcpmaxconnections)
+                self._tcplistener = reactor.listenTCP(self._tcpport, factory,
+                    backlog=1024, interface=self._tcpaddress)
+                logger.info("[%s] listening for tcp syslog messages on %s:%i" % (self.name,self._tcpaddress,self._tcpport))
         else:
             logger.info("[%s] no syslog inputs configured" % self.name)
 
+    def _checkDrops(self):
+        drops = self._udplistener.kernelDrops()
+        if drops == None:
+            return
+        if drops > self.kerneldrops.value:
+            logger.warning("[%s] kernel dropped %i udp syslog messages" %
+                (self.name, drops - self.kerneldrops.value))
+        self.kerneldrops <<= drops
+
     def stopService(self):
+        if self._dropchecker != None and self._dropchecker.running:
+            self._dropchecker.stop()
+        self._dropchecker = None
+        if not self._tcplistener == None:
+            self._tcplistener.stopListening()
+            self._tcplistener = None
         if not self._udplistener == None:
             self._udplistener.stopListening()
             self._udplistener = None
@@ -253,29 +636,11 @@ _severities = {
     'debug': 7
     }
 
-_facilities = {
-    'kern': 0,          # kernel messages
-    'user': 1,          # user-level messages
-    'mail': 2,          # mail system
-    'daemon': 3,        # system daemons
-    'auth': 4,          # security/authorization messages (see RFC 3164, section 4.1.1, table 1, note 1)
-    'syslog': 5,        # messages generated internally by syslogd
-    'lpr': 6,           # line printer subsystem
-    'news': 7,          # network news subsystem
-    'uucp': 8,          # UUCP subsystem
-    'cron': 9,          # clock daemon (see RFC 3164, section 4.1.1, table 1, note 2)
-    'authpriv': 10,     # security/authorization messages (see RFC 3164, section 4.1.1, table 1, note 1)
-    'ftp': 11,          # FTP daemon
-    'ntp': 12,          # NTP subsystem
-    'auth': 13,         # log audit (see RFC 3164, section 4.1.1, table 1, note 1)
-    'auth': 14,         # log alert (see RFC 3164, section 4.1.1, table 1, note 1)
-    'cron': 15,         # clock daemon (see RFC 3164, section 4.1.1, table 1, note 2)
-    'local0': 16,       # local use 0  (local0)
-    'local1': 17,       # local use 1  (local1)
-    'local2': 18,       # local use 2  (local2)
-    'local3': 19,       # local use 3  (local3)
-    'local4': 20,       # local use 4  (local4)
-    'local5': 21,       # local use 5  (local5)
-    'local6': 22,       # local use 6  (local6)
-    'local7': 23        # local use 7  (local7)
-    }
+
+_severitynames = [u'emerg', u'alert', u'crit', u'err', u'warning', u'notice', u'info', u'debug']
+
+_facilitynames = [u'kern', u'user', u'mail', u'daemon', u'auth', u'syslog', u'lpr', u'news',
+    u'uucp', u'cron', u'authpriv', u'ftp', u'ntp', u'audit', u'alert', u'clock', u'local0',
+    u'local1', u'local2', u'local3', u'local4', u'local5', u'local6', u'local7']
+
+_facilities = dict([(str(name), facility) for facility,name in enumerate(_facilitynames)])
@@ -0,0 +1,127 @@
+/*
+ * Copyright 2010,2011,2012 Michael Frank <msfrank@syntaxjockey.com>
+ *
+ * This file is part of Terane.
+ *
+ * Terane is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * Terane is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with Terane.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <sys/types.h>
+#include <sys/socket.h>
+#include <netinet/in.h>
+#include <arpa/inet.h>
+#include <errno.h>
+#include <string.h>
+
+/*
+ * _udp_recvmmsg: receive up to count datagrams of at most size bytes from the
+ *  socket fd using a single system call.  Returns a list of (data, (host, port))
+ *  tuples, which is empty if there are no datagrams waiting to be read.
+ */
+static PyObject *
+_udp_recvmmsg (PyObject *self, PyObject *args)
+{
+    int fd, count, size, nrecv, i;
+    struct mmsghdr *msgs = NULL;
+    struct iovec *iovecs = NULL;
+    struct sockaddr_storage *addrs = NULL;
+    char *buffer = NULL;
+    char host[INET6_ADDRSTRLEN];
+    int port;
+    PyObject *list = NULL, *item;
+
+    if (!PyArg_ParseTuple (args, "iii", &fd, &count, &size))
+        return NULL;
+    if (count <= 0 || size <= 0) {
+        PyErr_SetString (PyExc_ValueError, "count and size must be greater than 0");
+        return NULL;
+    }
+
+    msgs = PyMem_Malloc (sizeof (struct mmsghdr) * count);
+    iovecs = PyMem_Malloc (sizeof (struct iovec) * count);
+    addrs = PyMem_Malloc (sizeof (struct sockaddr_storage) * count);
+    buffer = PyMem_Malloc ((size_t) size * count);
+    if (msgs == NULL || iovecs == NULL || addrs == NULL || buffer == NULL) {
+        PyErr_NoMemory ();
+        goto cleanup;
+    }
+    memset (msgs, 0, sizeof (struct mmsghdr) * count);
+    for (i = 0; i < count; i++) {
+        iovecs[i].iov_base = buffer + ((size_t) size * i);
+        iovecs[i].iov_len = size;
+        msgs[i].msg_hdr.msg_iov = &iovecs[i];
+        msgs[i].msg_hdr.msg_iovlen = 1;
+        msgs[i].msg_hdr.msg_name = &addrs[i];
+        msgs[i].msg_hdr.msg_namelen = sizeof (struct sockaddr_storage);
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    nrecv = recvmmsg (fd, msgs, count, MSG_DONTWAIT, NULL);
+    Py_END_ALLOW_THREADS
+    if (nrecv < 0) {
+        if (errno != EAGAIN && errno != EWOULDBLOCK && errno != EINTR) {
+            PyErr_SetFromErrno (PyExc_OSError);
+            goto cleanup;
+        }
+        nrecv = 0;
+    }
+
+    list = PyList_New (nrecv);
+    if (list == NULL)
+        goto cleanup;
+    for (i = 0; i < nrecv; i++) {
+        host[0] = '\0';
+        port = 0;
+        if (addrs[i].ss_family == AF_INET) {
+            struct sockaddr_in *sin = (struct sockaddr_in *) &addrs[i];
+            inet_ntop (AF_INET, &sin->sin_addr, host, sizeof (host));
+            port = ntohs (sin->sin_port);
+        }
+        else if (addrs[i].ss_family == AF_INET6) {
+            struct sockaddr_in6 *sin6 = (struct sockaddr_in6 *) &addrs[i];
+            inet_ntop (AF_INET6, &sin6->sin6_addr, host, sizeof (host));
+            port = ntohs (sin6->sin6_port);
+        }
+        item = Py_BuildValue ("(s#(si))", (char *) iovecs[i].iov_base,
+            (Py_ssize_t) msgs[i].msg_len, host, port);
+        if (item == NULL) {
+            Py_DECREF (list);
+            list = NULL;
+            goto cleanup;
+        }
+        PyList_SET_ITEM (list, i, item);
+    }
+
+cleanup:
+    PyMem_Free (msgs);
+    PyMem_Free (iovecs);
+    PyMem_Free (addrs);
+    PyMem_Free (buffer);
+    return list;
+}
+
+static PyMethodDef udp_functions[] =
+{
+    { "recvmmsg", (PyCFunction) _udp_recvmmsg, METH_VARARGS,
+      "Receive multiple datagrams from a socket with one system call." },
+    { NULL, NULL, 0, NULL }
+};
+
+PyMODINIT_FUNC
+initudp (void)
+{
+    Py_InitModule3 ("udp", udp_functions, "Batched UDP socket operations");
+}
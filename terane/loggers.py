@@ -129,27 +129,53 @@ class Logger(object):
     def __str__(self):
         return self._name
 
-    def msg(self, level, message, **kwds):
-        kwds.update({'logger': self, 'level': level})
+    def isEnabledFor(self, level):
+        """
+        Returns True if a message at the specified level would be logged.
+        Until logging is started every level is enabled, since buffered
+        messages are filtered once the levels have been configured.
+
+        :param level: The message level.
+        :type level: int
+        :rtype: bool
+        """
+        return self._level == None or level <= self._level
+
+    def msg(self, level, message, *args, **kwds):
+        """
+        Log message at the specified level.  If args are specified, then the
+        message is a format string which is interpolated with args, but only
+        if the level is enabled.
+        """
+        if self._level != None and level > self._level:
+            return
+        if args:
+            message = message % args
+        kwds['logger'] = self
+        kwds['level'] = level
         msg(message, **kwds)
 
     def exception(self, exception):
         err(exception, None, logger=self, level=DEBUG)
 
-    def trace(self, message, **kwds):
-        self.msg(TRACE, message, **kwds)
+    def trace(self, message, *args, **kwds):
+        if self._level != None and TRACE > self._level:
+            return
+        self.msg(TRACE, message, *args, **kwds)
 
-    def debug(self, message, **kwds):
-        self.msg(DEBUG, message, **kwds)
+    def debug(self, message, *args, **kwds):
+        if self._level != None and DEBUG > self._level:
+            return
+        self.msg(DEBUG, message, *args, **kwds)
 
-    def info(self, message, **kwds):
-        self.msg(INFO, message, **kwds)
+    def info(self, message, *args, **kwds):
+        self.msg(INFO, message, *args, **kwds)
 
-    def warning(self, message, **kwds):
-        self.msg(WARNING, message, **kwds)
+    def warning(self, message, *args, **kwds):
+        self.msg(WARNING, message, *args, **kwds)
 
-    def error(self, message, **kwds):
-        self.msg(ERROR, message, **kwds)
+    def error(self, message, *args, **kwds):
+        self.msg(ERROR, message, *args, **kwds)
 
     def tracedfunc(self, fn):
         class _TracedFuncWrapper(object):
@@ -168,6 +194,8 @@ class Logger(object):
                         return unicode("'%s'" % arg)
                     return unicode(arg)
                 retval = self._fn(*args, **kwds)
+                if not self.logger.isEnabledFor(TRACE):
+                    return retval
                 if type(self._fn) == types.FunctionType:
                     _fn = fn.__name__
                 else:
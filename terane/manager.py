@@ -40,4 +40,4 @@ class Manager(MultiService):
         MultiService.startService(self)
 
     def stopService(self):
-        MultiService.stopService(self)
+        return MultiService.stopService(self)
@@ -24,8 +24,14 @@ class IOutput(IService, ILoadable):
         "Configure the plugin instance."
     def getContract():
          "Return a set of field names which the receiveEvent method expects."
-    def receiveEvent(fields):
-        "Receive a dict of event fields and store them."
+    def receiveEvent(event):
+        "Receive an event and store it."
+    def receiveEvents(events):
+        """
+        Receive a list of events and store them.  Returns a Deferred which
+        fires once the events are stored, or fails if they could not be
+        stored, or None if the events are stored before returning.
+        """
 
 class ISearchable(Interface):
     def getIndex():
@@ -51,3 +57,7 @@ class Output(Service):
 
     def receiveEvent(self, event):
         pass
+
+    def receiveEvents(self, events):
+        for event in events:
+            self.receiveEvent(event)
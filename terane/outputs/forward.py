@@ -6,107 +6,443 @@
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation, either version 3 of the License, or
 # (at your option) any later version.
-# 
+#
 # Terane is distributed in the hope that it will be useful,
 # but WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
-# 
+#
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import os, sys
-from twisted.internet.defer import Deferred
+import os, sys, time, calendar, uuid, random, struct, hashlib, bisect
+from collections import deque
 from twisted.spread.pb import PBClientFactory, DeadReferenceError
 from twisted.cred.credentials import Anonymous
-from twisted.internet import reactor
-from twisted.python.failure import Failure
+from twisted.internet import reactor, task
 from zope.interface import implements
 from terane.plugins import Plugin, IPlugin
 from terane.outputs import Output, IOutput
+from terane.outputs.spool import Spool
+from terane.bier.event import Contract
+from terane.settings import ConfigureError
 from terane.loggers import getLogger
 from terane.stats import getStat
 
 logger = getLogger('terane.outputs.forward')
 
-class ForwardOutput(Output):
+def serializeEvent(event):
+    """
+    Convert the event into a record which can be spooled and sent to a
+    remote collector.
 
-    implements(IOutput)
+    :param event: The event to serialize.
+    :type event: :class:`terane.bier.event.Event`
+    :returns: A tuple containing the UTC timestamp and a list of
+      (fieldname, fieldtype, value) tuples.
+    :rtype: tuple
+    """
+    # naive timestamps are assumed to be in local time, same as EVID
+    if event.ts.tzinfo == None:
+        ts = time.mktime(event.ts.timetuple())
+    else:
+        ts = calendar.timegm(event.ts.utctimetuple())
+    ts += event.ts.microsecond / 1000000.0
+    return (ts, [(fn,ft,v) for fn,ft,v in event])
 
-    def configure(self, section):
-        self.forwardserver = section.getString('forwarding address', None)
-        self.forwardport = section.getInt('forwarding port', None)
-        self.retryinterval = section.getInt('retry interval', 10)
-        self.forwardedevents = getStat("terane.output.%s.forwardedevents" % self.name, 0)
-        self.stalerefs = getStat("terane.output.%s.stalerefs" % self.name, 0)
-        
-    def startService(self):
-        Output.startService(self)
+class _Batch(object):
+    """
+    A contiguous range of records read from the spool.  The batch may be
+    split into several pieces, each sent to a different collector; the
+    batch is done once every piece has been acknowledged.
+    """
+
+    def __init__(self, records):
+        self.first = records[0][0]
+        self.last = records[-1][0]
+        self.size = len(records)
+        self.remaining = 0
+        self.done = False
+
+class _Piece(object):
+    """
+    The subset of a batch which is sent to a single collector.
+    """
+
+    def __init__(self, batch, records, target=None):
+        self.batch = batch
+        self.records = records
+        self.target = target
+        batch.remaining += 1
+
+class CollectorLink(object):
+    """
+    A connection to a single remote collector.  Each login opens a new
+    stream on the collector, and records sent over the stream are numbered
+    consecutively so the collector can acknowledge the highest contiguous
+    record it has received.  If the connection fails, the link is ejected
+    from the set of healthy collectors and reconnects independently of the
+    other links, backing off exponentially.
+    """
+
+    def __init__(self, output, address, port):
+        self.name = "%s:%i" % (address, port)
+        self.address = address
+        self.port = port
+        self.healthy = False
+        self.outstanding = []
+        self._output = output
         self._client = None
-        self._listener = None
         self._remote = None
+        self._stream = None
+        self._linkseq = 0
         self._backoff = None
-        self._reconnect()
+        self._delay = output.retryinterval
 
-    def _reconnect(self):
+    def connect(self):
+        self._backoff = None
         try:
-            if self._client:
-                self._client.disconnect()
             self._client = PBClientFactory()
-            if self._listener:
-                self._listener.disconnect()
-            self._listener = reactor.connectTCP(self.forwardserver, self.forwardport, self._client)
-            self._remote = self._client.login(Anonymous())
-            self._remote.addCallback(self._login)
-            self._remote.addErrback(self._loginFailed)
+            reactor.connectTCP(self.address, self.port, self._client)
+            d = self._client.login(Anonymous())
+            d.addCallbacks(self._login, self._loginFailed)
         except Exception, e:
-            logger.error("[output:%s] failed to connect to remote collector: %s" % (self.name,str(e)))
-            logger.error("[output:%s] will retry to connect in %i seconds" % (self.name,self.retryinterval))
-            self._backoff = reactor.callLater(self.retryinterval, self._reconnect)
+            logger.error("[output:%s] failed to connect to collector %s: %s" %
+                (self._output.name, self.name, e))
+            self._eject()
 
     def _login(self, remote):
         self._remote = remote
-        self._backoff = None
-        logger.debug("[output:%s] connected to remote collector" % self.name)
+        self._remote.notifyOnDisconnect(self._disconnected)
+        self._stream = "%s.%s" % (self._output._spool.source, uuid.uuid4().hex)
+        self._linkseq = 0
+        self._delay = self._output.retryinterval
+        self.healthy = True
+        logger.debug("[output:%s] connected to collector %s" % (self._output.name, self.name))
+        self._output._collectorUp(self)
 
     def _loginFailed(self, reason):
-        logger.error("[output:%s] failed to login to remote collector: %s" % (self.name,str(reason.value)))
-        logger.error("[output:%s] will retry to connect in %i seconds" % (self.name,self.retryinterval))
-        self._backoff = reactor.callLater(self.retryinterval, self._reconnect)
+        logger.error("[output:%s] failed to login to collector %s: %s" %
+            (self._output.name, self.name, reason.getErrorMessage()))
+        self._eject()
 
-    def stopService(self):
-        Output.stopService(self)
-        if self._client:
+    def _disconnected(self, remote):
+        if remote is not self._remote:
+            return
+        logger.debug("[output:%s] lost connection to collector %s" % (self._output.name, self.name))
+        self._eject()
+
+    def _eject(self):
+        """
+        Mark the link as unhealthy, hand its outstanding pieces back to the
+        output, and schedule a reconnect.
+        """
+        wasHealthy = self.healthy
+        self.healthy = False
+        self._remote = None
+        self._stream = None
+        if self._client != None:
             self._client.disconnect()
         self._client = None
-        if self._listener:
-            self._listener.disconnect()
-        self._listener = None
-        self._client = None
-        self._remote = None
-        self._backoff = None
+        pieces = [piece for linkseq,piece in self.outstanding]
+        self.outstanding = []
+        if not self._output.running:
+            return
+        if self._backoff == None:
+            # add some jitter so links don't all reconnect at the same instant
+            delay = self._delay * random.uniform(0.8, 1.2)
+            self._backoff = reactor.callLater(delay, self.connect)
+            logger.debug("[output:%s] will retry collector %s in %.1f seconds" %
+                (self._output.name, self.name, delay))
+            self._delay = min(self._delay * 2, self._output.maxretryinterval)
+        self._output._collectorDown(self, pieces, wasHealthy)
 
-    def receiveEvent(self, fields):
+    def send(self, piece):
+        records = []
+        for seq,record in piece.records:
+            self._linkseq += 1
+            records.append((self._linkseq, record))
+        self.outstanding.append((self._linkseq, piece))
         try:
-            logger.debug("[output:%s] forwarding event: %s" % (self.name,str(fields)))
-            d = self._remote.callRemote('collect', fields)
-            d.addCallback(self._collected)
-            d.addErrback(self._collectFailed)
+            d = self._remote.callRemote('collectBatch', self._stream, records)
         except DeadReferenceError:
-            # if we are not already in the process of reconnecting, then reconnect
-            if not isinstance(self._remote, Deferred):
-                self.stalerefs += 1
-                logger.debug("[output:%s] lost reference to collector at %s:%i" %
-                (self.name, self.forwardserver, self.forwardport))
-                self._reconnect()
-
-    def _collected(self, unused):
-        self.forwardedevents += 1
-
-    def _collectFailed(self, reason):
-        logger.debug("[output:%s] failed to forward event to %s:%i: %s" %
-            (self.name, self.forwardserver, self.forwardport, str(reason)))
-        return reason
+            self._eject()
+            return
+        d.addCallbacks(self._collected, self._collectFailed,
+            callbackArgs=(self._stream, self._linkseq), errbackArgs=(self._stream,))
+
+    def _collected(self, acked, stream, lastseq):
+        if stream != self._stream:
+            return
+        while len(self.outstanding) > 0 and self.outstanding[0][0] <= acked:
+            linkseq,piece = self.outstanding.pop(0)
+            self._output._pieceDone(piece)
+        # the collector dropped part of the batch, so resend everything which
+        # is still outstanding over a new stream
+        if acked < lastseq:
+            logger.debug("[output:%s] collector %s acked %i, expected %i" %
+                (self._output.name, self.name, acked, lastseq))
+            self._eject()
+        else:
+            self._output._send()
+
+    def _collectFailed(self, reason, stream):
+        if stream != self._stream:
+            return
+        logger.debug("[output:%s] failed to forward events to %s: %s" %
+            (self._output.name, self.name, reason.getErrorMessage()))
+        self._eject()
+
+    def close(self):
+        if self._backoff != None and self._backoff.active():
+            self._backoff.cancel()
+        self._backoff = None
+        self.healthy = False
+        self._remote = None
+        self._stream = None
+        if self._client != None:
+            self._client.disconnect()
+        self._client = None
+        self.outstanding = []
+
+class ForwardOutput(Output):
+    """
+    Forward events to one or more remote collectors.  Every event is first
+    appended to a local on-disk spool, then read from the spool in batches
+    and distributed across the healthy collectors, either to the collector
+    with the fewest outstanding batches or by consistent hashing on the
+    event hostname.  The spool discards records only after every record
+    before them has been acknowledged.  If a collector fails, its
+    outstanding batches are sent to the remaining collectors.
+    """
+
+    implements(IOutput)
+
+    def __init__(self, plugin, name, fieldstore):
+        Output.__init__(self, plugin, name, fieldstore)
+        self._contract = Contract().sign()
+        self._spool = None
+        self._links = []
+        self._batches = deque()
+        self._queue = deque()
+        self._ring = None
+        self._flusher = None
+
+    def configure(self, section):
+        collectors = section.getList(str, 'forwarding collectors', None)
+        if collectors == None:
+            address = section.getString('forwarding address', None)
+            if address == None:
+                raise ConfigureError("[output:%s] missing required parameter 'forwarding collectors'" % self.name)
+            collectors = ["%s:%i" % (address, section.getInt('forwarding port', 8643))]
+        self.collectors = []
+        for collector in [c for c in collectors if c != '']:
+            address,sep,port = collector.rpartition(':')
+            try:
+                if sep == '':
+                    self.collectors.append((port, 8643))
+                else:
+                    self.collectors.append((address, int(port)))
+            except ValueError:
+                raise ConfigureError("[output:%s] invalid collector '%s'" % (self.name, collector))
+        if len(self.collectors) == 0:
+            raise ConfigureError("[output:%s] no collectors specified" % self.name)
+        self.balance = section.getString('balance policy', 'least-outstanding')
+        if not self.balance in ('least-outstanding', 'hostname'):
+            raise ConfigureError("[output:%s] unknown balance policy '%s'" % (self.name, self.balance))
+        self.retryinterval = section.getInt('retry interval', 10)
+        self.maxretryinterval = section.getInt('maximum retry interval', 300)
+        if self.maxretryinterval < self.retryinterval:
+            self.maxretryinterval = self.retryinterval
+        self.spooldir = section.getPath('spool directory',
+            os.path.join('/var/lib/terane/spool', self.name))
+        self.segmentsize = section.getInt('spool segment size', 64 * 1024 * 1024)
+        self.syncinterval = section.getFloat('spool sync interval', 1.0)
+        if self.syncinterval <= 0.0:
+            raise ConfigureError("[output:%s] spool sync interval must be greater than 0" % self.name)
+        self.batchsize = section.getInt('batch size', 100)
+        if self.batchsize < 1:
+            raise ConfigureError("[output:%s] batch size must be greater than 0" % self.name)
+        self.window = section.getInt('send window', 8)
+        if self.window < 1:
+            raise ConfigureError("[output:%s] send window must be greater than 0" % self.name)
+        self.forwardedevents = getStat("terane.output.%s.forwardedevents" % self.name, 0)
+        self.spooledevents = getStat("terane.output.%s.spooledevents" % self.name, 0)
+        self.ejections = getStat("terane.output.%s.ejections" % self.name, 0)
+
+    def getContract(self):
+        return self._contract
+
+    def startService(self):
+        Output.startService(self)
+        self._spool = Spool(self.spooldir, self.segmentsize)
+        if self._spool.pending() > 0:
+            logger.info("[output:%s] %i unacknowledged events in spool" %
+                (self.name, self._spool.pending()))
+        self._flusher = task.LoopingCall(self._flush)
+        self._flusher.start(self.syncinterval, False)
+        self._links = [CollectorLink(self, address, port) for address,port in self.collectors]
+        for link in self._links:
+            link.connect()
+
+    def stopService(self):
+        Output.stopService(self)
+        for link in self._links:
+            link.close()
+        self._links = []
+        if self._flusher:
+            self._flusher.stop()
+        self._flusher = None
+        self._batches.clear()
+        self._queue.clear()
+        self._ring = None
+        if self._spool:
+            self._spool.close()
+        self._spool = None
+
+    def receiveEvent(self, event):
+        self.receiveEvents([event])
+
+    def receiveEvents(self, events):
+        # if the output is not running, discard any received events
+        if not self.running:
+            return
+        for event in events:
+            self._spool.append(serializeEvent(event))
+        self.spooledevents += len(events)
+        # only send full batches here, partial batches are sent by _flush
+        if self._spool.unread() >= self.batchsize:
+            self._send()
+
+    def _flush(self):
+        try:
+            self._spool.sync()
+        except (IOError,OSError), e:
+            logger.error("[output:%s] failed to sync spool: %s" % (self.name, e))
+        self._send()
+
+    def _collectorUp(self, link):
+        self._ring = None
+        self._send()
+
+    def _collectorDown(self, link, pieces, wasHealthy):
+        if wasHealthy:
+            self.ejections += 1
+            logger.info("[output:%s] ejected collector %s" % (self.name, link.name))
+        self._ring = None
+        # requeue the outstanding pieces ahead of everything else
+        for piece in reversed(pieces):
+            self._queue.appendleft(piece)
+        self._send()
+
+    def _getRing(self, healthy):
+        """
+        Return the consistent hash ring over the healthy links, which is
+        rebuilt only when the set of healthy links changes.
+        """
+        if self._ring == None:
+            ring = []
+            for link in healthy:
+                for i in range(64):
+                    h = struct.unpack('>I', hashlib.md5("%s-%i" % (link.name, i)).digest()[:4])[0]
+                    ring.append((h, link))
+            ring.sort()
+            self._ring = ([h for h,_ in ring], [l for _,l in ring])
+        return self._ring
+
+    def _partition(self, piece, healthy):
+        """
+        Split the piece into pieces by the collector each record hashes to.
+        """
+        keys,links = self._getRing(healthy)
+        targets = {}
+        for seq,record in piece.records:
+            hostname = ''
+            for fieldname,fieldtype,value in record[1]:
+                if fieldname == u'hostname':
+                    hostname = value.encode('utf-8') if isinstance(value, unicode) else str(value)
+                    break
+            h = struct.unpack('>I', hashlib.md5(hostname).digest()[:4])[0]
+            link = links[bisect.bisect(keys, h) % len(links)]
+            targets.setdefault(link, []).append((seq, record))
+        # the original piece is replaced by the partitioned pieces
+        piece.batch.remaining -= 1
+        return [_Piece(piece.batch, records, link) for link,records in targets.items()]
+
+    def _chooseLink(self, piece, healthy):
+        if self.balance == 'hostname':
+            if piece.target in healthy and len(piece.target.outstanding) < self.window:
+                return piece.target
+            return None
+        link = min(healthy, key=lambda l: len(l.outstanding))
+        if len(link.outstanding) < self.window:
+            return link
+        return None
+
+    def _route(self, healthy):
+        """
+        Route the queued pieces by hostname if they weren't already, or if the
+        collector they were routed to is no longer healthy.
+        """
+        queue = deque()
+        for piece in self._queue:
+            if piece.target in healthy:
+                queue.append(piece)
+            else:
+                queue.extend(self._partition(piece, healthy))
+        self._queue = queue
+
+    def _nextPiece(self, healthy):
+        """
+        Return the first queued piece which can be sent and the link to send
+        it to, skipping pieces whose collector's window is full, or (None,None)
+        if no queued piece can be sent.
+        """
+        for piece in self._queue:
+            link = self._chooseLink(piece, healthy)
+            if link != None:
+                return piece, link
+        return None, None
+
+    def _send(self):
+        """
+        Send pieces to the healthy collectors until every send window is
+        full or the spool is drained.  A collector whose window is full
+        doesn't hold up the pieces queued for the other collectors; at most
+        one window of pieces per collector is read ahead from the spool.
+        """
+        while self._spool != None:
+            healthy = [link for link in self._links if link.healthy]
+            if len(healthy) == 0:
+                break
+            if self.balance == 'hostname':
+                self._route(healthy)
+            piece,link = self._nextPiece(healthy)
+            if piece == None:
+                if min([len(l.outstanding) for l in healthy]) >= self.window:
+                    break
+                if len(self._queue) >= self.window * len(healthy):
+                    break
+                records = self._spool.read(self.batchsize)
+                if len(records) == 0:
+                    break
+                batch = _Batch(records)
+                self._batches.append(batch)
+                self._queue.append(_Piece(batch, records))
+                continue
+            self._queue.remove(piece)
+            link.send(piece)
+
+    def _pieceDone(self, piece):
+        batch = piece.batch
+        batch.remaining -= 1
+        if batch.remaining == 0:
+            batch.done = True
+        # acknowledge the contiguous run of completed batches
+        while len(self._batches) > 0 and self._batches[0].done:
+            batch = self._batches.popleft()
+            self._spool.ack(batch.last)
+            self.forwardedevents += batch.size
 
 class ForwardOutputPlugin(Plugin):
     implements(IPlugin)
@@ -0,0 +1,305 @@
+# Copyright 2010,2011,2012 Michael Frank <msfrank@syntaxjockey.com>
+#
+# This file is part of Terane.
+#
+# Terane is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Terane is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Terane.  If not, see <http://www.gnu.org/licenses/>.
+
+import os, struct, uuid
+import cPickle as pickle
+from terane.loggers import getLogger
+
+logger = getLogger('terane.outputs.spool')
+
+class SpoolError(Exception):
+    pass
+
+# each record is prefixed with its sequence number and the length of the
+# pickled record data.
+_header = struct.Struct('>QI')
+
+class Spool(object):
+    """
+    A Spool is an on-disk queue of records.  Each record appended to the
+    spool is assigned a monotonically increasing sequence number.  Records
+    stay in the spool until they have been acknowledged, so if the process
+    restarts or the remote peer goes away, unacknowledged records can be
+    read again from the last acknowledged sequence number.
+
+    Records are stored in segment files named after the sequence number of
+    the first record in the segment.  A segment is deleted once every record
+    in it has been acknowledged.
+
+    :param path: The directory where the spool is stored.
+    :type path: str
+    :param segmentsize: The size in bytes at which a new segment is started.
+    :type segmentsize: int
+    """
+
+    def __init__(self, path, segmentsize=64 * 1024 * 1024):
+        self.path = path
+        self.segmentsize = segmentsize
+        self._segments = []
+        self._wfile = None
+        self._wsize = 0
+        self._rfile = None
+        self._rseg = 0
+        self._rseq = None
+        self._dirty = False
+        if not os.path.exists(path):
+            os.makedirs(path)
+        # load the spool source identifier, or create one if necessary
+        sourcepath = os.path.join(path, 'source')
+        try:
+            with open(sourcepath, 'r') as f:
+                self.source = f.read().strip()
+        except (IOError,OSError), e:
+            self.source = uuid.uuid4().hex
+            self._replaceFile(sourcepath, self.source)
+        # load the last acknowledged sequence number
+        try:
+            with open(os.path.join(path, 'acked'), 'r') as f:
+                self.ackedSeq = long(f.read().strip(), 16)
+        except (IOError,OSError), e:
+            self.ackedSeq = 0L
+        except ValueError, e:
+            raise SpoolError("spool %s is corrupt: invalid acked sequence" % path)
+        self._syncedSeq = self.ackedSeq
+        # find all segments
+        for name in os.listdir(path):
+            if not name.endswith('.spool'):
+                continue
+            try:
+                firstseq = long(name[:-6], 16)
+            except ValueError:
+                continue
+            self._segments.append((firstseq, os.path.join(path, name)))
+        self._segments.sort()
+        # determine the last sequence number, truncating any partially
+        # written record at the end of the last segment
+        self.lastSeq = self.ackedSeq
+        if len(self._segments) > 0:
+            firstseq,segpath = self._segments[-1]
+            lastseq,size = self._scanSegment(segpath)
+            if lastseq != None:
+                self.lastSeq = max(self.lastSeq, lastseq)
+            elif firstseq > 0:
+                self.lastSeq = max(self.lastSeq, firstseq - 1)
+            self._wfile = open(segpath, 'ab')
+            self._wsize = size
+        else:
+            self._newSegment(self.lastSeq + 1)
+        # drop any segments which were completely acknowledged before shutdown
+        self._removeAcked()
+        self.rewind()
+        logger.debug("opened spool %s (acked=%i, last=%i, %i segments)" %
+            (path, self.ackedSeq, self.lastSeq, len(self._segments)))
+
+    def _replaceFile(self, path, data):
+        tmppath = path + '.tmp'
+        with open(tmppath, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmppath, path)
+
+    def _scanSegment(self, path):
+        """
+        Scan the segment for the last complete record.  If the segment ends
+        with an incomplete record, then truncate it.
+
+        :returns: A tuple containing the last sequence number (or None if the
+          segment is empty) and the size of the valid data in the segment.
+        :rtype: tuple
+        """
+        lastseq = None
+        valid = 0
+        with open(path, 'rb') as f:
+            total = os.fstat(f.fileno()).st_size
+            while True:
+                header = f.read(_header.size)
+                if len(header) < _header.size:
+                    break
+                seq,length = _header.unpack(header)
+                if valid + _header.size + length > total:
+                    break
+                f.seek(length, os.SEEK_CUR)
+                valid += _header.size + length
+                lastseq = seq
+        if valid < total:
+            logger.info("truncating %i bytes of incomplete data from spool segment %s" %
+                (total - valid, path))
+            with open(path, 'r+b') as f:
+                f.truncate(valid)
+        return lastseq, valid
+
+    def _newSegment(self, firstseq):
+        if self._wfile != None:
+            self._wfile.flush()
+            os.fsync(self._wfile.fileno())
+            self._wfile.close()
+        segpath = os.path.join(self.path, "%016x.spool" % firstseq)
+        self._wfile = open(segpath, 'ab')
+        self._wsize = 0
+        self._segments.append((firstseq, segpath))
+
+    def _removeAcked(self):
+        """
+        Delete every segment except the current one whose records have all
+        been acknowledged.
+        """
+        nremoved = 0
+        while len(self._segments) > 1 and self._segments[1][0] - 1 <= self.ackedSeq:
+            firstseq,segpath = self._segments.pop(0)
+            try:
+                os.unlink(segpath)
+            except (IOError,OSError), e:
+                logger.warning("failed to remove spool segment %s: %s" % (segpath, e))
+            nremoved += 1
+        if nremoved > 0:
+            # keep the read cursor pointing at the same segment
+            if self._rseg < nremoved:
+                if self._rfile != None:
+                    self._rfile.close()
+                self._rfile = None
+                self._rseg = 0
+            else:
+                self._rseg -= nremoved
+
+    def append(self, record):
+        """
+        Append the record to the spool.  The record is not guaranteed to be
+        on disk until sync() is called.
+
+        :param record: The record, which must be picklable.
+        :type record: object
+        :returns: The sequence number assigned to the record.
+        :rtype: long
+        """
+        if self._wfile == None:
+            raise SpoolError("spool %s is closed" % self.path)
+        if self._wsize >= self.segmentsize:
+            self._newSegment(self.lastSeq + 1)
+        seq = self.lastSeq + 1
+        data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        self._wfile.write(_header.pack(seq, len(data)))
+        self._wfile.write(data)
+        self._wsize += _header.size + len(data)
+        self.lastSeq = seq
+        self._dirty = True
+        return seq
+
+    def read(self, count):
+        """
+        Read up to count records starting from the read cursor, and advance
+        the cursor past them.
+
+        :param count: The maximum number of records to read.
+        :type count: int
+        :returns: A list of (seq, record) tuples.
+        :rtype: list
+        """
+        records = []
+        if self._rseq > self.lastSeq:
+            return records
+        # make sure buffered records are visible to the reader
+        self._wfile.flush()
+        while len(records) < count and self._rseg < len(self._segments):
+            if self._rfile == None:
+                self._rfile = open(self._segments[self._rseg][1], 'rb')
+            offset = self._rfile.tell()
+            header = self._rfile.read(_header.size)
+            if len(header) == _header.size:
+                seq,length = _header.unpack(header)
+                data = self._rfile.read(length)
+                if len(data) == length:
+                    if seq >= self._rseq:
+                        records.append((seq, pickle.loads(data)))
+                        self._rseq = seq + 1
+                    continue
+            # we reached the end of the segment
+            if self._rseg == len(self._segments) - 1:
+                self._rfile.seek(offset)
+                break
+            self._rfile.close()
+            self._rfile = None
+            self._rseg += 1
+        return records
+
+    def ack(self, seq):
+        """
+        Acknowledge all records up to and including seq.  Acknowledged records
+        will not be returned by read() again, even after a rewind().  The
+        acknowledgement is not persisted until sync() is called.
+
+        :param seq: The highest contiguous acknowledged sequence number.
+        :type seq: long
+        """
+        if seq == None or seq <= self.ackedSeq:
+            return
+        if seq > self.lastSeq:
+            raise SpoolError("acked sequence %i is past the end of the spool" % seq)
+        self.ackedSeq = seq
+        self._removeAcked()
+
+    def rewind(self):
+        """
+        Move the read cursor back to the first unacknowledged record.
+        """
+        if self._rfile != None:
+            self._rfile.close()
+        self._rfile = None
+        self._rseg = 0
+        self._rseq = self.ackedSeq + 1
+
+    def unread(self):
+        """
+        Returns the number of records after the read cursor.
+        """
+        return self.lastSeq - self._rseq + 1
+
+    def pending(self):
+        """
+        Returns the number of records which have been appended but not yet
+        acknowledged.
+        """
+        return self.lastSeq - self.ackedSeq
+
+    def sync(self):
+        """
+        Flush all appended records to disk, and persist the acknowledged
+        sequence number.
+        """
+        if self._wfile == None:
+            return
+        if self._dirty:
+            self._wfile.flush()
+            os.fsync(self._wfile.fileno())
+            self._dirty = False
+        if self._syncedSeq != self.ackedSeq:
+            self._replaceFile(os.path.join(self.path, 'acked'), "%016x" % self.ackedSeq)
+            self._syncedSeq = self.ackedSeq
+
+    def close(self):
+        """
+        Sync the spool and release all open files.
+        """
+        if self._wfile == None:
+            return
+        self.sync()
+        self._wfile.close()
+        self._wfile = None
+        if self._rfile != None:
+            self._rfile.close()
+        self._rfile = None
+        logger.debug("closed spool %s" % self.path)
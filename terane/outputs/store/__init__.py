@@ -15,17 +15,22 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
+import os, time
 from zope.interface import implements
 from zope.component import getUtility
+from twisted.internet.defer import Deferred, DeferredList, succeed, fail
+from twisted.internet.task import LoopingCall
+from twisted.python.failure import Failure
 from terane.plugins import Plugin, IPlugin
-from terane.sched import IScheduler
+from terane.sched import IScheduler, CLASS_INGEST, CLASS_BACKGROUND
 from terane.bier.event import Contract
 from terane.bier.writing import WriterWorker
 from terane.outputs import Output, IOutput, ISearchable
 from terane.outputs.store.env import Env
 from terane.outputs.store.index import Index
 from terane.outputs.store.logfd import LogFD
+from terane.settings import ConfigureError
+from terane.stats import getVolatileStat, getHistogram, getCounter
 from terane.loggers import getLogger
 
 logger = getLogger('terane.outputs.store')
@@ -39,7 +44,12 @@ class StoreOutput(Output):
         self.setName(name)
         self._fieldstore = fieldstore
         self._index = None
+        self._opening = None
+        self._openFailure = None
+        self._waiters = []
         self._contract = Contract().sign()
+        self._writetime = getHistogram('terane.output.write.seconds', output=name)
+        self._writtenevents = getCounter('terane.output.written.events', output=name)
 
     def configure(self, section):
         self._indexName = section.getString("index name", self.name)
@@ -49,42 +59,155 @@ class StoreOutput(Output):
         self._segRotation = section.getInt("segment rotation policy", 0)
         self._segRetention = section.getInt("segment retention policy", 0)
         self._segOptimize = section.getBoolean("optimize segments", False)
+        self._columns = [unicode(f) for f in section.getList(str, "columnar fields", []) if f != ""]
+        self._maxOpenSegments = section.getInt("max open segments", 64)
+        if self._maxOpenSegments < 0:
+            raise ConfigureError("[output:%s] max open segments must be greater than or equal to 0" % self.name)
+        self._compressThreshold = section.getInt("event compression threshold", 256)
+        if self._compressThreshold < 0:
+            raise ConfigureError("[output:%s] event compression threshold must be greater than or equal to 0" % self.name)
+        self._blockSize = section.getInt("event block size", 65536)
+        if self._blockSize < 0:
+            raise ConfigureError("[output:%s] event block size must be greater than or equal to 0" % self.name)
+        self._warmingBufferSize = section.getInt("warming buffer size", 65536)
+        if self._warmingBufferSize < 0:
+            raise ConfigureError("[output:%s] warming buffer size must be greater than or equal to 0" % self.name)
         
     def startService(self):
-        self._task = getUtility(IScheduler).addTask("output:%s" % self.name)
+        self._task = getUtility(IScheduler).addTask("output:%s" % self.name, schedclass=CLASS_INGEST)
         self._index = Index(self)
-        logger.debug("[output:%s] opened index '%s'" % (self.name,self._indexName))
+        self._openFailure = None
+        self._pending = []
+        self._pendingCount = 0
+        # load the schema and segments in a thread, so the server can start
+        # accepting events and queries right away.  events received in the
+        # meantime are buffered until the index is ready.
+        self._opening = getUtility(IScheduler).deferToThread(CLASS_BACKGROUND, self._index.open)
+        self._opening.addCallbacks(self._indexOpened, self._indexFailed)
+        logger.debug("[output:%s] opening index '%s'" % (self.name,self._indexName))
         Output.startService(self)
 
     def stopService(self):
+        Output.stopService(self)
+        # if the index is still opening, close it once open() returns
+        if self._opening != None:
+            d = Deferred()
+            self._waiters.append(d)
+            return d.addBoth(lambda result: self._closeIndex())
+        self._closeIndex()
+
+    def _closeIndex(self):
         if self._index != None:
             self._index.close()
-        logger.debug("[output:%s] closed index '%s'" % (self.name,self._indexName))
-        self._index = None
-        return Output.stopService(self)
+            self._index = None
+            logger.debug("[output:%s] closed index '%s'" % (self.name,self._indexName))
+
+    def _indexOpened(self, result):
+        self._opening = None
+        logger.info("[output:%s] index '%s' is ready" % (self.name,self._indexName))
+        # write the events which were received while the index was opening
+        pending = self._pending
+        self._pending = []
+        self._pendingCount = 0
+        for events,written in pending:
+            if self.running:
+                self._writeEvents(events).chainDeferred(written)
+            else:
+                written.errback(Failure(Exception("[output:%s] output is not running" % self.name)))
+        self._notifyWaiters(self._index)
+
+    def _indexFailed(self, failure):
+        self._opening = None
+        self._openFailure = failure
+        logger.error("[output:%s] failed to open index '%s': %s" % (self.name,self._indexName,failure.getErrorMessage()))
+        if self._pendingCount > 0:
+            logger.warning("[output:%s] discarded %i events received while opening index" % (self.name,self._pendingCount))
+        for events,written in self._pending:
+            written.errback(failure)
+        self._pending = []
+        self._pendingCount = 0
+        self._notifyWaiters(failure)
+
+    def _notifyWaiters(self, result):
+        waiters = self._waiters
+        self._waiters = []
+        for d in waiters:
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+    def whenReady(self):
+        """
+        Returns a Deferred which fires with the Index once it has been opened,
+        or fails if the index could not be opened.
+
+        :returns: The Deferred.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        if self._opening != None:
+            d = Deferred()
+            self._waiters.append(d)
+            return d
+        if self._openFailure != None:
+            return fail(self._openFailure)
+        return succeed(self._index)
 
     def getContract(self):
         return self._contract
 
     def receiveEvent(self, event):
+        # nobody waits for the write, and failures are already logged
+        self.receiveEvents([event]).addErrback(lambda failure: None)
+
+    def receiveEvents(self, events):
         # if the output is not running, discard any received events
         if not self.running:
-            return
-        # store the event in the index
-        worker = self._task.addWorker(WriterWorker(event, self._index))
+            return fail(Exception("[output:%s] output is not running" % self.name))
+        # if the index is still opening, buffer the events until it is ready
+        if self._opening != None:
+            if self._warmingBufferSize > 0 and self._pendingCount + len(events) > self._warmingBufferSize:
+                logger.warning("[output:%s] index is warming, dropped %i events" % (self.name,len(events)))
+                return fail(Exception("[output:%s] index is warming, dropped %i events" % (self.name,len(events))))
+            written = Deferred()
+            self._pending.append((events, written))
+            self._pendingCount += len(events)
+            return written
+        # if the index failed to open, discard the events
+        if self._openFailure != None:
+            return fail(self._openFailure)
+        return self._writeEvents(events)
+
+    def _writeEvents(self, events):
+        """
+        Store the events in the index.  Returns a Deferred which fires once
+        the write has committed.
+        """
+        worker = self._task.addWorker(WriterWorker(events, self._index))
+        written = Deferred()
         # rotate the index segments if necessary
         d = worker.whenDone()
-        d.addCallbacks(self._rotateSegments, self._writeError)
+        d.addCallbacks(self._rotateSegments, self._writeError,
+            callbackArgs=(time.time(), written), errbackArgs=(written,))
+        return written
     
-    def _rotateSegments(self, worker):
-        logger.debug("[output:%s] wrote event to index" % self.name)
-        try:
-            self._index.rotateSegments(self._segRotation, self._segRetention)
-        except Exception, e:
-            logger.exception(e)
+    def _rotateSegments(self, worker, start, written):
+        self._writetime.since(start)
+        self._writtenevents += len(worker.events)
+        logger.debug("[output:%s] wrote %i events to index" % (self.name,len(worker.events)))
+        written.callback(None)
+        # rotation reads and writes the index, so run it in a thread
+        if self._segRotation > 0 and self._index != None:
+            d = self._task.deferToThread(self._index.rotateSegments,
+                self._segRotation, self._segRetention)
+            d.addErrback(self._rotateError)
+
+    def _rotateError(self, failure):
+        logger.error("[output:%s] failed to rotate segments: %s" % (self.name, failure.getErrorMessage()))
 
-    def _writeError(self, failure):
-        logger.error("[output:%s] failed to write event: %s" % (self.name, failure))
+    def _writeError(self, failure, written):
+        logger.error("[output:%s] failed to write events: %s" % (self.name, failure))
+        written.errback(failure)
 
     def getIndex(self):
         return self._index
@@ -99,6 +222,8 @@ class StoreOutputPlugin(Plugin):
         Plugin.__init__(self)
         self._env = None
         self._outputs = {}
+        self._envstats = None
+        self._envstatsPending = None
 
     def configure(self, section):
         """
@@ -111,6 +236,26 @@ class StoreOutputPlugin(Plugin):
         self._options['max locks'] = long(section.getInt('max locks', 65536))
         self._options['max objects'] = long(section.getInt('max objects', 65536))
         self._options['max transactions'] = long(section.getInt('max transactions', 0))
+        self._options['txn write nosync'] = long(section.getBoolean('txn write nosync', False))
+        self._options['log buffer size'] = long(section.getInt('log buffer size', 0))
+        self._options['log file size'] = long(section.getInt('log file size', 0))
+        self._options['mmap size'] = long(section.getInt('mmap size', 0))
+        pagesize = section.getInt('segment page size', 0)
+        if pagesize != 0 and (pagesize < 512 or pagesize > 65536 or pagesize & (pagesize - 1)):
+            raise ConfigureError("[%s] segment page size must be a power of 2 between 512 and 65536" % self.name)
+        self._options['segment page size'] = long(pagesize)
+        self._options['checkpoint interval'] = long(section.getInt('checkpoint interval', 60))
+        self._options['checkpoint volume'] = long(section.getInt('checkpoint volume', 0))
+        self._options['trickle percent'] = long(section.getInt('trickle percent', 20))
+        if self._options['trickle percent'] > 100:
+            raise ConfigureError("[%s] trickle percent must be between 0 and 100" % self.name)
+        for option in ('log buffer size', 'log file size', 'mmap size', 'checkpoint interval',
+          'checkpoint volume', 'trickle percent'):
+            if self._options[option] < 0:
+                raise ConfigureError("[%s] %s must be greater than or equal to 0" % (self.name, option))
+        self._envstatsinterval = section.getInt('env stats interval', 10)
+        if self._envstatsinterval < 0:
+            raise ConfigureError("[%s] env stats interval must be greater than or equal to 0" % self.name)
 
     def startService(self):
         """
@@ -122,6 +267,11 @@ class StoreOutputPlugin(Plugin):
         # open the db environment
         self._env = Env(self._dbdir, self._options)
         logger.debug("[%s] opened database environment in %s" % (self.name,self._dbdir))
+        # periodically copy the environment statistics into the stats registry,
+        # so reading them never touches the environment.
+        if self._envstatsinterval > 0:
+            self._envstats = LoopingCall(self._updateEnvStats)
+            self._envstats.start(self._envstatsinterval)
         Plugin.startService(self)
 
     def stopService(self):
@@ -129,8 +279,51 @@ class StoreOutputPlugin(Plugin):
         Stop the database service, closing all open indices.
         """
         Plugin.stopService(self)
-        # close the DB environment
+        if self._envstats != None:
+            self._envstats.stop()
+            self._envstats = None
+        # wait until every index has finished opening and the environment
+        # stats are read, since both use the environment from a thread
+        pending = [output.whenReady() for output in self._outputs.values()]
+        if self._envstatsPending != None:
+            pending.append(self._envstatsPending)
+        d = DeferredList(pending, consumeErrors=True)
+        return d.addCallback(lambda result: self._closeEnv())
+
+    def _closeEnv(self):
+        """
+        Close any indices which are still open, then close the DB environment.
+        """
+        for output in self._outputs.values():
+            if output.running:
+                output.stopService()
+            output._closeIndex()
         self._env.close()
+        self._env = None
         self._logfd.stopReading()
         self._logfd = None
         logger.debug("[%s] closed database environment" % self.name)
+
+    def _updateEnvStats(self):
+        """
+        Retrieve the DB environment statistics in a thread, then store them
+        as volatile stats named terane.output.store.env.<statistic>.
+        """
+        def _setStats(envstats):
+            for name,value in envstats.items():
+                stat = getVolatileStat("terane.output.store.env.%s" % name.replace('_', ''), 0)
+                stat <<= value
+            lookups = envstats['cache_hit'] + envstats['cache_miss']
+            hitratio = getVolatileStat("terane.output.store.env.cachehitratio", 0.0)
+            hitratio <<= float(envstats['cache_hit']) / lookups if lookups > 0 else 0.0
+        def _statsError(failure):
+            logger.warning("[%s] failed to get environment stats: %s" % (self.name, failure.getErrorMessage()))
+        def _statsDone(result):
+            self._envstatsPending = None
+        if self._env == None:
+            return
+        d = getUtility(IScheduler).deferToThread(CLASS_BACKGROUND, self._env.get_stats)
+        d.addCallbacks(_setStats, _statsError)
+        self._envstatsPending = d
+        d.addBoth(_statsDone)
+        return d
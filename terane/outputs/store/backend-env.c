@@ -30,32 +30,44 @@ _Env_dealloc (terane_Env *self)
 }
 
 /*
- * _Env_checkpoint_thread: perform a checkpoint every minute.
+ * _Env_checkpoint_thread: the environment maintenance thread.  Once a second
+ *  it writes dirty cache pages until trickle_percent of the pages are clean,
+ *  so checkpoints and cache evictions find less to write.  A checkpoint is
+ *  performed every checkpoint_interval seconds, and whenever checkpoint_kbytes
+ *  of log data have been written since the last checkpoint.  Deadlocks are
+ *  detected by BerkeleyDB as soon as a lock request blocks, so this thread
+ *  doesn't need to run the deadlock detector.
  */
 static void *
 _Env_checkpoint_thread (void *ptr)
 {
     terane_Env *env = (terane_Env *) ptr;
-    int dbret;
+    uint32_t elapsed = 0;
+    int dbret, nwrote;
 
     /* enable deferred cancellation */
     pthread_setcancelstate (PTHREAD_CANCEL_ENABLE, NULL);
     pthread_setcanceltype (PTHREAD_CANCEL_DEFERRED, NULL);
-    /* loop once a minute */
+    /* loop once a second */
     for (;;) {
-        int rejected = 0;
-        /* run the deadlock detector */
-        dbret = env->env->lock_detect (env->env, 0, DB_LOCK_MINLOCKS, &rejected);
-        if (dbret != 0)
-            terane_log_msg (TERANE_LOG_ERROR, "terane.outputs.store.backend",
-                "lock_detect failed: %s", db_strerror (dbret));
-        else if (rejected > 0)
-            terane_log_msg (TERANE_LOG_DEBUG, "terane.outputs.store.backend",
-                "lock_detect rejected %i requests", rejected);
-        /* sleep for a minute */
-        sleep (60);
-        /* perform a checkpoint */
-        dbret = env->env->txn_checkpoint (env->env, 0, 0, 0);
+        /* sleep for a second */
+        sleep (1);
+        elapsed++;
+        /* write dirty pages in the background */
+        if (env->trickle_percent > 0) {
+            dbret = env->env->memp_trickle (env->env, env->trickle_percent, &nwrote);
+            if (dbret != 0)
+                terane_log_msg (TERANE_LOG_ERROR, "terane.outputs.store.backend",
+                    "memp_trickle failed: %s", db_strerror (dbret));
+        }
+        /* perform a checkpoint if the interval has passed */
+        if (env->checkpoint_interval > 0 && elapsed % env->checkpoint_interval == 0)
+            dbret = env->env->txn_checkpoint (env->env, 0, 0, 0);
+        /* otherwise only checkpoint if enough log data has been written */
+        else if (env->checkpoint_kbytes > 0)
+            dbret = env->env->txn_checkpoint (env->env, env->checkpoint_kbytes, 0, 0);
+        else
+            dbret = 0;
         if (dbret != 0)
             terane_log_msg (TERANE_LOG_ERROR, "terane.outputs.store.backend", "txn_checkpoint failed: %s",
                 db_strerror (dbret));
@@ -228,6 +240,84 @@ _Env_init (terane_Env *self, PyObject *args, PyObject *kwds)
     if (self->env->get_tx_max (self->env, &u32) == 0)
         terane_log_msg (TERANE_LOG_DEBUG, "terane.outputs.store.backend",
             "environment max transactions is %i", u32);
+    /* don't flush the log on commit.  committed transactions are durable
+     * against a process crash, but not against an operating system crash. */
+    if ((value = PyDict_GetItemString (options, "txn write nosync")) && PyLong_Check (value)) {
+        dbret = self->env->set_flags (self->env, DB_TXN_WRITE_NOSYNC,
+            PyLong_AsLong (value) ? 1 : 0);
+        if (dbret != 0) {
+            PyErr_Format (terane_Exc_Error, "Failed to set DB_TXN_WRITE_NOSYNC: %s", db_strerror (dbret));
+            goto error;
+        }
+    }
+    /* set the in-memory log buffer size */
+    if ((value = PyDict_GetItemString (options, "log buffer size")) && PyLong_Check (value)) {
+        u32 = (u_int32_t) PyLong_AsLong (value);
+        if (u32 > 0) {
+            dbret = self->env->set_lg_bsize (self->env, u32);
+            if (dbret != 0) {
+                PyErr_Format (terane_Exc_Error, "Failed to set log buffer size: %s", db_strerror (dbret));
+                goto error;
+            }
+        }
+    }
+    if (self->env->get_lg_bsize (self->env, &u32) == 0)
+        terane_log_msg (TERANE_LOG_DEBUG, "terane.outputs.store.backend",
+            "environment log buffer size is %u bytes", u32);
+    /* set the maximum size of a single log file */
+    if ((value = PyDict_GetItemString (options, "log file size")) && PyLong_Check (value)) {
+        u32 = (u_int32_t) PyLong_AsLong (value);
+        if (u32 > 0) {
+            dbret = self->env->set_lg_max (self->env, u32);
+            if (dbret != 0) {
+                PyErr_Format (terane_Exc_Error, "Failed to set log file size: %s", db_strerror (dbret));
+                goto error;
+            }
+        }
+    }
+    if (self->env->get_lg_max (self->env, &u32) == 0)
+        terane_log_msg (TERANE_LOG_DEBUG, "terane.outputs.store.backend",
+            "environment log file size is %u bytes", u32);
+    /* set the maximum size of a read-only database file to map into memory */
+    if ((value = PyDict_GetItemString (options, "mmap size")) && PyLong_Check (value)) {
+        u64 = PyLong_AsUnsignedLongLong (value);
+        if (u64 > 0) {
+            dbret = self->env->set_mp_mmapsize (self->env, (size_t) u64);
+            if (dbret != 0) {
+                PyErr_Format (terane_Exc_Error, "Failed to set mmap size: %s", db_strerror (dbret));
+                goto error;
+            }
+        }
+    }
+    /* remember the page size to use when creating segments */
+    if ((value = PyDict_GetItemString (options, "segment page size")) && PyLong_Check (value))
+        self->segment_pagesize = (uint32_t) PyLong_AsLong (value);
+    else
+        self->segment_pagesize = 0;
+    /* set the percentage of cache pages the maintenance thread keeps clean */
+    if ((value = PyDict_GetItemString (options, "trickle percent")) && PyLong_Check (value))
+        self->trickle_percent = (int) PyLong_AsLong (value);
+    else
+        self->trickle_percent = 0;
+    /* run the deadlock detector whenever a lock request conflicts */
+    dbret = self->env->set_lk_detect (self->env, DB_LOCK_MINLOCKS);
+    if (dbret != 0) {
+        PyErr_Format (terane_Exc_Error, "Failed to enable deadlock detection: %s",
+            db_strerror (dbret));
+        goto error;
+    }
+    /* set the checkpoint frequency */
+    if ((value = PyDict_GetItemString (options, "checkpoint interval")) && PyLong_Check (value))
+        self->checkpoint_interval = (uint32_t) PyLong_AsLong (value);
+    else
+        self->checkpoint_interval = 60;
+    if ((value = PyDict_GetItemString (options, "checkpoint volume")) && PyLong_Check (value))
+        self->checkpoint_kbytes = (uint32_t) PyLong_AsLong (value);
+    else
+        self->checkpoint_kbytes = 0;
+    terane_log_msg (TERANE_LOG_DEBUG, "terane.outputs.store.backend",
+        "checkpoint interval is %u seconds, checkpoint volume is %u kilobytes, trickle percent is %i",
+        self->checkpoint_interval, self->checkpoint_kbytes, self->trickle_percent);
     /* set db log management parameters */
     dbret = self->env->log_set_config (self->env, DB_LOG_AUTO_REMOVE, 1);
     if (dbret != 0) {
@@ -244,15 +334,15 @@ _Env_init (terane_Env *self, PyObject *args, PyObject *kwds)
             db_strerror (dbret));
         goto error;
     }
-    /* start the checkpoint thread */
+    /* start the maintenance thread */
     dbret = pthread_create (&self->checkpoint_thread, NULL, _Env_checkpoint_thread, self);
     if (dbret != 0) {
-        PyErr_Format (terane_Exc_Error, "Failed to start checkpoint thread: %s",
+        PyErr_Format (terane_Exc_Error, "Failed to start maintenance thread: %s",
             strerror (dbret));
     }
     else
         terane_log_msg (TERANE_LOG_DEBUG, "terane.outputs.store.backend",
-            "started checkpoint thread (tid %i)", self->checkpoint_thread);
+            "started maintenance thread (tid %i)", self->checkpoint_thread);
 
     return 0;
 
@@ -294,10 +384,81 @@ terane_Env_close (terane_Env *self)
     Py_RETURN_NONE;
 }
 
+/*
+ * terane_Env_get_stats: return memory pool, lock, log and transaction
+ *  statistics for the DB environment.
+ *
+ * callspec: Env.get_stats()
+ * parameters: None
+ * returns: A dict mapping statistic names to integer values.
+ * exceptions:
+ *  terane.outputs.store.backend:Error: failed to retrieve the statistics
+ */
+PyObject *
+terane_Env_get_stats (terane_Env *self)
+{
+    DB_MPOOL_STAT *mpstat = NULL;
+    DB_LOCK_STAT *lkstat = NULL;
+    DB_LOG_STAT *lgstat = NULL;
+    DB_TXN_STAT *txstat = NULL;
+    PyObject *stats = NULL;
+    int dbret;
+
+    if (self->env == NULL)
+        return PyErr_Format (terane_Exc_Error, "Failed to get stats: DB_ENV handle is NULL");
+    /* the stat calls only hold the region mutexes, not any database locks */
+    Py_BEGIN_ALLOW_THREADS
+    dbret = self->env->memp_stat (self->env, &mpstat, NULL, 0);
+    if (dbret == 0)
+        dbret = self->env->lock_stat (self->env, &lkstat, 0);
+    if (dbret == 0)
+        dbret = self->env->log_stat (self->env, &lgstat, 0);
+    if (dbret == 0)
+        dbret = self->env->txn_stat (self->env, &txstat, 0);
+    Py_END_ALLOW_THREADS
+    if (dbret != 0) {
+        PyErr_Format (terane_Exc_Error, "Failed to get stats: %s", db_strerror (dbret));
+        goto cleanup;
+    }
+    stats = Py_BuildValue ("{s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K}",
+        "cache_hit", (unsigned PY_LONG_LONG) mpstat->st_cache_hit,
+        "cache_miss", (unsigned PY_LONG_LONG) mpstat->st_cache_miss,
+        "page_in", (unsigned PY_LONG_LONG) mpstat->st_page_in,
+        "page_out", (unsigned PY_LONG_LONG) mpstat->st_page_out,
+        "page_trickle", (unsigned PY_LONG_LONG) mpstat->st_page_trickle,
+        "page_dirty", (unsigned PY_LONG_LONG) mpstat->st_page_dirty,
+        "lock_requests", (unsigned PY_LONG_LONG) lkstat->st_nrequests,
+        "lock_wait", (unsigned PY_LONG_LONG) lkstat->st_lock_wait,
+        "lock_nowait", (unsigned PY_LONG_LONG) lkstat->st_lock_nowait,
+        "lock_deadlocks", (unsigned PY_LONG_LONG) lkstat->st_ndeadlocks,
+        "lock_timeouts", (unsigned PY_LONG_LONG) lkstat->st_nlocktimeouts,
+        "locks", (unsigned PY_LONG_LONG) lkstat->st_nlocks,
+        "log_bytes", ((unsigned PY_LONG_LONG) lgstat->st_w_mbytes * 1024 * 1024)
+            + (unsigned PY_LONG_LONG) lgstat->st_w_bytes,
+        "log_syncs", (unsigned PY_LONG_LONG) lgstat->st_scount,
+        "txn_begins", (unsigned PY_LONG_LONG) txstat->st_nbegins,
+        "txn_commits", (unsigned PY_LONG_LONG) txstat->st_ncommits,
+        "txn_aborts", (unsigned PY_LONG_LONG) txstat->st_naborts,
+        "txn_active", (unsigned PY_LONG_LONG) txstat->st_nactive);
+
+cleanup:
+    /* the stat structures are allocated by BDB using malloc */
+    if (mpstat)
+        free (mpstat);
+    if (lkstat)
+        free (lkstat);
+    if (lgstat)
+        free (lgstat);
+    if (txstat)
+        free (txstat);
+    return stats;
+}
+
 /* Env methods declaration */
 PyMethodDef _Env_methods[] =
 {
     { "close", (PyCFunction) terane_Env_close, METH_NOARGS, "Close the DB Environment." },
+    { "get_stats", (PyCFunction) terane_Env_get_stats, METH_NOARGS, "Get DB Environment statistics." },
     { NULL, NULL, 0, NULL }
 };
 
@@ -136,6 +136,7 @@ terane_Iter_new (PyObject *             parent,
     iter->prefix = NULL;
     memset (&iter->range, 0, sizeof (DBT));
     iter->reverse = reverse;
+    iter->keysonly = 0;
     return (PyObject *) iter;
 }
 
@@ -355,6 +356,20 @@ _Iter_cmp (terane_iterkey *lhs, DBT *rhs, int *result)
     return ret;
 }
 
+/*
+ * _Iter_init_data: initialize the DBT which receives the item data.  If the
+ *  iterator only yields keys, then request a zero-length partial read, so
+ *  the data is never copied out of the database.
+ */
+static void
+_Iter_init_data (terane_Iter *iter, DBT *data)
+{
+    memset (data, 0, sizeof (DBT));
+    data->flags = DB_DBT_MALLOC;
+    if (iter->keysonly)
+        data->flags |= DB_DBT_PARTIAL;
+}
+
 /*
  * _Iter_load:
  */
@@ -366,8 +381,12 @@ _Iter_load (terane_Iter *iter, DBT *key, DBT *data)
     /* load the key */
     if (_terane_msgpack_load ((char *) key->data, key->size, &_key) < 0)
         goto error;
-    /* load the data */
-    if (_terane_msgpack_load ((char *) data->data, data->size, &_data) < 0)
+    /* load the data, unless the iterator only yields keys */
+    if (iter->keysonly) {
+        _data = Py_None;
+        Py_INCREF (_data);
+    }
+    else if (_terane_msgpack_load ((char *) data->data, data->size, &_data) < 0)
         goto error;
     /* build the (posting,value) tuple */
     tuple = PyTuple_Pack (2, _key, _data);
@@ -396,8 +415,7 @@ _Iter_get (terane_Iter *iter, int itype, int flags, DBT *range_key)
     key.flags = DB_DBT_MALLOC;
 
     /* get the next cursor item with the GIL released */
-    memset (&data, 0, sizeof (DBT));
-    data.flags = DB_DBT_MALLOC;
+    _Iter_init_data (iter, &data);
     Py_BEGIN_ALLOW_THREADS
     dbret = iter->cursor->get (iter->cursor, &key, &data, flags);    
     Py_END_ALLOW_THREADS
@@ -418,8 +436,7 @@ _Iter_get (terane_Iter *iter, int itype, int flags, DBT *range_key)
                     /* set the cursor to the last item */
                     memset (&key, 0, sizeof (DBT));
                     key.flags = DB_DBT_MALLOC;
-                    memset (&data, 0, sizeof (DBT));
-                    data.flags = DB_DBT_MALLOC;
+                    _Iter_init_data (iter, &data);
                     Py_BEGIN_ALLOW_THREADS
                     dbret = iter->cursor->get (iter->cursor, &key, &data, DB_LAST);
                     Py_END_ALLOW_THREADS
@@ -442,8 +459,7 @@ _Iter_get (terane_Iter *iter, int itype, int flags, DBT *range_key)
                 /* set the cursor to the last item */
                 memset (&key, 0, sizeof (DBT));
                 key.flags = DB_DBT_MALLOC;
-                memset (&data, 0, sizeof (DBT));
-                data.flags = DB_DBT_MALLOC;
+                _Iter_init_data (iter, &data);
                 Py_BEGIN_ALLOW_THREADS
                 dbret = iter->cursor->get (iter->cursor, &key, &data, DB_PREV);
                 Py_END_ALLOW_THREADS
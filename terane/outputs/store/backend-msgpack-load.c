@@ -429,6 +429,211 @@ _msgpack_load_object (char *        buf,
     return -1;
 }
 
+/*
+ * _msgpack_skip_object: advance pos past the next object in the buffer
+ *  without creating any python objects.
+ */
+static int
+_msgpack_skip_object (char *        buf,
+                      uint32_t      len,
+                      char **       pos)
+{
+    terane_value val;
+    int ret;
+    unsigned char type;
+    terane_conv *conv;
+    uint32_t size, i;
+    int ismap;
+
+    ret = _terane_msgpack_load_value (buf, len, pos, &val);
+    /* scalar values have already been skipped */
+    if (ret == -1 || ret > 0)
+        return ret;
+    if (ret == 0) {
+        PyErr_Format (PyExc_ValueError, "unexpected end of data");
+        return -1;
+    }
+
+    /* otherwise skip a complex type */
+    type = (unsigned char) **pos;
+    *pos += 1;
+
+    switch (type) {
+        /* array 16, map 16 */
+        case 0xdc:
+        case 0xde:
+            if (!CONTAINS_BYTES(buf, len, pos, 2))
+                return -1;
+            conv = (terane_conv *) *pos;
+            *pos += 2;
+            size = NTOHS(conv->u16);
+            ismap = (type == 0xde);
+            break;
+        /* array 32, map 32 */
+        case 0xdd:
+        case 0xdf:
+            if (!CONTAINS_BYTES(buf, len, pos, 4))
+                return -1;
+            conv = (terane_conv *) *pos;
+            *pos += 4;
+            size = NTOHL(conv->u32);
+            ismap = (type == 0xdf);
+            break;
+        default:
+            /* FixArray */
+            if ((type & 0xf0) == 0x90) {
+                size = type & 0x0f;
+                ismap = 0;
+            }
+            /* FixMap */
+            else if ((type & 0xf0) == 0x80) {
+                size = type & 0x0f;
+                ismap = 1;
+            }
+            /* we don't know how to handle this type */
+            else {
+                PyErr_Format (PyExc_ValueError, "unable to skip data with type %x", (int) type);
+                return -1;
+            }
+            break;
+    }
+    /* a map contains two objects for each item */
+    if (ismap)
+        size *= 2;
+    for (i = 0; i < size; i++) {
+        if (_msgpack_skip_object (buf, len, pos) < 0)
+            return -1;
+    }
+    return 1;
+}
+
+/*
+ * _terane_msgpack_load_fields: deserialize a buffer containing a map into a
+ *  python dict, keeping only the items whose key is one of the unicode or
+ *  string objects in the fields sequence.  The values of all other items are
+ *  skipped over without being converted into python objects.
+ */
+int
+_terane_msgpack_load_fields (char *buf, uint32_t len, PyObject *fields, PyObject **dest)
+{
+    PyObject *seq = NULL, *names = NULL, *name, *dict = NULL, *key = NULL, *value = NULL;
+    Py_ssize_t nnames, i;
+    char *pos = buf;
+    terane_value val;
+    terane_conv *conv;
+    unsigned char type;
+    uint32_t size, n;
+    int found;
+
+    /* convert the field names to utf-8, so they can be compared with the raw keys */
+    seq = PySequence_Fast (fields, "fields must be a sequence");
+    if (seq == NULL)
+        return -1;
+    nnames = PySequence_Fast_GET_SIZE (seq);
+    names = PyList_New (nnames);
+    if (names == NULL)
+        goto error;
+    for (i = 0; i < nnames; i++) {
+        name = PySequence_Fast_GET_ITEM (seq, i);
+        if (PyUnicode_Check (name))
+            name = PyUnicode_AsUTF8String (name);
+        else if (PyString_Check (name))
+            Py_INCREF (name);
+        else {
+            PyErr_Format (PyExc_TypeError, "field names must be unicode or str");
+            goto error;
+        }
+        if (name == NULL)
+            goto error;
+        PyList_SET_ITEM (names, i, name);
+    }
+
+    /* read the map header */
+    if (len < 1) {
+        PyErr_Format (PyExc_ValueError, "unexpected end of data");
+        goto error;
+    }
+    type = (unsigned char) *pos;
+    pos += 1;
+    if (type == 0xde) {
+        if (!CONTAINS_BYTES(buf, len, &pos, 2))
+            goto truncated;
+        conv = (terane_conv *) pos;
+        pos += 2;
+        size = NTOHS(conv->u16);
+    }
+    else if (type == 0xdf) {
+        if (!CONTAINS_BYTES(buf, len, &pos, 4))
+            goto truncated;
+        conv = (terane_conv *) pos;
+        pos += 4;
+        size = NTOHL(conv->u32);
+    }
+    else if ((type & 0xf0) == 0x80)
+        size = type & 0x0f;
+    else {
+        PyErr_Format (PyExc_ValueError, "data is not a map");
+        goto error;
+    }
+
+    dict = PyDict_New ();
+    if (dict == NULL)
+        goto error;
+    for (n = 0; n < size; n++) {
+        /* compare the raw key against each field name */
+        if (_terane_msgpack_load_value (buf, len, &pos, &val) <= 0)
+            goto truncated;
+        if (val.type != TERANE_MSGPACK_TYPE_RAW) {
+            PyErr_Format (PyExc_ValueError, "map key is not a string");
+            goto error;
+        }
+        found = 0;
+        for (i = 0; i < nnames && !found; i++) {
+            name = PyList_GET_ITEM (names, i);
+            if (PyString_GET_SIZE (name) == val.data.raw.size &&
+              !memcmp (PyString_AS_STRING (name), val.data.raw.bytes, val.data.raw.size))
+                found = 1;
+        }
+        /* skip the value if we don't want it */
+        if (!found) {
+            if (_msgpack_skip_object (buf, len, &pos) < 0)
+                goto truncated;
+            continue;
+        }
+        key = PyUnicode_DecodeUTF8 (val.data.raw.bytes, val.data.raw.size, "strict");
+        if (key == NULL)
+            goto error;
+        if (_msgpack_load_object (buf, len, &pos, &value) <= 0)
+            goto truncated;
+        if (PyDict_SetItem (dict, key, value) < 0)
+            goto error;
+        Py_DECREF (key);
+        Py_DECREF (value);
+        key = NULL;
+        value = NULL;
+    }
+    Py_DECREF (seq);
+    Py_DECREF (names);
+    *dest = dict;
+    return 0;
+
+truncated:
+    if (!PyErr_Occurred ())
+        PyErr_Format (PyExc_ValueError, "unexpected end of data");
+error:
+    if (seq)
+        Py_DECREF (seq);
+    if (names)
+        Py_DECREF (names);
+    if (dict)
+        Py_DECREF (dict);
+    if (key)
+        Py_DECREF (key);
+    if (value)
+        Py_DECREF (value);
+    return -1;
+}
+
 /*
  * _terane_msgpack_load: deserialize a buffer into a python object.
  */
@@ -18,14 +18,401 @@
  */
 
 #include "backend.h"
+#include <zlib.h>
+
+/*
+ * an event record is either the serialized event, or begins with a byte
+ * which is never used by msgpack, followed by a byte identifying the record
+ * format:
+ *
+ *  TERANE_EVENT_FORMAT_ZLIB: the length of the serialized event as a 32-bit
+ *   big-endian integer, followed by the zlib stream of the serialized event.
+ *  TERANE_EVENT_FORMAT_BLOCK: nothing follows; the event is packed into the
+ *   block with the greatest identifier which is less than or equal to the
+ *   event identifier.
+ *
+ * a block contains events in event identifier order, each as the length of
+ * the serialized event identifier as a 16-bit big-endian integer, the length
+ * of the serialized event as a 32-bit big-endian integer, the serialized
+ * event identifier and the serialized event.  the block identifier is the
+ * serialized identifier of the first event in the block, and is the key of
+ * the block in the blocks DB.  blocks are stored in the same formats as
+ * events; an uncompressed block begins with the high byte of the 16-bit
+ * length, which is never the marker.  blocks never overlap, because events
+ * are only packed after the last packed event.
+ */
+#define TERANE_EVENT_MARKER         0xc1
+#define TERANE_EVENT_FORMAT_ZLIB    1
+#define TERANE_EVENT_FORMAT_BLOCK   2
+#define TERANE_EVENT_HEADER_SIZE    6
+#define TERANE_BLOCK_ENTRY_SIZE     6
+
+static void
+_put_uint32 (char *buf, uint32_t n)
+{
+    buf[0] = (char) ((n >> 24) & 0xff);
+    buf[1] = (char) ((n >> 16) & 0xff);
+    buf[2] = (char) ((n >> 8) & 0xff);
+    buf[3] = (char) (n & 0xff);
+}
+
+static uint32_t
+_get_uint32 (const char *buf)
+{
+    const unsigned char *u = (const unsigned char *) buf;
+    return ((uint32_t) u[0] << 24) | ((uint32_t) u[1] << 16) |
+        ((uint32_t) u[2] << 8) | (uint32_t) u[3];
+}
+
+/*
+ * _grow: resize the buffer in buf to the specified size.  If the buffer can't
+ *  be resized, then buf is unchanged.  Returns 0 on success, or -1 if memory
+ *  could not be allocated.
+ */
+static int
+_grow (void **buf, size_t size)
+{
+    void *p = PyMem_Realloc (*buf, size);
+
+    if (p == NULL)
+        return -1;
+    *buf = p;
+    return 0;
+}
+
+/*
+ * _event_format: return the format of the record in buf, or 0 if the record
+ *  is a serialized event.
+ */
+static int
+_event_format (char *buf, uint32_t len)
+{
+    if (len < 2 || (unsigned char) buf[0] != TERANE_EVENT_MARKER)
+        return 0;
+    return (unsigned char) buf[1];
+}
+
+/*
+ * _event_compress: compress the data in buf with the specified zlib level.
+ *  If the compressed data is smaller than the original, then buf and len are
+ *  replaced with the compressed record and the original buffer is freed.
+ *  Returns 0 on success, or -1 if memory could not be allocated.
+ */
+static int
+_event_compress (char **buf, uint32_t *len, int level)
+{
+    uLongf size;
+    char *compressed;
+    int ret;
+
+    size = compressBound (*len);
+    compressed = PyMem_Malloc (TERANE_EVENT_HEADER_SIZE + size);
+    if (compressed == NULL) {
+        PyErr_NoMemory ();
+        return -1;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    ret = compress2 ((Bytef *) compressed + TERANE_EVENT_HEADER_SIZE, &size,
+        (Bytef *) *buf, *len, level);
+    Py_END_ALLOW_THREADS
+    /* store the data uncompressed if compression doesn't help */
+    if (ret != Z_OK || TERANE_EVENT_HEADER_SIZE + size >= *len) {
+        PyMem_Free (compressed);
+        return 0;
+    }
+    compressed[0] = (char) TERANE_EVENT_MARKER;
+    compressed[1] = (char) TERANE_EVENT_FORMAT_ZLIB;
+    _put_uint32 (compressed + 2, *len);
+    PyMem_Free (*buf);
+    *buf = compressed;
+    *len = TERANE_EVENT_HEADER_SIZE + (uint32_t) size;
+    return 0;
+}
+
+/*
+ * _event_decompress: if the record in buf is compressed, then allocate a new
+ *  buffer containing the decompressed data and store it in out and outlen.
+ *  If the record is not compressed, then out is set to NULL.  Returns 0 on
+ *  success, or -1 if the record could not be decompressed.
+ */
+static int
+_event_decompress (char *buf, uint32_t len, char **out, uint32_t *outlen)
+{
+    uLongf size;
+    int ret;
+
+    *out = NULL;
+    switch (_event_format (buf, len)) {
+        case 0:
+            return 0;
+        case TERANE_EVENT_FORMAT_ZLIB:
+            if (len >= TERANE_EVENT_HEADER_SIZE)
+                break;
+        default:
+            PyErr_Format (terane_Exc_Error, "Failed to decompress event: unknown record format");
+            return -1;
+    }
+    size = _get_uint32 (buf + 2);
+    *out = PyMem_Malloc (size > 0 ? size : 1);
+    if (*out == NULL) {
+        PyErr_NoMemory ();
+        return -1;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    ret = uncompress ((Bytef *) *out, &size, (Bytef *) buf + TERANE_EVENT_HEADER_SIZE,
+        len - TERANE_EVENT_HEADER_SIZE);
+    Py_END_ALLOW_THREADS
+    if (ret != Z_OK) {
+        PyMem_Free (*out);
+        *out = NULL;
+        PyErr_Format (terane_Exc_Error, "Failed to decompress event: %s", zError (ret));
+        return -1;
+    }
+    *outlen = (uint32_t) size;
+    return 0;
+}
+
+/*
+ * _block_next: read the block entry at offset in buf into id, idlen, event and
+ *  eventlen, and return the offset of the next entry.  Returns 0 if there are
+ *  no more entries, or -1 if the entry is truncated.
+ */
+static int64_t
+_block_next (char *buf, uint32_t len, uint32_t offset, char **id, uint32_t *idlen,
+    char **event, uint32_t *eventlen)
+{
+    const unsigned char *u;
+
+    if (offset == len)
+        return 0;
+    if (len - offset < TERANE_BLOCK_ENTRY_SIZE)
+        return -1;
+    u = (const unsigned char *) buf + offset;
+    *idlen = ((uint32_t) u[0] << 8) | (uint32_t) u[1];
+    *eventlen = _get_uint32 (buf + offset + 2);
+    offset += TERANE_BLOCK_ENTRY_SIZE;
+    if (*idlen == 0 || *idlen > len - offset || *eventlen > len - offset - *idlen)
+        return -1;
+    *id = buf + offset;
+    *event = buf + offset + *idlen;
+    return (int64_t) offset + *idlen + *eventlen;
+}
+
+/*
+ * terane_Segment_clear_blocks: discard the decompressed blocks.
+ */
+void
+terane_Segment_clear_blocks (terane_Segment *self)
+{
+    int i;
+
+    for (i = 0; i < TERANE_SEGMENT_NBLOCKS; i++) {
+        if (self->blockcache[i].first)
+            PyMem_Free (self->blockcache[i].first);
+        if (self->blockcache[i].buf)
+            PyMem_Free (self->blockcache[i].buf);
+        memset (&self->blockcache[i], 0, sizeof (terane_block));
+    }
+}
+
+/*
+ * _block_contains: return 1 if the event identifier is within the range of
+ *  the cached block, otherwise 0.
+ */
+static int
+_block_contains (terane_block *block, char *id, uint32_t idlen)
+{
+    int cmp;
+
+    if (block->first == NULL)
+        return 0;
+    if (_terane_msgpack_cmp (block->first, block->firstlen, id, idlen, &cmp) < 0 || cmp > 0)
+        return 0;
+    if (_terane_msgpack_cmp (id, idlen, block->last, block->lastlen, &cmp) < 0 || cmp > 0)
+        return 0;
+    return 1;
+}
+
+/*
+ * _Segment_get_block: return the decompressed block containing the event
+ *  with the specified identifier.  The most recently used blocks are kept in
+ *  the block cache, so reading several events from the same block only
+ *  decompresses the block once.  The block belongs to the cache, and is only
+ *  valid until the GIL is released.  Returns NULL and sets an exception on
+ *  failure.
+ */
+static terane_block *
+_Segment_get_block (terane_Segment *self, terane_Txn *txn, char *id, uint32_t idlen)
+{
+    terane_block *block = NULL;
+    DBC *cursor = NULL;
+    DBT key, data;
+    char *buf = NULL, *entry, *event;
+    uint32_t len = 0, entrylen, eventlen;
+    int64_t offset;
+    int i, cmp, dbret;
+
+    /* check whether the block is in the cache */
+    for (i = 0; i < TERANE_SEGMENT_NBLOCKS; i++) {
+        block = &self->blockcache[i];
+        if (_block_contains (block, id, idlen)) {
+            block->used = ++self->blockclock;
+            return block;
+        }
+    }
+    /*
+     * find the block with the greatest identifier which is less than or
+     * equal to the event identifier, with the GIL released.
+     */
+    memset (&key, 0, sizeof (DBT));
+    key.data = id;
+    key.size = idlen;
+    key.flags = DB_DBT_MALLOC;
+    memset (&data, 0, sizeof (DBT));
+    data.flags = DB_DBT_MALLOC;
+    Py_BEGIN_ALLOW_THREADS
+    dbret = self->blocks->cursor (self->blocks, txn? txn->txn : NULL, &cursor, 0);
+    if (dbret == 0)
+        dbret = cursor->get (cursor, &key, &data, DB_SET_RANGE);
+    Py_END_ALLOW_THREADS
+    if (dbret == 0 && (_terane_msgpack_cmp ((char *) key.data, key.size, id, idlen, &cmp) < 0
+      || cmp != 0)) {
+        PyMem_Free (key.data);
+        PyMem_Free (data.data);
+        memset (&key, 0, sizeof (DBT));
+        key.flags = DB_DBT_MALLOC;
+        memset (&data, 0, sizeof (DBT));
+        data.flags = DB_DBT_MALLOC;
+        Py_BEGIN_ALLOW_THREADS
+        dbret = cursor->get (cursor, &key, &data, DB_PREV);
+        Py_END_ALLOW_THREADS
+    }
+    else if (dbret == DB_NOTFOUND) {
+        memset (&key, 0, sizeof (DBT));
+        key.flags = DB_DBT_MALLOC;
+        Py_BEGIN_ALLOW_THREADS
+        dbret = cursor->get (cursor, &key, &data, DB_LAST);
+        Py_END_ALLOW_THREADS
+    }
+    if (cursor) {
+        Py_BEGIN_ALLOW_THREADS
+        cursor->close (cursor);
+        Py_END_ALLOW_THREADS
+    }
+    switch (dbret) {
+        case 0:
+            break;
+        case DB_NOTFOUND:
+        case DB_KEYEMPTY:
+            PyErr_Format (terane_Exc_Error, "Failed to get event block: block doesn't exist");
+            return NULL;
+        default:
+            PyErr_Format (terane_Exc_Error, "Failed to get event block: %s",
+                db_strerror (dbret));
+            return NULL;
+    }
+    /* decompress the block if necessary */
+    if (_event_decompress ((char *) data.data, data.size, &buf, &len) < 0) {
+        PyMem_Free (key.data);
+        PyMem_Free (data.data);
+        return NULL;
+    }
+    if (buf == NULL) {
+        buf = (char *) data.data;
+        len = data.size;
+    }
+    else
+        PyMem_Free (data.data);
+    /* find the last event in the block */
+    entry = NULL;
+    offset = 0;
+    while ((offset = _block_next (buf, len, (uint32_t) offset, &entry, &entrylen,
+      &event, &eventlen)) > 0)
+        ;
+    if (offset < 0 || entry == NULL) {
+        PyMem_Free (key.data);
+        PyMem_Free (buf);
+        PyErr_Format (terane_Exc_Error, "Failed to get event block: invalid block");
+        return NULL;
+    }
+    /* replace the least recently used block in the cache */
+    block = &self->blockcache[0];
+    for (i = 1; i < TERANE_SEGMENT_NBLOCKS; i++) {
+        if (self->blockcache[i].used < block->used)
+            block = &self->blockcache[i];
+    }
+    if (block->first)
+        PyMem_Free (block->first);
+    if (block->buf)
+        PyMem_Free (block->buf);
+    block->first = (char *) key.data;
+    block->firstlen = key.size;
+    block->last = entry;
+    block->lastlen = entrylen;
+    block->buf = buf;
+    block->len = len;
+    block->used = ++self->blockclock;
+    return block;
+}
+
+/*
+ * _Segment_load_event: create a python dict from the event record in buf,
+ *  decoding only the requested fields if fields is not NULL.  id is the
+ *  serialized event identifier.  Returns 0 on success, or -1 on failure.
+ */
+static int
+_Segment_load_event (terane_Segment *self, terane_Txn *txn, char *id, uint32_t idlen,
+    char *buf, uint32_t len, PyObject *fields, PyObject **event)
+{
+    terane_block *block;
+    char *out = NULL, *entry;
+    uint32_t size, entrylen;
+    int64_t offset;
+    int ret;
+
+    /* the event is packed into a block */
+    if (_event_format (buf, len) == TERANE_EVENT_FORMAT_BLOCK) {
+        block = _Segment_get_block (self, txn, id, idlen);
+        if (block == NULL)
+            return -1;
+        offset = 0;
+        while ((offset = _block_next (block->buf, block->len, (uint32_t) offset,
+          &entry, &entrylen, &buf, &len)) > 0) {
+            if (entrylen == idlen && !memcmp (entry, id, idlen))
+                break;
+        }
+        if (offset <= 0) {
+            PyErr_Format (terane_Exc_Error, "Failed to load event: event is not in block");
+            return -1;
+        }
+    }
+    /* decompress the event if necessary */
+    else {
+        if (_event_decompress (buf, len, &out, &size) < 0)
+            return -1;
+        if (out != NULL) {
+            buf = out;
+            len = size;
+        }
+    }
+    if (fields)
+        ret = _terane_msgpack_load_fields (buf, len, fields, event);
+    else
+        ret = _terane_msgpack_load (buf, len, event);
+    if (out != NULL)
+        PyMem_Free (out);
+    return ret < 0 ? -1 : 0;
+}
 
 /*
  * terane_Segment_get_event: retrieve an event
  *
- * callspec: Segment.get_event(txn, evid, **flags)
+ * callspec: Segment.get_event(txn, evid, [fields], **flags)
  * parameters:
  *   txn (Txn): A Txn object to wrap the operation in, or None
  *   evid (object): The event identifier
+ *   fields (sequence): If present and not None, only decode the event fields
+ *    named in the sequence; the values of all other fields are skipped
  * returns: The event
  * exceptions:
  *   KeyError: The event with the specified evid doesn't exist
@@ -36,15 +423,18 @@ terane_Segment_get_event (terane_Segment *self, PyObject *args, PyObject *kwds)
 {
     terane_Txn *txn = NULL;
     PyObject *evid = NULL;
+    PyObject *fields = NULL;
     PyObject *event = NULL;
     DBT key, data;
     int dbflags, dbret;
 
     /* parse parameters */
-    if (!PyArg_ParseTuple (args, "OO", &txn, &evid))
+    if (!PyArg_ParseTuple (args, "OO|O", &txn, &evid, &fields))
         return NULL;
     if ((PyObject *) txn == Py_None)
         txn = NULL;
+    if (fields == Py_None)
+        fields = NULL;
     if ((dbflags = _terane_parse_db_get_flags (kwds)) < 0)
         return NULL;
     /* use the event identifier as the key */
@@ -60,8 +450,9 @@ terane_Segment_get_event (terane_Segment *self, PyObject *args, PyObject *kwds)
     Py_END_ALLOW_THREADS
     switch (dbret) {
         case 0:
-            /* create a python string from the data */
-            _terane_msgpack_load ((char *) data.data, data.size, &event);
+            /* create a python dict from the data, decoding only the requested fields */
+            _Segment_load_event (self, txn, (char *) key.data, key.size,
+                (char *) data.data, data.size, fields, &event);
             break;
         case DB_NOTFOUND:
         case DB_KEYEMPTY:
@@ -85,11 +476,13 @@ terane_Segment_get_event (terane_Segment *self, PyObject *args, PyObject *kwds)
 /*
  * terane_Segment_set_event: set the event contents
  *
- * callspec: Segment.set_event(txn, evid, event, **flags)
+ * callspec: Segment.set_event(txn, evid, event, [compress], **flags)
  * parameters:
  *   txn (Txn): A Txn object to wrap the operation in
  *   evid (object): The event identifier
  *   event (object): Data to store in the event
+ *   compress (int): If present and greater than 0, then compress serialized
+ *    events which are at least this many bytes long
  * returns: None
  * exceptions:
  *   terane.outputs.store.backend.Error: A db error occurred when trying to set the record
@@ -100,11 +493,12 @@ terane_Segment_set_event (terane_Segment *self, PyObject *args, PyObject *kwds)
     terane_Txn *txn = NULL;
     PyObject *evid = NULL;
     PyObject *event = NULL;
+    int compress = 0;
     DBT key, data;
     int dbflags, dbret;
 
     /* parse parameters */
-    if (!PyArg_ParseTuple (args, "O!OO", &terane_TxnType, &txn, &evid, &event))
+    if (!PyArg_ParseTuple (args, "O!OO|i", &terane_TxnType, &txn, &evid, &event, &compress))
         return NULL;
     if ((dbflags = _terane_parse_db_put_flags (kwds)) < 0)
         return NULL;
@@ -118,6 +512,14 @@ terane_Segment_set_event (terane_Segment *self, PyObject *args, PyObject *kwds)
         PyMem_Free (key.data);
         return NULL;
     }
+    /* compress large events */
+    if (compress > 0 && data.size >= (uint32_t) compress) {
+        if (_event_compress ((char **) &data.data, &data.size, Z_BEST_SPEED) < 0) {
+            PyMem_Free (key.data);
+            PyMem_Free (data.data);
+            return NULL;
+        }
+    }
     /* set the record with the GIL released */
     Py_BEGIN_ALLOW_THREADS
     dbret = self->events->put (self->events, txn->txn, &key, &data, 0);
@@ -135,6 +537,212 @@ terane_Segment_set_event (terane_Segment *self, PyObject *args, PyObject *kwds)
     Py_RETURN_NONE;
 }
 
+/*
+ * terane_Segment_pack_events: pack the events following the specified event
+ *  identifier into a compressed block.  Events are added to the block in
+ *  event identifier order until the serialized events are at least size
+ *  bytes long.  The block is stored in the blocks DB, and each event record
+ *  is replaced with a marker.  Events which are already packed are skipped.
+ *
+ * callspec: Segment.pack_events(txn, start, size, [partial])
+ * parameters:
+ *   txn (Txn): A Txn object to wrap the operation in
+ *   start (object): The event identifier to start after, or None to start
+ *    with the first event
+ *   size (int): The minimum length of the serialized events in the block
+ *   partial (bool): If present and True, then also pack the remaining events
+ *    if they are shorter than size bytes
+ * returns: The identifier of the last event in the block, or None if no
+ *  block was packed.
+ * exceptions:
+ *   terane.outputs.store.backend.Error: A db error occurred when trying to pack the events
+ */
+PyObject *
+terane_Segment_pack_events (terane_Segment *self, PyObject *args, PyObject *kwds)
+{
+    terane_Txn *txn = NULL;
+    PyObject *start = NULL, *partial = NULL, *last = NULL;
+    unsigned int size = 0;
+    DBC *cursor = NULL;
+    DBT key, data, startkey;
+    char *block = NULL, *out = NULL, *buf;
+    char marker[2] = { (char) TERANE_EVENT_MARKER, (char) TERANE_EVENT_FORMAT_BLOCK };
+    uint32_t blocklen = 0, capacity = 0, eventslen = 0, outlen, len, needed;
+    char **ids = NULL;
+    uint32_t *idlens = NULL;
+    Py_ssize_t nevents = 0, maxevents = 0, i;
+    int ret, dbret, cmp, flags;
+
+    /* parse parameters */
+    if (!PyArg_ParseTuple (args, "O!OI|O", &terane_TxnType, &txn, &start, &size, &partial))
+        return NULL;
+    if (partial != NULL && partial != Py_True && partial != Py_False)
+        return PyErr_Format (PyExc_TypeError, "partial must be True or False");
+    memset (&startkey, 0, sizeof (DBT));
+    if (start != Py_None) {
+        if (_terane_msgpack_dump (start, (char **) &startkey.data, &startkey.size) < 0)
+            return NULL;
+    }
+
+    /* create a new cursor with the GIL released */
+    Py_BEGIN_ALLOW_THREADS
+    dbret = self->events->cursor (self->events, txn->txn, &cursor, 0);
+    Py_END_ALLOW_THREADS
+    if (dbret != 0) {
+        PyErr_Format (terane_Exc_Error, "Failed to allocate DB cursor: %s",
+            db_strerror (dbret));
+        goto error;
+    }
+
+    /* collect the serialized events following the start event */
+    flags = start == Py_None ? DB_FIRST : DB_SET_RANGE;
+    while (eventslen < size) {
+        memset (&key, 0, sizeof (DBT));
+        if (flags == DB_SET_RANGE) {
+            key.data = startkey.data;
+            key.size = startkey.size;
+        }
+        key.flags = DB_DBT_MALLOC;
+        memset (&data, 0, sizeof (DBT));
+        data.flags = DB_DBT_MALLOC;
+        Py_BEGIN_ALLOW_THREADS
+        dbret = cursor->get (cursor, &key, &data, flags);
+        Py_END_ALLOW_THREADS
+        if (dbret == DB_NOTFOUND)
+            break;
+        if (dbret != 0) {
+            PyErr_Format (terane_Exc_Error, "Failed to get event: %s", db_strerror (dbret));
+            goto error;
+        }
+        /* skip the start event */
+        if (flags == DB_SET_RANGE && _terane_msgpack_cmp ((char *) key.data, key.size,
+          (char *) startkey.data, startkey.size, &cmp) == 0 && cmp == 0) {
+            flags = DB_NEXT;
+            PyMem_Free (key.data);
+            PyMem_Free (data.data);
+            continue;
+        }
+        flags = DB_NEXT;
+        /* skip events which are already packed */
+        if (_event_format ((char *) data.data, data.size) == TERANE_EVENT_FORMAT_BLOCK) {
+            PyMem_Free (key.data);
+            PyMem_Free (data.data);
+            continue;
+        }
+        /* decompress the event if necessary */
+        if (_event_decompress ((char *) data.data, data.size, &out, &outlen) < 0) {
+            PyMem_Free (key.data);
+            PyMem_Free (data.data);
+            goto error;
+        }
+        buf = out ? out : (char *) data.data;
+        len = out ? outlen : data.size;
+        /* make room for the event */
+        ret = key.size > 0xffff ? -1 : 0;
+        if (ret == 0 && nevents == maxevents) {
+            maxevents = maxevents ? maxevents * 2 : 64;
+            ret = _grow ((void **) &ids, maxevents * sizeof (char *));
+            if (ret == 0)
+                ret = _grow ((void **) &idlens, maxevents * sizeof (uint32_t));
+        }
+        needed = blocklen + TERANE_BLOCK_ENTRY_SIZE + key.size + len;
+        if (ret == 0 && needed > capacity) {
+            capacity = needed > 2 * capacity ? needed : 2 * capacity;
+            ret = _grow ((void **) &block, capacity);
+        }
+        if (ret != 0) {
+            PyMem_Free (key.data);
+            PyMem_Free (data.data);
+            if (out)
+                PyMem_Free (out);
+            PyErr_NoMemory ();
+            goto error;
+        }
+        /* append the event to the block */
+        block[blocklen] = (char) ((key.size >> 8) & 0xff);
+        block[blocklen + 1] = (char) (key.size & 0xff);
+        _put_uint32 (block + blocklen + 2, len);
+        memcpy (block + blocklen + TERANE_BLOCK_ENTRY_SIZE, key.data, key.size);
+        memcpy (block + blocklen + TERANE_BLOCK_ENTRY_SIZE + key.size, buf, len);
+        blocklen = needed;
+        eventslen += len;
+        ids[nevents] = (char *) key.data;
+        idlens[nevents] = key.size;
+        nevents++;
+        PyMem_Free (data.data);
+        if (out)
+            PyMem_Free (out);
+        out = NULL;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    cursor->close (cursor);
+    Py_END_ALLOW_THREADS
+    cursor = NULL;
+
+    /* don't pack the events unless they fill the block */
+    if (nevents == 0 || (eventslen < size && partial != Py_True)) {
+        last = Py_None;
+        Py_INCREF (last);
+        goto error;
+    }
+
+    /* store the block, keyed by the identifier of the first event */
+    if (_event_compress (&block, &blocklen, Z_DEFAULT_COMPRESSION) < 0)
+        goto error;
+    memset (&key, 0, sizeof (DBT));
+    key.data = ids[0];
+    key.size = idlens[0];
+    memset (&data, 0, sizeof (DBT));
+    data.data = block;
+    data.size = blocklen;
+    Py_BEGIN_ALLOW_THREADS
+    dbret = self->blocks->put (self->blocks, txn->txn, &key, &data, DB_NOOVERWRITE);
+    Py_END_ALLOW_THREADS
+    if (dbret != 0) {
+        PyErr_Format (terane_Exc_Error, "Failed to set event block: %s", db_strerror (dbret));
+        goto error;
+    }
+
+    /* replace each event with the block marker */
+    for (i = 0; i < nevents; i++) {
+        memset (&key, 0, sizeof (DBT));
+        key.data = ids[i];
+        key.size = idlens[i];
+        memset (&data, 0, sizeof (DBT));
+        data.data = marker;
+        data.size = sizeof (marker);
+        Py_BEGIN_ALLOW_THREADS
+        dbret = self->events->put (self->events, txn->txn, &key, &data, 0);
+        Py_END_ALLOW_THREADS
+        if (dbret != 0) {
+            PyErr_Format (terane_Exc_Error, "Failed to set event: %s", db_strerror (dbret));
+            goto error;
+        }
+    }
+
+    /* return the identifier of the last event in the block */
+    _terane_msgpack_load (ids[nevents - 1], idlens[nevents - 1], &last);
+
+error:
+    if (cursor) {
+        Py_BEGIN_ALLOW_THREADS
+        cursor->close (cursor);
+        Py_END_ALLOW_THREADS
+    }
+    if (ids) {
+        for (i = 0; i < nevents; i++)
+            PyMem_Free (ids[i]);
+        PyMem_Free (ids);
+    }
+    if (idlens)
+        PyMem_Free (idlens);
+    if (block)
+        PyMem_Free (block);
+    if (startkey.data)
+        PyMem_Free (startkey.data);
+    return last;
+}
+
 /*
  * terane_Segment_delete_event: Delete an event.
  *
@@ -373,5 +981,8 @@ terane_Segment_iter_events (terane_Segment *self, PyObject *args, PyObject *kwds
         cursor->close (cursor);
         Py_END_ALLOW_THREADS
     }
+    /* only the event identifiers are needed, so don't read the events */
+    else
+        ((terane_Iter *) iter)->keysonly = 1;
     return iter;
 }
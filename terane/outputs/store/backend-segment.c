@@ -97,6 +97,9 @@ _Segment_init (terane_Segment *self, PyObject *args, PyObject *kwds)
     }
     /* set compare function */
     self->metadata->set_bt_compare (self->metadata, _terane_msgpack_DB_compare);
+    /* all databases in the segment file share the same page size */
+    if (env->segment_pagesize > 0)
+        self->metadata->set_pagesize (self->metadata, env->segment_pagesize);
     /* open the metadata DB */
     dbret = self->metadata->open (self->metadata, txn->txn, self->name,
         "metadata", DB_BTREE, DB_CREATE | DB_THREAD | DB_MULTIVERSION, 0);
@@ -115,6 +118,9 @@ _Segment_init (terane_Segment *self, PyObject *args, PyObject *kwds)
     }
     /* set compare function */
     self->events->set_bt_compare (self->events, _terane_msgpack_DB_compare);
+    /* all databases in the segment file share the same page size */
+    if (env->segment_pagesize > 0)
+        self->events->set_pagesize (self->events, env->segment_pagesize);
     /* open the events DB */
     dbret = self->events->open (self->events, txn->txn, self->name,
         "events", DB_BTREE, DB_CREATE | DB_THREAD | DB_MULTIVERSION, 0);
@@ -124,6 +130,27 @@ _Segment_init (terane_Segment *self, PyObject *args, PyObject *kwds)
         goto error;
     }
 
+    /* create the DB handle for event blocks */
+    dbret = db_create (&self->blocks, env->env, 0);
+    if (dbret != 0) {
+        PyErr_Format (terane_Exc_Error, "Failed to create handle for blocks: %s",
+            db_strerror (dbret));
+        goto error;
+    }
+    /* set compare function */
+    self->blocks->set_bt_compare (self->blocks, _terane_msgpack_DB_compare);
+    /* all databases in the segment file share the same page size */
+    if (env->segment_pagesize > 0)
+        self->blocks->set_pagesize (self->blocks, env->segment_pagesize);
+    /* open the blocks DB */
+    dbret = self->blocks->open (self->blocks, txn->txn, self->name,
+        "blocks", DB_BTREE, DB_CREATE | DB_THREAD | DB_MULTIVERSION, 0);
+    if (dbret != 0) {
+        PyErr_Format (terane_Exc_Error, "Failed to open blocks: %s",
+            db_strerror (dbret));
+        goto error;
+    }
+
     /* create the DB handle for postings */
     dbret = db_create (&self->postings, env->env, 0);
     if (dbret != 0) {
@@ -133,6 +160,9 @@ _Segment_init (terane_Segment *self, PyObject *args, PyObject *kwds)
     }
     /* set compare function */
     self->postings->set_bt_compare (self->postings, _terane_msgpack_DB_compare);
+    /* all databases in the segment file share the same page size */
+    if (env->segment_pagesize > 0)
+        self->postings->set_pagesize (self->postings, env->segment_pagesize);
     /* open the postings DB */
     dbret = self->postings->open (self->postings, txn->txn, self->name,
         "postings", DB_BTREE, DB_CREATE | DB_THREAD | DB_MULTIVERSION, 0);
@@ -151,6 +181,9 @@ _Segment_init (terane_Segment *self, PyObject *args, PyObject *kwds)
     }
     /* set compare function */
     self->fields->set_bt_compare (self->fields, _terane_msgpack_DB_compare);
+    /* all databases in the segment file share the same page size */
+    if (env->segment_pagesize > 0)
+        self->fields->set_pagesize (self->fields, env->segment_pagesize);
     /* open the fields DB */
     dbret = self->fields->open (self->fields, txn->txn, self->name,
         "fields", DB_BTREE, DB_CREATE | DB_THREAD | DB_MULTIVERSION, 0);
@@ -169,6 +202,9 @@ _Segment_init (terane_Segment *self, PyObject *args, PyObject *kwds)
     }
     /* set compare function */
     self->terms->set_bt_compare (self->terms, _terane_msgpack_DB_compare);
+    /* all databases in the segment file share the same page size */
+    if (env->segment_pagesize > 0)
+        self->terms->set_pagesize (self->terms, env->segment_pagesize);
     /* open the terms DB */
     dbret = self->terms->open (self->terms, txn->txn, self->name,
         "terms", DB_BTREE, DB_CREATE | DB_THREAD | DB_MULTIVERSION, 0);
@@ -230,6 +266,18 @@ terane_Segment_close (terane_Segment *self)
     }
     self->events = NULL;
 
+    /* close the blocks db */
+    if (self->blocks != NULL) {
+        dbret = self->blocks->close (self->blocks, 0);
+        if (dbret != 0)
+            PyErr_Format (terane_Exc_Error, "Failed to close blocks DB: %s",
+                db_strerror (dbret));
+    }
+    self->blocks = NULL;
+
+    /* discard the decompressed blocks */
+    terane_Segment_clear_blocks (self);
+
     /* close the postings db */
     if (self->postings != NULL) {
         dbret = self->postings->close (self->postings, 0);
@@ -292,6 +340,8 @@ PyMethodDef _Segment_methods[] =
         "Returns the percentage of events within the given range." },
     { "iter_events", (PyCFunction) terane_Segment_iter_events, METH_KEYWORDS,
         "Iterates through all event identifers in the segment between the start and end event identifier." },
+    { "pack_events", (PyCFunction) terane_Segment_pack_events, METH_KEYWORDS,
+        "Pack the events following the specified event identifier into a compressed block." },
     { "get_term", (PyCFunction) terane_Segment_get_term, METH_KEYWORDS,
         "Get metadata for a term in the segment." },
     { "set_term", (PyCFunction) terane_Segment_set_term, METH_KEYWORDS,
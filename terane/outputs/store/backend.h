@@ -35,6 +35,10 @@ typedef struct _terane_Env {
     PyObject_HEAD
     DB_ENV *env;
     pthread_t checkpoint_thread;
+    uint32_t checkpoint_interval;   /* seconds between checkpoints, or 0 */
+    uint32_t checkpoint_kbytes;     /* log kilobytes between checkpoints, or 0 */
+    uint32_t segment_pagesize;      /* page size for new segment files, or 0 */
+    int trickle_percent;            /* percentage of cache pages to keep clean, or 0 */
 } terane_Env;
 
 typedef struct _terane_Index {
@@ -95,6 +99,7 @@ typedef struct _terane_Iter {
     terane_iterkey *prefix;
     DBT range;
     int reverse;
+    int keysonly;
 } terane_Iter;
 
 typedef struct _terane_Txn {
@@ -105,15 +110,31 @@ typedef struct _terane_Txn {
     struct _terane_Txn *next;       /* pointer to the next child of the parent Txn, or NULL */
 } terane_Txn;
 
+typedef struct {
+    char *first;            /* serialized identifier of the first event, or NULL if unused */
+    uint32_t firstlen;
+    char *last;             /* serialized identifier of the last event, within buf */
+    uint32_t lastlen;
+    char *buf;              /* the decompressed block */
+    uint32_t len;
+    unsigned long used;     /* value of the block clock when the block was last used */
+} terane_block;
+
+/* the number of decompressed event blocks each segment keeps in memory */
+#define TERANE_SEGMENT_NBLOCKS  8
+
 typedef struct _terane_Segment {
     PyObject_HEAD
     char *name;             /* name of the segment file */
     terane_Env *env;        /* reference to the object holding the DB_ENV handle */
     DB *metadata;           /* DB handle to the segment metadata */
     DB *events;             /* DB handle to the segment events */
+    DB *blocks;             /* DB handle to the segment event blocks */
     DB *postings;           /* DB handle to the segment postings */
     DB *fields;             /* DB handle to the segment fields */
     DB *terms;              /* DB handle to the segment terms */
+    terane_block blockcache[TERANE_SEGMENT_NBLOCKS];    /* recently used event blocks */
+    unsigned long blockclock;
     int deleted;            /* non-zero if the segment is scheduled to be deleted */
 } terane_Segment;
 
@@ -124,6 +145,7 @@ typedef struct _terane_Segment {
 
 /* Env methods */
 PyObject * terane_Env_close (terane_Env *self);
+PyObject * terane_Env_get_stats (terane_Env *self);
 
 /* Index methods */
 PyObject * terane_Index_get_meta (terane_Index *self, PyObject *args, PyObject *kwds);
@@ -155,6 +177,8 @@ PyObject * terane_Segment_delete_event (terane_Segment *self, PyObject *args, Py
 PyObject * terane_Segment_contains_event (terane_Segment *self, PyObject *args, PyObject *kwds);
 PyObject * terane_Segment_estimate_events (terane_Segment *self, PyObject *args);
 PyObject * terane_Segment_iter_events (terane_Segment *self, PyObject *args, PyObject *kwds);
+PyObject * terane_Segment_pack_events (terane_Segment *self, PyObject *args, PyObject *kwds);
+void       terane_Segment_clear_blocks (terane_Segment *self);
 
 PyObject * terane_Segment_get_term (terane_Segment *self, PyObject *args, PyObject *kwds);
 PyObject * terane_Segment_set_term (terane_Segment *self, PyObject *args, PyObject *kwds);
@@ -199,6 +223,7 @@ PyObject *      terane_msgpack_dump (PyObject *self, PyObject *args);
 terane_value *  _terane_msgpack_make_value (PyObject *obj);
 int             _terane_msgpack_load_value (char *buf, uint32_t len, char **pos, terane_value *val);
 int             _terane_msgpack_load (char *buf, uint32_t len, PyObject **dest);
+int             _terane_msgpack_load_fields (char *buf, uint32_t len, PyObject *fields, PyObject **dest);
 PyObject *      terane_msgpack_load (PyObject *self, PyObject *args);
 int             _terane_msgpack_cmp_values (terane_value *v1, terane_value *v2);
 int             _terane_msgpack_cmp (char *b1, uint32_t l1, char *b2, uint32_t l2, int *result);
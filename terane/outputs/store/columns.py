@@ -0,0 +1,234 @@
+# Copyright 2012 Michael Frank <msfrank@syntaxjockey.com>
+#
+# This file is part of Terane.
+#
+# Terane is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Terane is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Terane.  If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Lock
+from terane.loggers import getLogger
+
+logger = getLogger('terane.outputs.store.columns')
+
+MAX_COLUMN_VALUES = 65536
+
+class ColumnStore(object):
+    """
+    Dictionary-encodes the values of a fixed set of low-cardinality fields in
+    a segment.  Each distinct value of a columnar field is assigned a small
+    integer code, and the event stores the code instead of the value.  The
+    dictionary for each field is kept in the segment metadata under the key
+    'column:<fieldname>', and is append-only, so a code never changes meaning
+    once it has been written.
+
+    Values which can't be coded (because they are unhashable, or because the
+    dictionary is full) are stored wrapped in a single element list, so a
+    stored value is never ambiguous.
+
+    The number of events containing each code is kept in the segment metadata
+    under the key 'column-counts:<fieldname>'.  Counts are collected in memory
+    by countCodes(), and written by flushCounts() once per batch of events.
+
+    :param segment: The segment containing the columns.
+    :type segment: :class:`terane.outputs.store.segment.Segment`
+    :param txn: The transaction to load the column dictionaries in.
+    :type txn: :class:`terane.outputs.store.backend.Txn`
+    """
+
+    def __init__(self, segment, txn):
+        self._segment = segment
+        self._lock = Lock()
+        self._values = {}
+        self._codes = {}
+        self._pending = {}
+        try:
+            self.fieldnames = tuple(segment.get_meta(txn, u'columns'))
+        except KeyError:
+            self.fieldnames = ()
+        for fieldname in self.fieldnames:
+            try:
+                values = segment.get_meta(txn, u'column:' + fieldname)
+            except KeyError:
+                values = []
+            self._values[fieldname] = values
+            self._codes[fieldname] = dict([(v,i) for i,v in enumerate(values)])
+
+    def setColumns(self, txn, fieldnames):
+        """
+        Set the columnar fields of a new segment.  This must be called before
+        any events are written to the segment.
+
+        :param txn: The transaction to write the column list in.
+        :type txn: :class:`terane.outputs.store.backend.Txn`
+        :param fieldnames: The names of the columnar fields.
+        :type fieldnames: list
+        """
+        fieldnames = [unicode(fieldname) for fieldname in fieldnames]
+        self._segment.set_meta(txn, u'columns', fieldnames)
+        self.fieldnames = tuple(fieldnames)
+        for fieldname in self.fieldnames:
+            self._values[fieldname] = []
+            self._codes[fieldname] = {}
+
+    def encodeEvent(self, ix, event):
+        """
+        Return a copy of the event with the value of each columnar field
+        replaced by its code.  Values which haven't been seen before are
+        added to the column dictionaries, which are written to the segment
+        before the codes are used.
+
+        :param ix: The index containing the segment.
+        :type ix: :class:`terane.outputs.store.index.Index`
+        :param event: A dict mapping fieldnames to values.
+        :type event: dict
+        :returns: The encoded event.
+        :rtype: dict
+        """
+        if self.fieldnames == ():
+            return event
+        encoded = dict(event)
+        with self._lock:
+            added = {}
+            for fieldname in self.fieldnames:
+                if not fieldname in encoded:
+                    continue
+                value = encoded[fieldname]
+                codes = self._codes[fieldname]
+                try:
+                    encoded[fieldname] = codes[value]
+                    continue
+                except KeyError:
+                    pass
+                except TypeError:
+                    encoded[fieldname] = [value]
+                    continue
+                values = added.get(fieldname, self._values[fieldname])
+                if value in values:
+                    encoded[fieldname] = values.index(value)
+                elif len(values) >= MAX_COLUMN_VALUES:
+                    encoded[fieldname] = [value]
+                else:
+                    added[fieldname] = values + [value]
+                    encoded[fieldname] = len(values)
+            # the codes can't be used until the new values are committed
+            if len(added) > 0:
+                with ix.new_txn() as txn:
+                    for fieldname,values in added.items():
+                        logger.trace("[txn %x] BEGIN set_meta", txn.id())
+                        self._segment.set_meta(txn, u'column:' + fieldname, values)
+                        logger.trace("[txn %x] END set_meta", txn.id())
+                for fieldname,values in added.items():
+                    codes = dict(self._codes[fieldname])
+                    for code in range(len(self._values[fieldname]), len(values)):
+                        codes[values[code]] = code
+                    self._values[fieldname] = values
+                    self._codes[fieldname] = codes
+        return encoded
+
+    def decodeEvent(self, event):
+        """
+        Replace the code of each columnar field in the event with its value.
+        The event is modified in place.
+
+        :param event: A dict mapping fieldnames to stored values.
+        :type event: dict
+        :returns: The decoded event.
+        :rtype: dict
+        """
+        for fieldname in self.fieldnames:
+            if not fieldname in event:
+                continue
+            value = event[fieldname]
+            if isinstance(value, list):
+                event[fieldname] = value[0]
+            else:
+                event[fieldname] = self._values[fieldname][value]
+        return event
+
+    def countCodes(self, encoded):
+        """
+        Count the codes of the columnar fields in the encoded event.  The
+        counts are not stored until flushCounts() is called.
+
+        :param encoded: An event returned by encodeEvent().
+        :type encoded: dict
+        """
+        with self._lock:
+            for fieldname in self.fieldnames:
+                code = encoded.get(fieldname)
+                if code == None or isinstance(code, list):
+                    continue
+                pending = self._pending.setdefault(fieldname, {})
+                pending[code] = pending.get(code, 0) + 1
+
+    def flushCounts(self, ix):
+        """
+        Add the counts collected by countCodes() to the column counts stored
+        in the segment.
+
+        :param ix: The index containing the segment.
+        :type ix: :class:`terane.outputs.store.index.Index`
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        if len(pending) == 0:
+            return
+        try:
+            with ix.new_txn() as txn:
+                for fieldname,codes in pending.items():
+                    key = u'column-counts:' + fieldname
+                    try:
+                        logger.trace("[txn %x] BEGIN get_meta", txn.id())
+                        counts = self._segment.get_meta(txn, key, RMW=True)
+                        logger.trace("[txn %x] END get_meta", txn.id())
+                    except KeyError:
+                        counts = []
+                    size = max(codes.keys()) + 1
+                    if len(counts) < size:
+                        counts.extend([0] * (size - len(counts)))
+                    for code,count in codes.items():
+                        counts[code] += count
+                    logger.trace("[txn %x] BEGIN set_meta", txn.id())
+                    self._segment.set_meta(txn, key, counts)
+                    logger.trace("[txn %x] END set_meta", txn.id())
+        except:
+            # put the counts back, so they are written by the next flush
+            with self._lock:
+                for fieldname,codes in pending.items():
+                    current = self._pending.setdefault(fieldname, {})
+                    for code,count in codes.items():
+                        current[code] = current.get(code, 0) + count
+            raise
+
+    def getFacets(self, txn, fieldname):
+        """
+        Return a dict mapping each value of the columnar field to the number
+        of events containing the value, using the stored column counts.
+
+        :param txn: The transaction to read the column counts in, or None.
+        :type txn: :class:`terane.outputs.store.backend.Txn`
+        :param fieldname: The name of the columnar field.
+        :type fieldname: unicode
+        :returns: A dict mapping values to counts.
+        :rtype: dict
+        """
+        if not fieldname in self.fieldnames:
+            return {}
+        try:
+            counts = self._segment.get_meta(txn, u'column-counts:' + fieldname)
+        except KeyError:
+            return {}
+        values = self._values[fieldname]
+        return dict([(values[code],count) for code,count
+            in enumerate(counts) if count > 0])
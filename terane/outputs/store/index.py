@@ -16,17 +16,20 @@
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
 import time, datetime, pickle
+from collections import OrderedDict
 from threading import Lock
 from uuid import UUID, uuid4, uuid5
 from zope.interface import implements
-from twisted.internet.defer import succeed
+from twisted.internet.defer import succeed, fail
 from terane.bier import IIndex
 from terane.bier.evid import EVID, EVID_MIN
 from terane.bier.fields import SchemaError
+from terane.bier.searching import SearcherError, IndexWarming
 from terane.outputs.store import backend
-from terane.outputs.store.segment import Segment
+from terane.outputs.store.segment import Segment, SegmentInfo
 from terane.outputs.store.searching import IndexSearcher
 from terane.outputs.store.writing import IndexWriter
+from terane.sched import currentTask, deferToTask
 from terane.loggers import getLogger
 
 logger = getLogger('terane.outputs.store.index')
@@ -35,8 +38,9 @@ class Index(backend.Index):
     """
     Stores events, which are a collection of fields.  Internally, an Index is
     made up of multiple Segments.  Instantiation opens the Index, creating it
-    if necessary.  The index will be created in the specified environment, and
-    thus protected transactionally.
+    if necessary, but the schema and segments are not loaded until open() is
+    called.  The index will be created in the specified environment, and thus
+    protected transactionally.
 
     :param env: The DB environment.
     :type env: :class:`terane.db.backend.Env`
@@ -51,12 +55,33 @@ class Index(backend.Index):
         self._env = output._plugin._env
         backend.Index.__init__(self, self._env, self.name)
         self._segmentLock = Lock()
+        self._rotateLock = Lock()
         self._segments = []
+        self._open = OrderedDict()
+        self._maxOpen = output._maxOpenSegments
+        self._invalid = set()
         self._current = None
+        self._currentInfo = None
         self._fieldLock = Lock()
         self._fieldstore = output._fieldstore
         self._fields = {}
+        self._columns = output._columns
+        self._compressThreshold = output._compressThreshold
+        self._blockSize = output._blockSize
         self._indexUUID = None
+        self._ready = False
+        self._openError = None
+        logger.debug("opened event index '%s', waiting for schema and segments" % self.name)
+
+    def open(self):
+        """
+        Load the index metadata, verify the schema against the registered
+        field types, read the table of contents, and open the current segment.
+        This is slow for large indices, so the output calls it from a thread
+        after the server has started.  Until open() returns, searches fail
+        with IndexWarming.  If open() fails, then searches fail with the reason,
+        and the Index must still be closed.
+        """
         try:
             # load index metadata
             with self.new_txn() as txn:
@@ -75,42 +100,50 @@ class Index(backend.Index):
                         if not stored.field.__class__ == field.__class__:
                             raise SchemaError("schema field %s:%s does not match registered type %s" % (
                                 fieldname, fieldtype, field.__class__.__name__))
-            # load data segments
-            indexSize = 0
+            # load the table of contents.  segments are opened on demand.
             with self.new_txn() as txn:
-                for segmentName,segmentUUID in self.iter_segments(txn):
-                    segment = Segment(self._env, txn, segmentName)
-                    try:
-                        foundUUID = segment.get_meta(txn, u'uuid')
-                    except KeyError:
-                        foundUUID = None
-                    if foundUUID == None or segmentUUID != foundUUID:
-                        logger.debug("index segment %s has invalid UUID %s" % (segmentName, foundUUID))
-                        segment.close()
-                    else:
-                        self._segments.append(segment)
-                        logger.debug("opened index segment '%s'" % segmentName)
-            # if the index has no segments, create one
-            if self._segments == []:
+                for segmentName,toc in self.iter_segments(txn):
+                    self._segments.append(SegmentInfo(segmentName, toc))
+            # open the last valid segment, which receives new events
+            for info in reversed(self._segments):
+                if self._acquireSegment(info, backfill=False) != None:
+                    self._current = info.segment
+                    self._currentInfo = info
+                    break
+            # if the index has no valid segments, create one
+            if self._current == None:
                 self._makeSegment()
                 logger.info("created first segment for new index '%s'" % self.name)
             else:
-                logger.info("loaded %i segments for index '%s'" % (len(self._segments), self.name))
-            # get a reference to the current segment
-            self._current = self._segments[-1]
-            logger.debug("opened event index '%s' (%s)" % (self.name, str(self._indexUUID)))
-        except:
-            self.close()
+                logger.info("found %i segments for index '%s'" % (len(self._segments), self.name))
+        except Exception, e:
+            self._openError = str(e)
             raise
+        self._ready = True
+        logger.debug("loaded event index '%s' (%s)" % (self.name, str(self._indexUUID)))
 
     def __str__(self):
         return "<terane.outputs.store.Index '%s'>" % self.name
 
-    def newSearcher(self):
+    def _notReady(self):
+        """
+        Return the error to fail with if the index hasn't been opened yet, or
+        None if the index is ready.
+        """
+        if self._ready:
+            return None
+        if self._openError != None:
+            return SearcherError("index '%s' failed to open: %s" % (self.name, self._openError))
+        return IndexWarming("index '%s' is warming, try again later" % self.name)
+
+    def newSearcher(self, cancellation=None):
         """
         Return a new object implementing ISearcher.
         """
-        return succeed(IndexSearcher(self))
+        error = self._notReady()
+        if error != None:
+            return fail(error)
+        return succeed(IndexSearcher(self, cancellation))
     
     def newWriter(self):
         """
@@ -129,11 +162,48 @@ class Index(backend.Index):
                 for fieldname,fieldspec in ix._fields.items():
                     fields += fieldspec.values()
                 return fields
-        return deferToThread(_listFields, self)
+        error = self._notReady()
+        if error != None:
+            return fail(error)
+        return deferToTask(currentTask(), _listFields, self)
+
+    def getFacets(self, fieldname):
+        """
+        Return a dict mapping each value of the specified columnar field to
+        the number of events containing the value.  The counts are read from
+        the column counts of each segment, so no events are scanned.  Segments
+        in which the field is not columnar don't contribute to the counts.
+
+        :param fieldname: The name of the columnar field.
+        :type fieldname: unicode
+        :returns: A Deferred which fires with a dict mapping values to counts.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        def _getFacets(ix, fieldname):
+            facets = {}
+            with ix._segmentLock:
+                infos = list(ix._segments)
+            for info in infos:
+                segment = ix._acquireSegment(info)
+                if segment == None:
+                    continue
+                try:
+                    for value,count in segment.columns.getFacets(None, fieldname).items():
+                        facets[value] = facets.get(value, 0) + count
+                finally:
+                    ix._releaseSegment(info)
+            return facets
+        error = self._notReady()
+        if error != None:
+            return fail(error)
+        return deferToTask(currentTask(), _getFacets, self, unicode(fieldname))
 
     def getStats(self):
         """
         """
+        error = self._notReady()
+        if error != None:
+            return fail(error)
         lastModified = datetime.datetime.fromtimestamp(self._lastModified).isoformat()
         stats = {
             "index-size": self._indexSize,
@@ -144,6 +214,191 @@ class Index(backend.Index):
             }
         return succeed(stats)
 
+    def _openSegment(self, info):
+        """
+        Open the segment described by info, returning the Segment, or None if
+        the segment UUID doesn't match the table of contents.
+        """
+        with self.new_txn() as txn:
+            segment = Segment(self._env, txn, info.name)
+            try:
+                foundUUID = segment.get_meta(txn, u'uuid')
+            except KeyError:
+                foundUUID = None
+        if foundUUID == None or info.uuid != foundUUID:
+            logger.debug("index segment %s has invalid UUID %s", info.name, foundUUID)
+            segment.close()
+            return None
+        logger.debug("opened index segment '%s'", info.name)
+        return segment
+
+    def _evictSegments(self):
+        """
+        Remove the least recently used segments which aren't in use from the
+        open list, until no more than maxOpen segments are open.  Must be
+        called with the segmentLock held.  Returns the evicted segments, which
+        the caller must close after releasing the segmentLock.
+        """
+        evicted = []
+        if self._maxOpen <= 0:
+            return evicted
+        for info in list(self._open.values()):
+            if len(self._open) <= self._maxOpen:
+                break
+            if info.refcount > 0:
+                continue
+            del self._open[info.name]
+            evicted.append(info.segment)
+            info.segment = None
+        return evicted
+
+    def _closeSegments(self, segments):
+        for segment in segments:
+            segment.close()
+            logger.debug("closed index segment '%s'", segment.name)
+
+    def _acquireSegment(self, info, backfill=True):
+        """
+        Return the open Segment described by info, opening it if necessary.
+        The segment stays open until it is released by _releaseSegment().
+        Returns None if the segment is invalid.  The segment is opened without
+        holding the segmentLock, so writers aren't blocked while a search
+        opens old segments.  If backfill is True and the range of the segment
+        isn't in the table of contents, then it is read from the segment and
+        stored in the table of contents.
+        """
+        with self._segmentLock:
+            if info.segment == None and info in self._invalid:
+                return None
+            if info.segment != None:
+                info.refcount += 1
+                self._open.pop(info.name, None)
+                self._open[info.name] = info
+                return info.segment
+        opened = self._openSegment(info)
+        with self._segmentLock:
+            if opened == None:
+                self._invalid.add(info)
+                return None
+            # another thread may have opened the segment in the meantime
+            if info.segment == None:
+                info.segment = opened
+                opened = None
+            info.refcount += 1
+            # mark the segment as most recently used
+            self._open.pop(info.name, None)
+            self._open[info.name] = info
+            evicted = self._evictSegments()
+            segment = info.segment
+            seal = backfill and self._canSeal(info)
+        if opened != None:
+            evicted.append(opened)
+        self._closeSegments(evicted)
+        if seal:
+            self._sealSegment(info)
+        return segment
+
+    def _releaseSegment(self, info):
+        """
+        Release a segment acquired by _acquireSegment().
+        """
+        with self._segmentLock:
+            info.refcount -= 1
+            evicted = self._evictSegments()
+        self._closeSegments(evicted)
+
+    def _acquireCurrentSegment(self):
+        """
+        Acquire the current segment for writing, returning its SegmentInfo.
+        The segment must be released with _releaseWriterSegment().
+        """
+        with self._segmentLock:
+            info = self._currentInfo
+            info.refcount += 1
+            info.writers += 1
+            return info
+
+    def _releaseWriterSegment(self, info):
+        """
+        Release a segment acquired by _acquireCurrentSegment().  If the segment
+        is no longer the current segment and this was the last writer, then
+        its range is stored in the table of contents.
+        """
+        with self._segmentLock:
+            info.writers -= 1
+            seal = self._canSeal(info)
+        if seal:
+            self._sealSegment(info, pack=True)
+        self._releaseSegment(info)
+
+    def _canSeal(self, info):
+        """
+        Returns True if the segment is open, no longer receives events, and
+        its range isn't in the table of contents yet.  Must be called with the
+        segmentLock held.
+        """
+        return (info.segment != None and info is not self._currentInfo
+            and info.writers == 0 and info.size == None)
+
+    def _packEvents(self, segment, partial=False):
+        """
+        Pack the events written to the segment since it was last packed into
+        compressed blocks of at least blockSize bytes.  The identifier of the
+        last packed event is stored in the segment metadata.  Events are packed
+        in event identifier order, so an event which arrives after later events
+        were packed stays unpacked.  If partial is True, then the remaining
+        events are packed even if they don't fill a block.
+        """
+        if self._blockSize == 0:
+            return
+        while True:
+            with self.new_txn() as txn:
+                try:
+                    packedId = segment.get_meta(txn, u'packed-id', RMW=True)
+                except KeyError:
+                    packedId = None
+                packedId = segment.pack_events(txn, packedId, self._blockSize, partial)
+                if packedId == None:
+                    break
+                segment.set_meta(txn, u'packed-id', packedId)
+            logger.trace("packed events in segment '%s' up to %s", segment.name, packedId)
+
+    def _sealSegment(self, info, pack=False):
+        """
+        Copy the event range and size of the segment into the table of
+        contents, so searches can skip the segment without opening it.  The
+        range is read from the first and last event in the segment, so it is
+        also correct for segments written before the range was tracked.  The
+        segment must be acquired, and must not receive any more events.  If
+        pack is True, then the events which don't fill a block are packed too.
+        """
+        segment = info.segment
+        if pack:
+            self._packEvents(segment, partial=True)
+        minId = None
+        maxId = None
+        for reverse in (False, True):
+            events = segment.iter_events(None, None, None, reverse)
+            try:
+                for evid,_ in events:
+                    if reverse:
+                        maxId = evid
+                    else:
+                        minId = evid
+                    break
+            finally:
+                events.close()
+        try:
+            size = segment.get_meta(None, u'last-update')[u'segment-size']
+        except KeyError:
+            size = 0
+        with self.new_txn() as txn:
+            info.minId = minId
+            info.maxId = maxId
+            info.size = size
+            self.set_segment(txn, info.name, info.toTOC())
+        logger.debug("sealed index segment '%s' (%i events)", info.name, size)
+
     def _makeSegment(self):
         with self.new_txn() as txn:
             try:
@@ -154,50 +409,79 @@ class Index(backend.Index):
             self.set_meta(txn, u'last-segment-id', segmentId)
             segmentName = u"%s.%i" % (self.name, segmentId)
             segmentUUID = unicode(uuid5(self._indexUUID, str(segmentName)))
-            self.set_segment(txn, segmentName, segmentUUID, NOOVERWRITE=True)
+            info = SegmentInfo(segmentName, segmentUUID)
+            self.set_segment(txn, segmentName, info.toTOC(), NOOVERWRITE=True)
             segment = Segment(self._env, txn, segmentName)
             segment.set_meta(txn, u'created-on', int(time.time()))
             segment.set_meta(txn, u'uuid', segmentUUID)
+            segment.columns.setColumns(txn, self._columns)
             last_update = {
                 u'segment-size': 0,
                 u'last-id': [EVID_MIN.ts, EVID_MIN.offset],
                 u'last-modified': 0
                 }
             segment.set_meta(txn, u'last-update', last_update)
+        # the previous current segment no longer receives events.  it is
+        # sealed now, or when the last writer using it is done.
         with self._segmentLock:
-            self._segments.append(segment)
+            previous = self._currentInfo
+            info.segment = segment
+            info.refcount = 1
+            self._segments.append(info)
+            self._open[info.name] = info
             self._current = segment
+            self._currentInfo = info
+            seal = previous != None and self._canSeal(previous)
+        if seal:
+            self._sealSegment(previous, pack=True)
+        if previous != None:
+            self._releaseSegment(previous)
         return segment
 
     def rotateSegments(self, segRotation, segRetention):
         """
-        Allocate a new Segment, making it the new current segment.
+        If the current segment contains at least segRotation events, then
+        allocate a new Segment, making it the new current segment.  If the
+        index then contains more than segRetention segments, delete the
+        oldest segments.  A segment which is still being written to is not
+        deleted until a later rotation.
         """
-        return
-        # if the current segment contains more events than specified by
-        # segRotation, then rotate the index to generate a new segment.
-        if segRotation > 0 and self._currentSize >= segRotation:
-            self._makeSegment()
+        if segRotation <= 0:
+            return
+        # only one rotation may run at a time
+        if not self._rotateLock.acquire(False):
+            return
+        try:
+            lastUpdate = self._current.get_meta(None, u'last-update')
+            if lastUpdate[u'segment-size'] < segRotation:
+                return
+            segment = self._makeSegment()
             logger.debug("rotated current segment, new segment is %s" % segment.name)
-            # if the index contains more segments than specified by segRetention,
-            # then delete the oldest segment.
             if segRetention > 0:
-                if len(self._segments) > segRetention:
-                    for segment in self._segments[0:len(self._segments)-segRetention]:
-                        self.delete(segment)
+                with self._segmentLock:
+                    expired = self._segments[0:max(len(self._segments) - segRetention, 0)]
+                    expired = [info for info in expired if info.writers == 0]
+                for info in expired:
+                    self.delete(info)
+        finally:
+            self._rotateLock.release()
 
-    def delete(self, segment):
+    def delete(self, info):
         """
         Delete the specified Segment.
         """
-        segmentName = segment.name
+        segmentName = info.name
+        segment = self._acquireSegment(info, backfill=False)
         # remove the segment from the segment list
-        self._segments.remove(segment)
+        with self._segmentLock:
+            self._segments.remove(info)
         # remove the segment from the TOC.  this also marks the segment
         # for eventual physical deletion, when the Segment is deallocated.
         with self.new_txn() as txn:
             self.delete_segment(txn, segmentName)
-        segment.delete()
+        if segment != None:
+            segment.delete()
+            self._releaseSegment(info)
         logger.debug("deleted segment %s" % segmentName)
 
     def close(self):
@@ -205,9 +489,11 @@ class Index(backend.Index):
         Release all resources related to the store.  After calling this method
         the Index instance cannot be used anymore.
         """
-        # close each underlying segment
-        for segment in self._segments:
-            segment.close()
+        # close each open segment
+        for info in self._open.values():
+            info.segment.close()
+            info.segment = None
+        self._open = OrderedDict()
         self._segments = list()
         # unref the schema
         self._schema = None
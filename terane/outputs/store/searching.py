@@ -16,11 +16,12 @@
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
 import math
+from collections import OrderedDict
 from zope.interface import implements
-from twisted.internet.threads import deferToThread
 from twisted.internet.defer import succeed, inlineCallbacks, returnValue
 from terane.bier import ISearcher, IPostingList, IEventStore
 from terane.bier.evid import EVID
+from terane.sched import currentTask, deferToTask
 from terane.loggers import getLogger
 
 logger = getLogger('terane.outputs.store.searching')
@@ -33,15 +34,42 @@ class IndexSearcher(object):
 
     implements(ISearcher)
 
-    def __init__(self, ix):
+    def __init__(self, ix, cancellation=None):
         """
         :param ix: The index to search.
         :type ix: :class:`terane.outputs.store.index.Index`
+        :param cancellation: The cancellation for the search, or None.
+        :type cancellation: :class:`terane.bier.searching.Cancellation`
         """
         self._ix = ix
-        self._txn = txn = ix.new_txn(TXN_SNAPSHOT=True)
-        self._segmentSearchers = [
-            SegmentSearcher(s, txn) for s in ix._segments]
+        self._task = currentTask()
+        self._txn = ix.new_txn(TXN_SNAPSHOT=True)
+        self._cancellation = cancellation
+        # segments are opened the first time the search needs them
+        self._segmentSearchers = OrderedDict()
+
+    def _getSearchers(self, startId, endId):
+        """
+        Return the SegmentSearchers for each segment which may contain events
+        between startId and endId, acquiring the segments which this searcher
+        hasn't used yet.  Segments are skipped using the range stored in the
+        index table of contents, so they don't need to be opened.
+        """
+        ix = self._ix
+        with ix._segmentLock:
+            infos = list(ix._segments)
+        searchers = []
+        for info in infos:
+            if not info.overlaps(startId, endId):
+                continue
+            if not info.name in self._segmentSearchers:
+                segment = ix._acquireSegment(info)
+                if segment == None:
+                    continue
+                self._segmentSearchers[info.name] = (info, SegmentSearcher(segment,
+                    self._txn, self._task, self._cancellation))
+            searchers.append(self._segmentSearchers[info.name][1])
+        return searchers
 
     def getField(self, fieldname, fieldtype):
         """
@@ -57,7 +85,7 @@ class IndexSearcher(object):
                 if not fieldtype in fieldspec:
                     return None
                 return fieldspec[fieldtype]
-        return deferToThread(_getField, self, fieldname, fieldtype)
+        return deferToTask(self._task, _getField, self, fieldname, fieldtype)
         
     @inlineCallbacks
     def postingsLength(self, field, term, startId, endId):
@@ -77,7 +105,8 @@ class IndexSearcher(object):
         :rtype: int
         """
         length = 0
-        for searcher in self._searchers:
+        searchers = yield deferToTask(self._task, self._getSearchers, startId, endId)
+        for searcher in searchers:
             length += (yield searcher.postingsLength(field, term, startId, endId))
         returnValue(length)
 
@@ -90,7 +119,8 @@ class IndexSearcher(object):
         or endEx are True, then exclude the start or end terms, respectively.
         """
         length = 0
-        for searcher in self._searchers:
+        searchers = yield deferToTask(self._task, self._getSearchers, startId, endId)
+        for searcher in searchers:
             length += (yield searcher.postingsLengthBetween(field,
                 startTerm, endTerm, startEx, endEx, startId, endId))
         returnValue(length)
@@ -114,9 +144,10 @@ class IndexSearcher(object):
         :returns: An object for iterating through events matching the query.
         :rtype: An object implementing :class:`terane.bier.searching.IPostingList`
         """
+        searchers = yield deferToTask(self._task, self._getSearchers, startId, endId)
         iters = [
             (yield s.iterPostings(field, term, startId, endId))
-            for s in self._segmentSearchers]
+            for s in searchers]
         if endId < startId:
             compar = lambda d1,d2: cmp(d2,d1)
         else:
@@ -132,26 +163,50 @@ class IndexSearcher(object):
         start from the first term.  If endTerm is None, then end at the last term.
         If startEx or endEx are True, then exclude the start or end terms, respectively.
         """
+        searchers = yield deferToTask(self._task, self._getSearchers, startId, endId)
         iters = [
             (yield s.iterPostingsBetween(field, startTerm, endTerm,
                                           startEx, endEx, startId, endId))
-            for s in self._segmentSearchers]
+            for s in searchers]
         if endId < startId:
             compar = lambda d1,d2: cmp(d2,d1)
         else:
             compar = cmp
         returnValue(MergedPostingList(iters, compar))
 
+    def getProfile(self):
+        """
+        Returns the amount of work performed by the searcher so far, keyed by
+        segment name.  Each value is a dict containing the number of postings
+        'scanned', the number of 'skipped' postings, and the number of 'events'
+        retrieved.
+
+        :returns: The searcher profile.
+        :rtype: dict
+        """
+        profile = {}
+        for info,s in self._segmentSearchers.values():
+            profile[info.name] = {
+                'scanned': s.scanned,
+                'skipped': s.skipped,
+                'events': s.events
+                }
+        return profile
+
     def close(self):
         """
         Close the ISearcher, freeing any held resources.
         """
-        for s in self._segmentSearchers:
-            s._close()
-        self._segmentSearchers = None
-        self._txn.abort()
-        self._txn = None
-        return succeed(None)
+        def _close(searcher):
+            for info,s in searcher._segmentSearchers.values():
+                s._close()
+            searcher._txn.abort()
+            searcher._txn = None
+            # release the segments after the snapshot is gone, so they can be closed
+            for info,s in searcher._segmentSearchers.values():
+                searcher._ix._releaseSegment(info)
+            searcher._segmentSearchers = None
+        return deferToTask(self._task, _close, self)
 
 class MergedPostingList(object):
     """
@@ -182,6 +237,9 @@ class MergedPostingList(object):
         """
         posting = (None, None, None)
         curr = 0
+        # every segment may have been skipped
+        if len(self._iters) == 0:
+            returnValue(posting)
         # check each child iter for the lowest evid
         for i in range(len(self._iters)):
             # if None, then get the next posting from the iter
@@ -255,13 +313,23 @@ class SegmentSearcher(object):
 
     implements(IEventStore)
 
-    def __init__(self, segment, txn):
+    def __init__(self, segment, txn, task=None, cancellation=None):
         """
         :param segment: The segment to search.
         :type segment: :class:`terane.outputs.store.segment.Segment`
+        :param task: The task to charge thread pool work to.
+        :type task: :class:`terane.sched.Task`
+        :param cancellation: The cancellation for the search, or None.
+        :type cancellation: :class:`terane.bier.searching.Cancellation`
         """
         self._segment = segment
         self._txn = txn 
+        self._task = task
+        self._cancellation = cancellation
+        # work counters, reported by IndexSearcher.getProfile()
+        self.scanned = 0
+        self.skipped = 0
+        self.events = 0
 
     def postingsLength(self, field, term, startId, endId):
         """
@@ -277,9 +345,11 @@ class SegmentSearcher(object):
         :returns: An estimate of the number of postings.
         :rtype: int
         """
-        return deferToThread(self._postingsLength, field, term, startId, endId)
+        return deferToTask(self._task, self._postingsLength, field, term, startId, endId)
 
     def _postingsLength(self, field, term, startId, endId):
+        if self._cancellation != None:
+            self._cancellation.check()
         try:
             if field == None and term == None:
                 lastUpdate = self._segment.get_meta(self._txn, u'last-update')
@@ -317,7 +387,7 @@ class SegmentSearcher(object):
                 length += searcher._postingsLength(field, termKey[2], startId, endId)
             terms.close()
             return length
-        return deferToThread(_postingsLengthBetween, self, field, startTerm,
+        return deferToTask(self._task, _postingsLengthBetween, self, field, startTerm,
             endTerm, startEx, endEx, startId, endId)
 
     def iterPostings(self, field, term, startId, endId):
@@ -339,6 +409,8 @@ class SegmentSearcher(object):
         :rtype: An object implementing :class:`terane.bier.searching.IPostingList`
         """
         def _iterPostings(searcher, field, term, startId, endId):
+            if searcher._cancellation != None:
+                searcher._cancellation.check()
             if field == None and term == None:
                 startKey = [startId.ts, startId.offset]
                 endKey = [endId.ts, endId.offset]
@@ -354,7 +426,7 @@ class SegmentSearcher(object):
                 postings = searcher._segment.iter_postings(self._txn, startKey, endKey,
                     True if startId > endId else False)
             return PostingList(searcher, field, term, postings)
-        return deferToThread(_iterPostings, self, field, term, startId, endId)
+        return deferToTask(self._task, _iterPostings, self, field, term, startId, endId)
 
     def iterPostingsBetween(self, field, startTerm, endTerm, startEx, endEx, startId, endId):
         """
@@ -379,27 +451,37 @@ class SegmentSearcher(object):
             endEx = endTerm if endEx == True else None
             return MultiTermPostingList(searcher, field, terms, startEx, endEx,
                                         postings, startId, endId)
-        return deferToThread(_iterPostingsBetween, self, field, startTerm, endTerm,
+        return deferToTask(self._task, _iterPostingsBetween, self, field, startTerm, endTerm,
                              startEx, endEx, startId, endId)
 
-    def getEvent(self, evid):
+    def getEvent(self, evid, fields=None):
         """
-        Returns the event specified by evid.
+        Returns the event specified by evid.  If fields is not None, then
+        only the specified fields (and the default field) are decoded by
+        the backend; the values of the other fields are skipped.
 
         :param evid: The event identifier
         :type evid: :class:`terane.bier.evid.EVID`
+        :param fields: If not None, then only retrieve the specified fields.
+        :type fields: list or None
         :returns: A dict mapping fieldnames to values.
         :rtype: dict
         """
-        def _getEvent(searcher, evid):
+        defaultfield = u'message'
+        if fields != None and not defaultfield in fields:
+            fields = list(fields) + [defaultfield]
+        def _getEvent(searcher, evid, fields):
+            if searcher._cancellation != None:
+                searcher._cancellation.check()
+            searcher.events += 1
             evid = [evid.ts, evid.offset]
             segment = searcher._segment
-            fields = segment.get_event(searcher._txn, evid)
-            defaultfield = u'message'
-            defaultvalue = fields[defaultfield]
-            del fields[defaultfield]
-            return (defaultfield, defaultvalue, fields)
-        return deferToThread(_getEvent, self, evid)
+            values = segment.get_event(searcher._txn, evid, fields)
+            segment.columns.decodeEvent(values)
+            defaultvalue = values[defaultfield]
+            del values[defaultfield]
+            return (defaultfield, defaultvalue, values)
+        return deferToTask(self._task, _getEvent, self, evid, fields)
 
     def _close(self):
         """
@@ -420,6 +502,8 @@ class PostingList(object):
     
     def __init__(self, searcher, field, term, postings):
         self._searcher = searcher
+        self._task = searcher._task
+        self._cancellation = searcher._cancellation
         self._field = field
         self._term = term
         self._postings = postings
@@ -432,6 +516,8 @@ class PostingList(object):
             posting = (None, None, None)
             if postingList._postings == None:
                 return posting
+            if postingList._cancellation != None:
+                postingList._cancellation.check()
             try:
                 key,value = postingList._postings.next()
                 # posting key consists of: fieldname, fieldtype, term, ts, id
@@ -441,10 +527,11 @@ class PostingList(object):
                 else:
                     evid = EVID(key[0], key[1])
                 posting = (evid, value, postingList._searcher)
+                postingList._searcher.scanned += 1
             except StopIteration:
                 postingList._close()
             return posting
-        return deferToThread(_nextPosting, self)
+        return deferToTask(self._task, _nextPosting, self)
 
     def skipPosting(self, targetId):
         """
@@ -455,6 +542,9 @@ class PostingList(object):
             posting = (None, None, None)
             if postingList._postings == None:
                 return posting
+            if postingList._cancellation != None:
+                postingList._cancellation.check()
+            postingList._searcher.skipped += 1
             try:
                 target = [
                     postingList._field.fieldname,
@@ -476,7 +566,7 @@ class PostingList(object):
             except StopIteration:
                 postingList._close()
             return posting
-        return deferToThread(_skipPosting, self, targetId)
+        return deferToTask(self._task, _skipPosting, self, targetId)
 
     def _close(self):
         """
@@ -488,7 +578,7 @@ class PostingList(object):
         self._searcher = None
 
     def close(self):
-        return deferToThread(self._close)
+        return deferToTask(self._task, self._close)
 
 class MultiTermPostingList(object):
 
@@ -504,6 +594,8 @@ class MultiTermPostingList(object):
         :type postings: :class:`terane.outputs.store.backend.Iter`
         """
         self._searcher = searcher
+        self._task = searcher._task
+        self._cancellation = searcher._cancellation
         self._field = field
         self._terms = terms
         self._startEx = startEx
@@ -529,6 +621,8 @@ class MultiTermPostingList(object):
             nextPosting = (None, None, None)
             # find the next posting closest to the smallestId
             for termKey,termValue in postingList._terms:
+                if postingList._cancellation != None:
+                    postingList._cancellation.check()
                 # check whether we should exclude this term
                 if postingList._startEx and postingList._startEx == termKey[2]:
                     continue
@@ -549,7 +643,7 @@ class MultiTermPostingList(object):
                     postingKey,postingValue = postingList._postings.skip(closestKey, True)
                 except IndexError:
                     continue
-                logger.trace("next range posting: %s" % postingKey)
+                logger.trace("next range posting: %s", postingKey)
                 currId = EVID(postingKey[3], postingKey[4])
                 # check whether this posting is the smallest so far
                 if ((smallestId == None or postingList._cmp(currId, smallestId) < 0) and
@@ -559,12 +653,13 @@ class MultiTermPostingList(object):
             # no more ids, we are done
             if smallestId == None:
                 return (None, None, None)
+            postingList._searcher.scanned += 1
             # rewind the iterators
             postingList._terms.reset()
             postingList._postings.reset()
             postingList._lastId = smallestId
             return nextPosting
-        return deferToThread(_nextPosting, self)
+        return deferToTask(self._task, _nextPosting, self)
 
     def skipPosting(self, targetId):
         """
@@ -574,8 +669,11 @@ class MultiTermPostingList(object):
         def _skipPosting(postingList, targetId):
             prefix = [postingList._field.fieldname, postingList._field.fieldtype]
             nextPosting = (None, None, None)
+            postingList._searcher.skipped += 1
             # find the next posting closest to the smallestId
             for termKey,termValue in postingList._terms:
+                if postingList._cancellation != None:
+                    postingList._cancellation.check()
                 # check whether we should exclude this term
                 if postingList._startEx and postingList._startEx == termKey[2]:
                     continue
@@ -590,14 +688,14 @@ class MultiTermPostingList(object):
                     postingKey,postingValue = postingList._postings.skip(targetKey, False)
                 except IndexError:
                     continue
-                logger.trace("skip range posting: %s" % postingKey)
+                logger.trace("skip range posting: %s", postingKey)
                 currId = EVID(postingKey[3], postingKey[4])
                 nextPosting = (currId, postingValue, postingList._searcher)
             # rewind the iterators
             postingList._terms.reset()
             postingList._postings.reset()
             return nextPosting
-        return deferToThread(_skipPosting, self, targetId)
+        return deferToTask(self._task, _skipPosting, self, targetId)
 
     def _close(self):
         """
@@ -612,4 +710,4 @@ class MultiTermPostingList(object):
         self._searcher = None
 
     def close(self):
-        return deferToThread(self._close)
+        return deferToTask(self._task, self._close)
@@ -16,7 +16,9 @@
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
 import pickle, time
+from terane.bier.evid import EVID
 from terane.outputs.store import backend
+from terane.outputs.store.columns import ColumnStore
 from terane.loggers import getLogger
 
 logger = getLogger('terane.outputs.store.segment')
@@ -26,6 +28,81 @@ class Segment(backend.Segment):
     def __init__(self, env, txn, name):
         backend.Segment.__init__(self, env, txn, name)
         self.name = name
+        self.columns = ColumnStore(self, txn)
 
     def __str__(self):
         return "<terane.outputs.store.Segment '%s'>" % self.name
+
+class SegmentInfo(object):
+    """
+    An entry in the index table of contents.  The entry describes a segment
+    without requiring the segment to be open: the segment UUID, and, once the
+    segment is no longer being written to, the range of event identifiers it
+    contains and its size.  Older entries contain only the UUID, in which case
+    the range is unknown.
+
+    :param name: The segment name.
+    :type name: unicode
+    :param toc: The table of contents value, either a dict or a UUID string.
+    :type toc: dict or unicode
+    """
+
+    def __init__(self, name, toc):
+        self.name = name
+        if isinstance(toc, dict):
+            self.uuid = toc[u'uuid']
+            self.minId = toc.get(u'min-id', None)
+            self.maxId = toc.get(u'max-id', None)
+            self.size = toc.get(u'size', None)
+        else:
+            self.uuid = toc
+            self.minId = None
+            self.maxId = None
+            self.size = None
+        # the open Segment, or None
+        self.segment = None
+        # the number of users of the open Segment
+        self.refcount = 0
+        # the number of writers using the Segment
+        self.writers = 0
+
+    def __str__(self):
+        return "<terane.outputs.store.SegmentInfo '%s'>" % self.name
+
+    def toTOC(self):
+        """
+        Return the table of contents value for the segment.
+
+        :returns: The table of contents value.
+        :rtype: dict
+        """
+        return {
+            u'uuid': self.uuid,
+            u'min-id': self.minId,
+            u'max-id': self.maxId,
+            u'size': self.size
+            }
+
+    def overlaps(self, startId, endId):
+        """
+        Returns True if the segment may contain events between startId and
+        endId (in either order).  If the range of the segment is unknown, then
+        returns True.  A sealed segment without any events never overlaps.
+
+        :param startId:
+        :type startId: :class:`terane.bier.evid.EVID`
+        :param endId:
+        :type endId: :class:`terane.bier.evid.EVID`
+        :rtype: bool
+        """
+        if self.size == 0:
+            return False
+        if self.minId == None or self.maxId == None:
+            return True
+        if startId > endId:
+            startId, endId = endId, startId
+        if EVID(self.maxId[0], self.maxId[1]) < startId:
+            return False
+        if EVID(self.minId[0], self.minId[1]) > endId:
+            return False
+        return True
@@ -18,11 +18,11 @@
 import time
 import cPickle as pickle
 from zope.interface import implements
-from twisted.internet.defer import succeed
-from twisted.internet.threads import deferToThread
 from terane.bier import IWriter
 from terane.bier.fields import QualifiedField
 from terane.bier.writing import WriterError
+from terane.stats import getHistogram
+from terane.sched import currentTask, deferToTask
 from terane.loggers import getLogger
 
 logger = getLogger('terane.outputs.store.writing')
@@ -30,17 +30,37 @@ logger = getLogger('terane.outputs.store.writing')
 class WriterExpired(WriterError):
     pass
 
+class _TimedTxn(object):
+    """
+    Wraps a transaction context, recording the time taken to commit (or abort)
+    the transaction when the context exits.
+    """
+
+    def __init__(self, txn, histogram):
+        self._txn = txn
+        self._histogram = histogram
+
+    def __enter__(self):
+        return self._txn.__enter__()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        start = time.time()
+        try:
+            return self._txn.__exit__(exc_type, exc_value, tb)
+        finally:
+            self._histogram.since(start)
+
 class IndexWriter(object):
 
     implements(IWriter)
 
     def __init__(self, ix):
         self._ix = ix
-        logger.trace("[writer %s] waiting for segmentLock" % self)
-        with ix._segmentLock:
-            logger.trace("[writer %s] acquired segmentLock" % self)
-            self._segment = ix._current
-        logger.trace("[writer %s] released segmentLock" % self)
+        self._task = currentTask()
+        self._committime = getHistogram('terane.output.commit.seconds', index=ix.name)
+        # pin the current segment, so it isn't sealed while we write to it
+        self._info = ix._acquireCurrentSegment()
+        self._segment = self._info.segment
 
     def __str__(self):
         return "%x" % id(self)
@@ -52,9 +72,9 @@ class IndexWriter(object):
         """
         def _getField(writer, fieldname, fieldtype):
             ix = writer._ix
-            logger.trace("[writer %s] waiting for fieldLock" % self)
+            logger.trace("[writer %s] waiting for fieldLock", self)
             with ix._fieldLock:
-                logger.trace("[writer %s] acquired fieldLock" % self)
+                logger.trace("[writer %s] acquired fieldLock", self)
                 if fieldname in ix._fields:
                     fieldspec = ix._fields[fieldname]
                 else:
@@ -64,32 +84,36 @@ class IndexWriter(object):
                     stored = QualifiedField(fieldname, fieldtype, field)
                     fieldspec[fieldtype] = stored
                     pickled = unicode(pickle.dumps(fieldspec))
-                    with ix.new_txn() as txn:
-                        logger.trace("[txn %x] BEGIN set_field" % txn.id())
+                    with _TimedTxn(ix.new_txn(), writer._committime) as txn:
+                        logger.trace("[txn %x] BEGIN set_field", txn.id())
                         ix.set_field(txn, fieldname, pickled, NOOVERWRITE=True)
-                        logger.trace("[txn %x] END set_field" % txn.id())
+                        logger.trace("[txn %x] END set_field", txn.id())
                     ix._fields[fieldname] = fieldspec
-            logger.trace("[writer %s] released fieldLock" % self)
+            logger.trace("[writer %s] released fieldLock", self)
             return fieldspec[fieldtype]
-        return deferToThread(_getField, self, fieldname, fieldtype)
+        return deferToTask(self._task, _getField, self, fieldname, fieldtype)
 
     def newEvent(self, evid, event):
         def _newEvent(writer, evid, event):
             ix = writer._ix
             segment = writer._segment
-            with ix.new_txn() as txn:
-                # serialize the fields dict and write it to the segment
-                logger.trace("[txn %x] BEGIN set_event" % txn.id())
+            # replace the values of columnar fields with their codes
+            event = segment.columns.encodeEvent(ix, event)
+            with _TimedTxn(ix.new_txn(), writer._committime) as txn:
+                # serialize the fields dict and write it to the segment,
+                # compressing it if it is large enough
+                logger.trace("[txn %x] BEGIN set_event", txn.id())
                 segment.set_event(txn, [evid.ts,evid.offset], event,
-                                  NOOVERWRITE=True)
-                logger.trace("[txn %x] END set_event" % txn.id())
+                                  ix._compressThreshold, NOOVERWRITE=True)
+                logger.trace("[txn %x] END set_event", txn.id())
+            segment.columns.countCodes(event)
             lastModified = int(time.time())
             # update segment metadata
-            with ix.new_txn() as txn:
+            with _TimedTxn(ix.new_txn(), writer._committime) as txn:
                 try:
-                    logger.trace("[txn %x] BEGIN get_meta" % txn.id())
+                    logger.trace("[txn %x] BEGIN get_meta", txn.id())
                     lastUpdate = segment.get_meta(txn, u'last-update', RMW=True)
-                    logger.trace("[txn %x] END get_meta" % txn.id())
+                    logger.trace("[txn %x] END get_meta", txn.id())
                 except KeyError:
                     lastUpdate = {
                         u'segment-size': 0,
@@ -102,15 +126,15 @@ class IndexWriter(object):
                 lastUpdate[u'segment-size'] = lastUpdate[u'segment-size'] + 1 
                 lastUpdate[u'last-id'] = [evid.ts, evid.offset]
                 lastUpdate[u'last-modified'] = lastModified
-                logger.trace("[txn %x] BEGIN set_meta" % txn.id())
+                logger.trace("[txn %x] BEGIN set_meta", txn.id())
                 segment.set_meta(txn, u'last-update', lastUpdate)
-                logger.trace("[txn %x] END set_meta" % txn.id())
+                logger.trace("[txn %x] END set_meta", txn.id())
             # update index metadata
-            with ix.new_txn() as txn:
+            with _TimedTxn(ix.new_txn(), writer._committime) as txn:
                 try:
-                    logger.trace("[txn %x] BEGIN get_meta" % txn.id())
+                    logger.trace("[txn %x] BEGIN get_meta", txn.id())
                     lastUpdate = ix.get_meta(txn, u'last-update', RMW=True)
-                    logger.trace("[txn %x] END get_meta" % txn.id())
+                    logger.trace("[txn %x] END get_meta", txn.id())
                 except KeyError:
                     lastUpdate = {
                         u'index-size': 0,
@@ -123,49 +147,58 @@ class IndexWriter(object):
                 lastUpdate[u'index-size'] = lastUpdate[u'index-size'] + 1 
                 lastUpdate[u'last-id'] = [evid.ts, evid.offset]
                 lastUpdate[u'last-modified'] = lastModified
-                logger.trace("[txn %x] BEGIN set_meta" % txn.id())
+                logger.trace("[txn %x] BEGIN set_meta", txn.id())
                 ix.set_meta(txn, u'last-update', lastUpdate)
-                logger.trace("[txn %x] END set_meta" % txn.id())
-        return deferToThread(_newEvent, self, evid, event)
+                logger.trace("[txn %x] END set_meta", txn.id())
+        return deferToTask(self._task, _newEvent, self, evid, event)
 
     def newPosting(self, field, term, evid, posting):
         def _newPosting(writer, field, term, evid, posting):
             ix = writer._ix
             segment = writer._segment
-            with ix.new_txn() as txn:
+            with _TimedTxn(ix.new_txn(), writer._committime) as txn:
                 # increment the document count for this field
                 f = [field.fieldname, field.fieldtype]
                 try:
-                    logger.trace("[txn %x] BEGIN get_field" % txn.id())
+                    logger.trace("[txn %x] BEGIN get_field", txn.id())
                     value = segment.get_field(txn, f, RMW=True)
-                    logger.trace("[txn %x] END get_field" % txn.id())
+                    logger.trace("[txn %x] END get_field", txn.id())
                 except KeyError:
                     value = {u'num-docs': 0}
                 assert(u'num-docs' in value)
                 value[u'num-docs'] = value[u'num-docs'] + 1
-                logger.trace("[txn %x] BEGIN set_field" % txn.id())
+                logger.trace("[txn %x] BEGIN set_field", txn.id())
                 segment.set_field(txn, f, value)
-                logger.trace("[txn %x] END set_field" % txn.id())
+                logger.trace("[txn %x] END set_field", txn.id())
                 # increment the document count for this term
                 t = [field.fieldname, field.fieldtype, term]
                 try:
-                    logger.trace("[txn %x] BEGIN get_term" % txn.id())
+                    logger.trace("[txn %x] BEGIN get_term", txn.id())
                     value = segment.get_term(txn, t, RMW=True)
-                    logger.trace("[txn %x] END get_term" % txn.id())
+                    logger.trace("[txn %x] END get_term", txn.id())
                 except KeyError:
                     value = {u'num-docs': 1}
                 assert(u'num-docs' in value)
                 value[u'num-docs'] = value[u'num-docs'] + 1
-                logger.trace("[txn %x] BEGIN set_term" % txn.id())
+                logger.trace("[txn %x] BEGIN set_term", txn.id())
                 segment.set_term(txn, t, value)
-                logger.trace("[txn %x] END set_term" % txn.id())
+                logger.trace("[txn %x] END set_term", txn.id())
                 # add the posting
                 posting = dict() if posting == None else posting
                 p = [field.fieldname, field.fieldtype, term, evid.ts, evid.offset]
-                logger.trace("[txn %x] BEGIN set_posting" % txn.id())
+                logger.trace("[txn %x] BEGIN set_posting", txn.id())
                 segment.set_posting(txn, p, posting)
-                logger.trace("[txn %x] END set_posting" % txn.id())
-        return deferToThread(_newPosting, self, field, term, evid, posting)
+                logger.trace("[txn %x] END set_posting", txn.id())
+        return deferToTask(self._task, _newPosting, self, field, term, evid, posting)
 
     def close(self):
-        return succeed(None)
+        def _close(writer):
+            if writer._info != None:
+                # store the column counts of the events in this batch
+                writer._segment.columns.flushCounts(writer._ix)
+                # compress the events written so far into blocks
+                writer._ix._packEvents(writer._segment)
+                writer._ix._releaseWriterSegment(writer._info)
+                writer._info = None
+                writer._segment = None
+        return deferToTask(self._task, _close, self)
@@ -183,11 +183,11 @@ class PluginManager(Manager):
                     # in its scope
                     def _makeTrampoline(impl=impl, plugin=plugin):
                         def _trampoline(*args, **kwds):
-                            logger.trace("allocating new %s from plugin %s" % (impl.__name__,plugin.name))
+                            logger.trace("allocating new %s from plugin %s", impl.__name__,plugin.name)
                             return impl(plugin, *args, **kwds)
                         return _trampoline
                     self._components[(spec,name)] = _makeTrampoline(impl, plugin)
-                    logger.trace("added component %s:%s" % (spec.__name__, name))
+                    logger.trace("added component %s:%s", spec.__name__, name)
             except ConfigureError:
                 raise
             except Exception, e:
@@ -0,0 +1,154 @@
+# Copyright 2010,2011,2012 Michael Frank <msfrank@syntaxjockey.com>
+#
+# This file is part of Terane.
+#
+# Terane is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Terane is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Terane.  If not, see <http://www.gnu.org/licenses/>.
+
+from zope.interface import implements
+from zope.component import queryUtility
+from twisted.web.server import Site
+from twisted.web.resource import Resource
+from terane.plugins import Plugin, IPlugin
+from terane.protocols import IProtocol, Protocol
+from terane.sched import IScheduler
+from terane.stats import stats, Histogram
+from terane.loggers import getLogger
+
+logger = getLogger('terane.protocols.metrics')
+
+def _metricName(name):
+    return name.replace('.', '_')
+
+def _formatValue(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+def _formatLabels(labels):
+    if len(labels) == 0:
+        return ''
+    escaped = []
+    for k,v in labels:
+        v = v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append('%s="%s"' % (k,v))
+    return '{%s}' % ','.join(escaped)
+
+def formatMetrics(stats, tasks, classes=()):
+    """
+    Format the contents of the stats registry and the scheduler task and
+    scheduling class counters in the Prometheus text exposition format.  Only values which
+    are already in memory are read, so formatting never blocks on the
+    storage backend.
+
+    :param stats: The stats registry.
+    :type stats: :class:`terane.stats.StatsManager`
+    :param tasks: The scheduler tasks.
+    :type tasks: iter
+    :param classes: The scheduling classes.
+    :type classes: iter
+    :returns: The formatted metrics.
+    :rtype: str
+    """
+    lines = []
+    for stat in sorted(stats.iterStats(), key=lambda s: s.name):
+        name = _metricName(stat.name)
+        lines.append("# TYPE %s %s" % (name, 'gauge' if stat.volatile else 'counter'))
+        lines.append("%s %s" % (name, _formatValue(stat.value)))
+    # group labelled metrics by name, so each TYPE line is written once
+    labelled = {}
+    for m in stats.iterLabelled():
+        labelled.setdefault(m.name, []).append(m)
+    for name,metrics in sorted(labelled.items()):
+        name = _metricName(name)
+        metrics.sort(key=lambda m: m.labels)
+        if isinstance(metrics[0], Histogram):
+            lines.append("# TYPE %s histogram" % name)
+            for m in metrics:
+                for bound,cumulative in m.cumulative():
+                    labels = m.labels + (('le', _formatValue(bound)),)
+                    lines.append("%s_bucket%s %i" % (name, _formatLabels(labels), cumulative))
+                lines.append("%s_sum%s %s" % (name, _formatLabels(m.labels), _formatValue(m.sum)))
+                lines.append("%s_count%s %i" % (name, _formatLabels(m.labels), m.count))
+        else:
+            lines.append("# TYPE %s counter" % name)
+            for m in metrics:
+                lines.append("%s%s %s" % (name, _formatLabels(m.labels), _formatValue(m.value)))
+    # scheduler task counters
+    tasks = sorted(tasks, key=lambda t: t.name)
+    for name,attr,mtype in (
+      ('terane_sched_task_running_workers', 'runningworkers', 'gauge'),
+      ('terane_sched_task_completed_workers', 'completedworkers', 'counter'),
+      ('terane_sched_task_queued_workers', 'queuedworkers', 'gauge'),
+      ('terane_sched_task_rejected_workers', 'rejectedworkers', 'counter'),
+      ('terane_sched_task_shed_workers', 'shedworkers', 'counter'),
+      ('terane_sched_task_running_seconds', 'runningtime', 'counter'),
+      ('terane_sched_task_waiting_seconds', 'waitingtime', 'counter'),
+      ('terane_sched_task_thread_running_seconds', 'threadrunningtime', 'counter'),
+      ('terane_sched_task_thread_waiting_seconds', 'threadwaitingtime', 'counter')):
+        if len(tasks) == 0:
+            break
+        lines.append("# TYPE %s %s" % (name, mtype))
+        for task in tasks:
+            labels = _formatLabels((('task', task.name),))
+            lines.append("%s%s %s" % (name, labels, _formatValue(getattr(task, attr))))
+    # scheduling class counters
+    classes = sorted(classes, key=lambda c: c.name)
+    for name,attr,mtype in (
+      ('terane_sched_class_running_seconds', 'runningtime', 'counter'),
+      ('terane_sched_class_threads', 'threads', 'gauge'),
+      ('terane_sched_class_thread_queue_depth', 'threadqueued', 'gauge')):
+        if len(classes) == 0:
+            break
+        lines.append("# TYPE %s %s" % (name, mtype))
+        for schedclass in classes:
+            labels = _formatLabels((('class', schedclass.name),))
+            lines.append("%s%s %s" % (name, labels, _formatValue(getattr(schedclass, attr))))
+    lines.append('')
+    return '\n'.join(lines)
+
+class MetricsResource(Resource):
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        scheduler = queryUtility(IScheduler)
+        tasks = scheduler.iterTasks() if scheduler != None else []
+        classes = scheduler.iterClasses() if scheduler != None else []
+        request.setHeader('Content-Type', 'text/plain; version=0.0.4')
+        return formatMetrics(stats, tasks, classes)
+
+class MetricsProtocol(Protocol):
+    """
+    Serves the server statistics over HTTP at /metrics, in the Prometheus
+    text exposition format.
+    """
+
+    implements(IProtocol)
+
+    def __init__(self, plugin, authmanager, querymanager):
+        self._plugin = plugin
+
+    def getDefaultPort(self):
+        return 45566
+
+    def makeFactory(self):
+        root = Resource()
+        root.putChild('metrics', MetricsResource())
+        return Site(root)
+
+class MetricsProtocolPlugin(Plugin):
+    implements(IPlugin)
+    components = [(MetricsProtocol, IProtocol, 'metrics')]
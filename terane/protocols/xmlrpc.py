@@ -16,8 +16,8 @@
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
 import xmlrpclib
-from twisted.internet.defer import inlineCallbacks, returnValue
-from twisted.web.xmlrpc import XMLRPC
+from twisted.internet.defer import inlineCallbacks, returnValue, maybeDeferred, CancelledError
+from twisted.web.xmlrpc import XMLRPC, withRequest
 from twisted.web.server import Site
 from twisted.cred.portal import IRealm
 from twisted.web.resource import IResource
@@ -57,8 +57,18 @@ class XMLRPCDispatcher(XMLRPC):
         self.tails = getStat('terane.protocols.xmlrpc.tail.count', 0)
         self.totaltailtime = getStat('terane.protocols.xmlrpc.tail.totaltime', 0.0)
 
+    def _cancelOnDisconnect(self, request, d):
+        """
+        Cancel the query Deferred if the client disconnects before the result
+        is returned.
+        """
+        request.notifyFinish().addErrback(lambda failure: d.cancel())
+        return d
+
+    @withRequest
     @inlineCallbacks
-    def xmlrpc_iterEvents(self, query, last=None, indices=None, limit=100, reverse=False, fields=None):
+    def xmlrpc_iterEvents(self, request, query, last=None, indices=None, limit=100, reverse=False,
+      fields=None, profile=False, timeout=None):
         try:
             if indices == None:
                 result = yield self._protocol._querymanager.listIndices()
@@ -67,9 +77,14 @@ class XMLRPCDispatcher(XMLRPC):
             if indices == []:
                 raise FaultNotAuthorized("not authorized to access the specified resource")
             self.iters += 1
-            result = yield self._protocol._querymanager.iterEvents(unicode(query), last, indices, limit, reverse, fields)
+            d = maybeDeferred(self._protocol._querymanager.iterEvents, unicode(query),
+                last, indices, limit, reverse, fields, profile, timeout)
+            result = yield self._cancelOnDisconnect(request, d)
             self.totalitertime += float(result.meta['runtime'])
             returnValue(result)
+        except CancelledError:
+            logger.debug("client disconnected, cancelled iter query")
+            returnValue(None)
         except xmlrpclib.Fault:
             raise
         except (QuerySyntaxError, QueryExecutionError), e:
@@ -78,8 +93,10 @@ class XMLRPCDispatcher(XMLRPC):
             logger.exception(e)
             raise FaultInternalError()
 
+    @withRequest
     @inlineCallbacks
-    def xmlrpc_tailEvents(self, query, last=None, indices=None, limit=100, fields=None):
+    def xmlrpc_tailEvents(self, request, query, last=None, indices=None, limit=100, fields=None,
+      profile=False, timeout=None):
         try:
             if indices == None:
                 result = yield self._protocol._querymanager.listIndices()
@@ -88,9 +105,14 @@ class XMLRPCDispatcher(XMLRPC):
             if indices == []:
                 raise FaultNotAuthorized("not authorized to access the specified resource")
             self.tails += 1
-            result = yield self._protocol._querymanager.tailEvents(unicode(query), last, indices, limit, fields)
+            d = maybeDeferred(self._protocol._querymanager.tailEvents, unicode(query),
+                last, indices, limit, fields, profile, timeout)
+            result = yield self._cancelOnDisconnect(request, d)
             self.totaltailtime += float(result.meta['runtime'])
             returnValue(result)
+        except CancelledError:
+            logger.debug("client disconnected, cancelled tail query")
+            returnValue(None)
         except xmlrpclib.Fault:
             raise
         except (QuerySyntaxError, QueryExecutionError), e:
@@ -130,6 +152,27 @@ class XMLRPCDispatcher(XMLRPC):
             logger.exception(e)
             raise FaultInternalError()
 
+    @inlineCallbacks
+    def xmlrpc_showFacets(self, fieldname, indices=None):
+        try:
+            if indices == None:
+                result = yield self._protocol._querymanager.listIndices()
+                indices = result.data
+            indices = [i for i in indices \
+              if self._protocol._authmanager.canAccess(self.avatarId, 'index', i, 'PERM::XMLRPC::FACETS')]
+            if indices == []:
+                raise FaultNotAuthorized("not authorized to access the specified resource")
+            result = yield maybeDeferred(self._protocol._querymanager.showFacets,
+                unicode(fieldname), indices)
+            returnValue(result)
+        except xmlrpclib.Fault:
+            raise
+        except (QuerySyntaxError, QueryExecutionError), e:
+            raise FaultBadRequest(e)
+        except Exception, e:
+            logger.exception(e)
+            raise FaultInternalError()
+
     def xmlrpc_showStats(self, name, recursive=False):
         try:
             return stats.showStats(name, recursive)
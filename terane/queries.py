@@ -18,17 +18,19 @@
 import time
 from zope.interface import Interface, implements
 from zope.component import getUtility
-from twisted.internet.defer import succeed
+from twisted.internet.defer import Deferred, DeferredList, maybeDeferred, succeed
 from twisted.python.failure import Failure
 from terane.manager import IManager, Manager
-from terane.sched import IScheduler
+from terane.sched import IScheduler, CLASS_INTERACTIVE, SchedulerOverloaded, DeadlineExceeded
 from terane.routes import IIndexStore
 from terane.bier.evid import EVID
 from terane.bier.ql import parseIterQuery, parseTailQuery
 from terane.bier.searching import SearcherWorker, Period, SearcherError
+from terane.settings import ConfigureError
 from terane.loggers import getLogger
 
 logger = getLogger('terane.queries')
+slowlogger = getLogger('terane.queries.slow')
 
 class QueryExecutionError(Exception):
     """
@@ -51,7 +53,7 @@ class QueryResult(object):
         return "<QueryResult meta=%s, data=%s>" % (self.meta, self.data)
 
 class IQueryManager(Interface):
-    def iterEvents(query, lastId, indices, limit, reverse, fields):
+    def iterEvents(query, lastId, indices, limit, reverse, fields, profile, timeout):
         """
         Iterate through indices for events matching the specified query.
 
@@ -67,10 +69,15 @@ class IQueryManager(Interface):
         :type reverse: bool
         :param fields: A list of fields to return in the results, or None to return all fields.
         :type fields: list
+        :param profile: If True, then return the query profile in the result metadata.
+        :type profile: bool
+        :param timeout: The number of seconds after which the query is cancelled,
+          or None to use the server default.
+        :type timeout: float
         :returns: A Deferred object which receives the results.
         :rtype: :class:`twisted.internet.defer.Deferred`
         """
-    def tailEvents(query, lastId, indices, limit, fields):
+    def tailEvents(query, lastId, indices, limit, fields, profile, timeout):
         """
         Return events newer than the specified 'lastId' event ID matching the
         specified query.
@@ -85,6 +92,11 @@ class IQueryManager(Interface):
         :type limit: int
         :param fields: A list of fields to return in the results, or None to return all fields.
         :type fields: list
+        :param profile: If True, then return the query profile in the result metadata.
+        :type profile: bool
+        :param timeout: The number of seconds after which the query is cancelled,
+          or None to use the server default.
+        :type timeout: float
         :returns: A Deferred object which receives the results.
         :rtype: :class:`twisted.internet.defer.Deferred`
         """
@@ -107,6 +119,19 @@ class IQueryManager(Interface):
         :rtype: :class:`twisted.internet.defer.Deferred`
         """
 
+    def showFacets(fieldname, indices):
+        """
+        Return the number of events containing each value of the specified
+        columnar field.
+
+        :param fieldname: The name of the columnar field.
+        :type fieldname: unicode
+        :param indices: A list of indices to count, or None to count all indices.
+        :type indices: list, or None
+        :returns: A Deferred object which receives the results.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+
 class QueryManager(Manager):
 
     implements(IManager, IQueryManager)
@@ -119,12 +144,68 @@ class QueryManager(Manager):
         self._indexstore = indexstore
         self.maxResultSize = 10
         self.maxIterations = 5
-        self._task = getUtility(IScheduler).addTask(self.name)
+        self._task = getUtility(IScheduler).addTask(self.name, schedclass=CLASS_INTERACTIVE)
 
     def configure(self, settings):
-        pass
+        section = settings.section('server')
+        self.slowQueryThreshold = section.getFloat('slow query threshold', 10.0)
+        if self.slowQueryThreshold < 0.0:
+            raise ConfigureError("'slow query threshold' cannot be smaller than 0")
+        self._task.maxworkers = section.getInt('query max workers', 8)
+        if self._task.maxworkers < 0:
+            raise ConfigureError("'query max workers' cannot be smaller than 0")
+        self._task.maxqueued = section.getInt('query max queued', 32)
+        if self._task.maxqueued < 0:
+            raise ConfigureError("'query max queued' cannot be smaller than 0")
+        self.queryTimeout = section.getFloat('query timeout', 0.0)
+        if self.queryTimeout < 0.0:
+            raise ConfigureError("'query timeout' cannot be smaller than 0")
+
+    def _getDeadline(self, timeout):
+        """
+        Returns the deadline for a query with the specified timeout, or None
+        if the query has no deadline.
+        """
+        if timeout == None:
+            timeout = self.queryTimeout
+        if timeout > 0.0:
+            return time.time() + timeout
+        return None
+
+    def _runSearcher(self, searcher):
+        """
+        Schedule the searcher, returning the Worker and a Deferred which fires
+        when the search is finished.  Cancelling the Deferred cancels the
+        search, which stops at the next posting boundary and releases its
+        cursors and snapshot.
+        """
+        try:
+            worker = self._task.addWorker(searcher)
+        except SchedulerOverloaded, e:
+            raise QueryExecutionError("server is overloaded, try again later")
+        d = Deferred(lambda d: searcher.cancel("search was cancelled by the client"))
+        worker.whenDone().chainDeferred(d)
+        return worker, d
+
+    def _profileQuery(self, query, searcher, worker, profile, meta):
+        """
+        Complete the profile collected by the searcher with the time the
+        worker spent running and waiting in the scheduler.  If the query ran
+        for longer than the slow query threshold, then log the profile to the
+        slow query log.  If profile is True, then add the profile to meta.
+        """
+        queryprofile = dict(searcher.profile)
+        queryprofile['query'] = query
+        queryprofile['runtime'] = searcher.runtime
+        queryprofile['runningtime'] = worker.runningtime
+        queryprofile['waitingtime'] = worker.waitingtime
+        queryprofile['queuedtime'] = worker.queuedtime
+        if self.slowQueryThreshold > 0.0 and searcher.runtime >= self.slowQueryThreshold:
+            slowlogger.info("slow query took %f seconds: %s" % (searcher.runtime, queryprofile))
+        if profile == True:
+            meta['profile'] = queryprofile
 
-    def iterEvents(self, query, lastId=None, indices=None, limit=100, reverse=False, fields=None):
+    def iterEvents(self, query, lastId=None, indices=None, limit=100, reverse=False, fields=None, profile=False, timeout=None):
         """
         Iterate through the database for events matching the specified query.
 
@@ -140,6 +221,11 @@ class QueryManager(Manager):
         :type reverse: bool
         :param fields: A list of fields to return in the results, or None to return all fields.
         :type fields: list
+        :param profile: If True, then return the query profile in the result metadata.
+        :type profile: bool
+        :param timeout: The number of seconds after which the query is cancelled,
+          or None to use the server default.
+        :type timeout: float
         :returns: A Deferred object which receives the results.
         :rtype: :class:`twisted.internet.defer.Deferred`
         """
@@ -157,20 +243,25 @@ class QueryManager(Manager):
         # check that limit is > 0
         if limit < 1:
             raise QueryExecutionError("limit must be greater than 0")
+        querystring = query
         query,period = parseIterQuery(query)
-        logger.trace("iter query: %s" % query)
-        logger.trace("iter period: %s" % period)
+        logger.trace("iter query: %s", query)
+        logger.trace("iter period: %s", period)
         # query each index and return the results
         def _returnIterResult(result):
             if isinstance(result, Failure): 
-                if result.check(SearcherError):
+                if result.check(SearcherError, DeadlineExceeded):
                     raise QueryExecutionError(result.getErrorMessage())
                 result.raiseException()
-            return QueryResult({'runtime': result.runtime, 'fields': result.fields}, result.events)
-        worker = SearcherWorker(indices, query, period, lastId, reverse, fields, limit)
-        return self._task.addWorker(worker).whenDone().addBoth(_returnIterResult)
+            metadata = {'runtime': result.runtime, 'fields': result.fields}
+            self._profileQuery(querystring, result, worker, profile, metadata)
+            return QueryResult(metadata, result.events)
+        searcher = SearcherWorker(indices, query, period, lastId, reverse, fields, limit,
+            self._getDeadline(timeout))
+        worker,d = self._runSearcher(searcher)
+        return d.addBoth(_returnIterResult)
 
-    def tailEvents(self, query, lastId=None, indices=None, limit=100, fields=None):
+    def tailEvents(self, query, lastId=None, indices=None, limit=100, fields=None, profile=False, timeout=None):
         """
         Return events newer than the specified 'lastId' event ID matching the
         specified query.
@@ -185,6 +276,11 @@ class QueryManager(Manager):
         :type limit: int
         :param fields: A list of fields to return in the results, or None to return all fields.
         :type fields: list
+        :param profile: If True, then return the query profile in the result metadata.
+        :type profile: bool
+        :param timeout: The number of seconds after which the query is cancelled,
+          or None to use the server default.
+        :type timeout: float
         :returns: A Deferred object which receives the results.
         :rtype: :class:`twisted.internet.defer.Deferred`
         """
@@ -206,21 +302,27 @@ class QueryManager(Manager):
         # check that limit is > 0
         if limit < 1:
             raise QueryExecutionError("limit must be greater than 0")
+        querystring = query
         query = parseTailQuery(query)
-        logger.trace("tail query: %s" % query)
+        logger.trace("tail query: %s", query)
         period = Period(lastId, EVID.fromString(EVID.MAX_ID), True, False)
-        logger.trace("tail period: %s" % period)
+        logger.trace("tail period: %s", period)
         # query each index, and return the results
         def _returnTailResult(result, lastId=None):
-            if isinstance(result, Failure) and result.check(SearcherError):
-                raise QueryExecutionError(str(e))
+            if isinstance(result, Failure):
+                if result.check(SearcherError, DeadlineExceeded):
+                    raise QueryExecutionError(result.getErrorMessage())
+                result.raiseException()
             events = list(result.events)
             if len(events) > 0:
                 lastId = events[-1][0]
             metadata = {'runtime': result.runtime, 'lastId': str(lastId), 'fields': result.fields}
+            self._profileQuery(querystring, result, worker, profile, metadata)
             return QueryResult(metadata, events)
-        worker = SearcherWorker(indices, query, period, None, False, fields, limit)
-        return self._task.addWorker(worker).whenDone().addBoth(_returnTailResult, lastId)
+        searcher = SearcherWorker(indices, query, period, None, False, fields, limit,
+            self._getDeadline(timeout))
+        worker,d = self._runSearcher(searcher)
+        return d.addBoth(_returnTailResult, lastId)
 
     def showIndex(self, name):
         """
@@ -239,6 +341,47 @@ class QueryManager(Manager):
             raise QueryExecutionError("unknown index '%s'" % e)
         return succeed(QueryResult(index.getStats(), index.schema().listFields()))
 
+    def showFacets(self, fieldname, indices=None):
+        """
+        Return the number of events containing each value of the specified
+        columnar field.  The counts are read from the column counts stored in
+        each index segment, so no events are scanned.  Indices in which the
+        field is not columnar don't contribute to the counts.  The result data
+        is a list of [value, count] pairs, ordered by descending count.
+
+        :param fieldname: The name of the columnar field.
+        :type fieldname: unicode
+        :param indices: A list of indices to count, or None to count all indices.
+        :type indices: list, or None
+        :returns: A Deferred object which receives the results.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        # look up the named indices
+        if indices == None:
+            indices = tuple(self._indexstore.iterSearchableIndices())
+        else:
+            try:
+                indices = tuple(self._indexstore.getSearchableIndex(name) for name in indices)
+            except KeyError, e:
+                raise QueryExecutionError("unknown index '%s'" % e)
+        start = time.time()
+        # add up the counts from each index
+        def _returnFacetsResult(results):
+            facets = {}
+            for success,result in results:
+                if not success:
+                    if result.check(SearcherError):
+                        raise QueryExecutionError(result.getErrorMessage())
+                    result.raiseException()
+                for value,count in result.items():
+                    facets[value] = facets.get(value, 0) + count
+            data = [[value,count] for value,count
+                in sorted(facets.items(), key=lambda item: item[1], reverse=True)]
+            return QueryResult({'runtime': time.time() - start, 'field': fieldname}, data)
+        d = DeferredList([maybeDeferred(index.getFacets, fieldname) for index in indices],
+            consumeErrors=True)
+        return d.addCallback(_returnFacetsResult)
+
     def listIndices(self):
         """
         Return a list of names of the indices present.
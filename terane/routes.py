@@ -15,24 +15,37 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
 from zope.interface import Interface, implements
 from twisted.application.service import Service
+from twisted.internet.defer import DeferredList, maybeDeferred
 from twisted.internet.task import cooperate
 from terane.manager import IManager, Manager
 from terane.plugins import IPluginStore
 from terane.bier import IEventFactory, IFieldStore
+from terane.bier.event import Event, EventBatch
 from terane.inputs import IInput
 from terane.outputs import IOutput, ISearchable
 from terane.filters import IFilter, StopFiltering
 from terane.signals import SignalCancelled
 from terane.settings import ConfigureError
+from terane.stats import getHistogram, getCounter
 from terane.loggers import getLogger
 
 logger = getLogger('terane.routes')
 
 class EventProcessor(object):
-    def __init__(self, event, filters, fieldstore):
-        self.event = event
+    """
+    Runs a batch of events through the filter chain.  Each iteration runs one
+    filter over every event in the batch.  Events which are dropped by a
+    filter, or which fail to validate, are removed from the batch.  The time
+    spent filtering and validating each batch is recorded in the route's
+    histograms.
+    """
+
+    def __init__(self, route, events, filters, fieldstore):
+        self.events = events
+        self._route = route
         self._filters = filters
         self._curr = 0
         self._fieldstore = fieldstore
@@ -40,12 +53,38 @@ class EventProcessor(object):
     def next(self):
         if self._curr == len(self._filters):
             raise StopIteration()
-        filter = self._filters[self._curr]
+        filter,filtertime = self._filters[self._curr]
         self._curr += 1
         contract = filter.getContract()
-        contract.validateEventBefore(self.event, self._fieldstore)
-        self.event = filter.filter(self.event)
-        contract.validateEventAfter(self.event, self._fieldstore)
+        # validate, filter, then validate again, timing each pass as a whole
+        start = time.time()
+        validated = []
+        for event in self.events:
+            try:
+                contract.validateEventBefore(event, self._fieldstore)
+                validated.append(event)
+            except Exception, e:
+                logger.debug("[route:%s] error processing event: %s", self._route.name,e)
+        self._route._validatetime.since(start)
+        start = time.time()
+        filtered = []
+        for event in validated:
+            try:
+                filtered.append(filter.filter(event))
+            except StopFiltering, e:
+                logger.debug("[route:%s] dropped event: %s", self._route.name,e)
+            except Exception, e:
+                logger.debug("[route:%s] error processing event: %s", self._route.name,e)
+        filtertime.since(start)
+        start = time.time()
+        self.events = []
+        for event in filtered:
+            try:
+                contract.validateEventAfter(event, self._fieldstore)
+                self.events.append(event)
+            except Exception, e:
+                logger.debug("[route:%s] error processing event: %s", self._route.name,e)
+        self._route._validatetime.since(start)
 
 class Route(Service):
     """
@@ -86,6 +125,13 @@ class Route(Service):
                 self._final = contract.validateContract(self._final)
             except Exception, e:
                 raise ConfigureError("element #%i: %s" % (i, e))
+        # create the route statistics
+        self._dispatchtime = getHistogram('terane.route.dispatch.seconds', route=self.name)
+        self._validatetime = getHistogram('terane.route.validate.seconds', route=self.name)
+        self._filters = [(f, getHistogram('terane.route.filter.seconds', route=self.name, filter=f.name))
+            for f in self._filters]
+        self._receivedevents = getCounter('terane.route.received.events', route=self.name)
+        self._processedevents = getCounter('terane.route.processed.events', route=self.name)
         logger.debug("[route:%s] route configuration: %s" %
             (self.name, ' -> '.join([e.name for e in chain])))
 
@@ -97,39 +143,64 @@ class Route(Service):
         if self.d != None:
             self._input.getDispatcher().disconnectSignal(self.d)
             self.d = None
-        logger.debug("[route:%s] stopped processing route" % self.name)
+        logger.debug("[route:%s] stopped processing route", self.name)
 
     def _scheduleReceivedEvent(self):
         self.d = self._input.getDispatcher().connectSignal()
         self.d.addCallbacks(self._receivedEvent, lambda failure: failure)
         self.d.addErrback(self._errorReceivingEvent)
 
-    def _receivedEvent(self, event):
-        # run the fields through the filter chain, then reschedule the signal
-        self._input.getContract().validateEventAfter(event, self.parent._fieldstore)
-        task = cooperate(EventProcessor(event, self._filters, self.parent._fieldstore))
-        d = task.whenDone()
-        d.addCallbacks(self._processedEvent, lambda failure: failure)
-        d.addErrback(self._errorProcessingEvent)
+    def _receivedEvent(self, result):
+        # inputs may signal either a single event or a batch of events
+        if isinstance(result, Event):
+            result = [result]
+        start = time.time()
+        self._receivedevents += len(result)
+        contract = self._input.getContract()
+        events = []
+        for event in result:
+            try:
+                contract.validateEventAfter(event, self.parent._fieldstore)
+                events.append(event)
+            except Exception, e:
+                logger.debug("[route:%s] error receiving event: %s", self.name,e)
+        self._validatetime.since(start)
+        # run the events through the filter chain, then reschedule the signal
+        processor = EventProcessor(self, events, self._filters, self.parent._fieldstore)
+        d = cooperate(processor).whenDone()
+        d.addCallbacks(self._processedEvents, lambda failure: failure)
+        d.addErrback(self._errorProcessingEvents)
+        # let the input know when the output has stored the events
+        if isinstance(result, EventBatch):
+            result.addWrite(d)
         self._scheduleReceivedEvent()
+        self._dispatchtime.since(start)
 
     def _errorReceivingEvent(self, failure):
         if not failure.check(SignalCancelled):
-            logger.debug("[route:%s] error receiving event: %s" % (self.name,str(failure)))
+            logger.debug("[route:%s] error receiving event: %s", self.name,failure)
             self._scheduleReceivedEvent()
             return failure
 
-    def _processedEvent(self, processor):
-        logger.debug("[route:%s] processed event" % self.name)
-        self._output.getContract().validateEventBefore(processor.event, self.parent._fieldstore)
-        event = self._final.finalizeEvent(processor.event)
-        self._output.receiveEvent(event)
+    def _processedEvents(self, processor):
+        logger.debug("[route:%s] processed %i events", self.name,len(processor.events))
+        start = time.time()
+        contract = self._output.getContract()
+        events = []
+        for event in processor.events:
+            try:
+                contract.validateEventBefore(event, self.parent._fieldstore)
+                events.append(self._final.finalizeEvent(event))
+            except Exception, e:
+                logger.debug("[route:%s] error processing event: %s", self.name,e)
+        self._validatetime.since(start)
+        self._processedevents += len(events)
+        if len(events) > 0:
+            return self._output.receiveEvents(events)
 
-    def _errorProcessingEvent(self, failure):
-        if not failure.check(StopFiltering):
-            logger.debug("[route:%s] error processing event: %s" % (self.name,str(failure)))
-            return failure
-        logger.debug("[route:%s] dropped event: %s" % (self.name,e))
+    def _errorProcessingEvents(self, failure):
+        logger.debug("[route:%s] error processing events: %s", self.name,failure)
+        return failure
 
 class IIndexStore(Interface):
     def getSearchableIndex(name):
@@ -254,11 +325,14 @@ class RouteManager(Manager):
             input.startService()
 
     def stopService(self):
+        stopping = []
         for input in self._inputs.values():
-            input.stopService()
+            stopping.append(maybeDeferred(input.stopService))
+        # outputs may need to wait for pending work before they are stopped
         for output in self._outputs.values():
-            output.stopService()
-        return Manager.stopService(self)
+            stopping.append(maybeDeferred(output.stopService))
+        stopping.append(Manager.stopService(self))
+        return DeferredList(stopping)
 
     def getSearchableIndex(self, name):
         """
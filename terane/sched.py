@@ -15,18 +15,41 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
+import threading
 from time import time
 from types import GeneratorType
+from collections import deque
 from zope.interface import Interface, implements
 from twisted.application.service import Service
-from twisted.internet.task import Cooperator
+from twisted.internet.task import Cooperator, TaskStopped
 from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread, deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+from twisted.python.failure import Failure
+from terane.settings import ConfigureError
 from terane.loggers import getLogger
 
 logger = getLogger('terane.sched')
 
+CLASS_INGEST = 'ingest'
+CLASS_INTERACTIVE = 'interactive'
+CLASS_BACKGROUND = 'background'
+
+class SchedulerOverloaded(Exception):
+    """
+    The worker could not be added because the task's queue is full.
+    """
+    pass
+
+class DeadlineExceeded(Exception):
+    """
+    The worker was shed because it ran past its scheduling class deadline
+    while the scheduler was overloaded.
+    """
+    pass
+
 class IScheduler(Interface):
-    def addTask(name, nice):
+    def addTask(name, nice, schedclass, maxworkers, maxqueued):
         """
         Create a new Task and add it to the Scheduler.
         """
@@ -38,11 +61,99 @@ class IScheduler(Interface):
         """
         Returns an iterator which yields each Task in the Scheduler.
         """
+    def iterClasses():
+        """
+        Returns an iterator which yields each SchedulingClass in the Scheduler.
+        """
+    def deferToThread(schedclass, f, *args, **kwds):
+        """
+        Call f in a thread from the thread pool of the specified scheduling
+        class, returning a Deferred which fires with the result.
+        """
+
+_currentTask = None
+
+def currentTask():
+    """
+    Returns the Task whose worker is currently running, or None if called
+    from outside of a worker.  Objects created by a worker can remember the
+    Task, and later charge their thread pool work to it using
+    :func:`deferToTask`.
+
+    :returns: The current Task, or None.
+    :rtype: :class:`terane.sched.Task`
+    """
+    return _currentTask
+
+def deferToTask(task, f, *args, **kwds):
+    """
+    Call f in a thread from the thread pool of the task's scheduling class,
+    and charge the time spent to the task.  If task is None, then f is
+    called in the reactor thread pool.
+
+    :param task: The Task to charge, or None.
+    :type task: :class:`terane.sched.Task`
+    :param f: The function to call.
+    :type f: callable
+    :returns: A Deferred which fires with the result of f.
+    :rtype: :class:`twisted.internet.defer.Deferred`
+    """
+    if task == None:
+        return deferToThread(f, *args, **kwds)
+    return task.deferToThread(f, *args, **kwds)
+
+class SchedulingClass(object):
+    """
+    A group of Tasks which share the scheduler according to the class weight.
+    The virtual time of the class is the running time of its tasks divided by
+    the weight, and the scheduler always runs the class with the smallest
+    virtual time next.
+    """
+
+    def __init__(self, name, weight, deadline, threads):
+        """
+        :param name: The class name.
+        :type name: str
+        :param weight: The relative share of the scheduler given to the class.
+        :type weight: int
+        :param deadline: The number of seconds a worker may run while the
+          scheduler is overloaded before it is shed, or 0 for no deadline.
+        :type deadline: float
+        :param threads: The maximum size of the class thread pool.
+        :type threads: int
+        """
+        self.name = name
+        self.weight = weight
+        self.deadline = deadline
+        self.threads = threads
+        self.vtime = 0.0
+        self.runningtime = 0.0
+        self.threadqueued = 0
+        self._pending = deque()
+        self._pool = None
+        self._poollock = threading.Lock()
+
+    def __str__(self):
+        return "<SchedulingClass %s weight=%i>" % (self.name, self.weight)
+
+class _PendingCall(object):
+    """
+    A unit of work waiting to be dispatched by the scheduler.  Cooperators
+    expect their scheduler to return an object which can be cancelled.
+    """
+
+    def __init__(self, callable_):
+        self.callable = callable_
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
 
 class Scheduler(Service):
     """
-    The toplevel scheduler which manages Tasks and dispatches work
-    using a round-robin algorithm.
+    The toplevel scheduler which manages Tasks and dispatches work.  Each
+    Task belongs to a scheduling class, and the classes share the scheduler
+    using weighted fair queueing.  Tasks within a class are run round-robin.
     """
 
     implements(IScheduler)
@@ -59,21 +170,132 @@ class Scheduler(Service):
         self.timeslice = timeslice
         self._epsilon = epsilon
         self._tasks = set()
+        self._classes = {}
+        for name,weight,deadline,threads in ((CLASS_INGEST, 4, 0.0, 4),
+          (CLASS_INTERACTIVE, 2, 30.0, 8), (CLASS_BACKGROUND, 1, 0.0, 2)):
+            self._classes[name] = SchedulingClass(name, weight, deadline, threads)
+        self._nextTick = None
         if reactor == None:
             from twisted.internet import reactor as reactor_
             self._reactor = reactor_
         else:
             self._reactor = reactor
 
+    def configure(self, settings):
+        section = settings.section('server')
+        self.timeslice = section.getFloat('scheduler timeslice', self.timeslice)
+        if self.timeslice <= 0.0:
+            raise ConfigureError("'scheduler timeslice' must be greater than 0")
+        for schedclass in self._classes.values():
+            schedclass.weight = section.getInt("%s weight" % schedclass.name, schedclass.weight)
+            if schedclass.weight < 1:
+                raise ConfigureError("'%s weight' must be greater than 0" % schedclass.name)
+            schedclass.deadline = section.getFloat("%s deadline" % schedclass.name, schedclass.deadline)
+            if schedclass.deadline < 0.0:
+                raise ConfigureError("'%s deadline' cannot be smaller than 0" % schedclass.name)
+            schedclass.threads = section.getInt("%s threads" % schedclass.name, schedclass.threads)
+            if schedclass.threads < 1:
+                raise ConfigureError("'%s threads' must be greater than 0" % schedclass.name)
+
     def startService(self):
         Service.startService(self)
+        for schedclass in self._classes.values():
+            schedclass._pool = ThreadPool(0, schedclass.threads, "terane-%s" % schedclass.name)
+            schedclass._pool.start()
         logger.debug("started scheduler with timeslice=%f, epsilon=%f" % (
                      self.timeslice, self._epsilon))
 
-    def _invoke(self, callable_, *args, **kwds):
-        return self._reactor.callLater(self._epsilon, callable_, *args, **kwds)
+    def deferToThread(self, schedclass, f, *args, **kwds):
+        """
+        Call f in a thread from the thread pool of the specified scheduling
+        class.  If the scheduler is not running, then f is called in the
+        reactor thread pool.
+
+        :param schedclass: The scheduling class name.
+        :type schedclass: str
+        :param f: The function to call.
+        :type f: callable
+        :returns: A Deferred which fires with the result of f.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        return self._deferToThread(self._classes[schedclass], None, f, args, kwds)
+
+    def _deferToThread(self, schedclass, task, f, args, kwds):
+        pool = schedclass._pool
+        if pool == None:
+            return deferToThread(f, *args, **kwds)
+        with schedclass._poollock:
+            schedclass.threadqueued += 1
+        times = [time(), None, None]
+        def _runInThread():
+            times[1] = time()
+            with schedclass._poollock:
+                schedclass.threadqueued -= 1
+            try:
+                return f(*args, **kwds)
+            finally:
+                times[2] = time()
+        def _charge(result):
+            if task != None and times[2] != None:
+                task.threadwaitingtime += times[1] - times[0]
+                task.threadrunningtime += times[2] - times[1]
+            return result
+        return deferToThreadPool(self._reactor, pool, _runInThread).addBoth(_charge)
+
+    def _invoke(self, schedclass, callable_):
+        call = _PendingCall(callable_)
+        if len(schedclass._pending) == 0:
+            # a class doesn't accumulate credit while it is idle
+            active = [c.vtime for c in self._classes.values() if len(c._pending) > 0]
+            if len(active) > 0:
+                schedclass.vtime = max(schedclass.vtime, min(active))
+        schedclass._pending.append(call)
+        if self._nextTick == None:
+            self._nextTick = self._reactor.callLater(self._epsilon, self._tick)
+        return call
+
+    def _tick(self):
+        self._nextTick = None
+        try:
+            # run the class which has received the least weighted running time
+            schedclass = None
+            for c in self._classes.values():
+                if len(c._pending) == 0:
+                    continue
+                if schedclass == None or c.vtime < schedclass.vtime:
+                    schedclass = c
+            if schedclass == None:
+                return
+            call = schedclass._pending.popleft()
+            if call.cancelled:
+                return
+            start = time()
+            try:
+                call.callable()
+            finally:
+                elapsed = time() - start
+                schedclass.runningtime += elapsed
+                schedclass.vtime += elapsed / schedclass.weight
+        finally:
+            # yield to the reactor between each unit of work
+            for c in self._classes.values():
+                if len(c._pending) > 0:
+                    self._nextTick = self._reactor.callLater(self._epsilon, self._tick)
+                    break
 
-    def addTask(self, name='', nice=1.0):
+    def _isOverloaded(self, schedclass):
+        """
+        Returns True if workers of another scheduling class are waiting for a
+        slot in their task.  Work which is merely pending in another class
+        doesn't count, since the classes already share the scheduler by
+        weight, and under steady ingest some work is always pending.
+        """
+        for task in self._tasks:
+            if task.schedclass is not schedclass and len(task._queue) > 0:
+                return True
+        return False
+
+    def addTask(self, name='', nice=1.0, schedclass=CLASS_BACKGROUND, maxworkers=0, maxqueued=0):
         """
         Create a new Task and add it to the Scheduler.
 
@@ -81,10 +303,16 @@ class Scheduler(Service):
         :type name: str
         :param nice: The timeslice multiplier.
         :type nice: float
+        :param schedclass: The scheduling class of the task.
+        :type schedclass: str
+        :param maxworkers: The maximum number of concurrent workers, or 0 for no limit.
+        :type maxworkers: int
+        :param maxqueued: The maximum number of workers waiting to run, or 0 for no limit.
+        :type maxqueued: int
         :returns: A new Task object.
         :rtype: :class:`terane.sched.Task`
         """
-        task = Task(self, name, nice)
+        task = Task(self, name, nice, self._classes[schedclass], maxworkers, maxqueued)
         self._tasks.add(task)
         logger.debug("added task %s to scheduler" % task)
         return task
@@ -99,11 +327,27 @@ class Scheduler(Service):
         """
         return iter(self._tasks)
 
+    def iterClasses(self):
+        """
+        Returns an iterator enumerating each scheduling class.
+
+        :returns: An iterator enumerating :class:`terane.sched.SchedulingClass` objects.
+        :rtype: iter
+        """
+        return self._classes.itervalues()
+
     def stopService(self):
         ntasks = len(self._tasks)
         for task in self.iterTasks():
             task.close()
         self._tasks = set()
+        if self._nextTick != None:
+            self._nextTick.cancel()
+            self._nextTick = None
+        for schedclass in self._classes.values():
+            if schedclass._pool != None:
+                schedclass._pool.stop()
+                schedclass._pool = None
         Service.stopService(self)
         logger.debug("stopped scheduler (%i tasks killed)" % ntasks)
 
@@ -112,6 +356,7 @@ STATE_RUNNING = 1
 STATE_WAITING = 2
 STATE_STOPPED = 3
 STATE_DONE = 4
+STATE_QUEUED = 5
 
 class Governor(object):
 
@@ -123,16 +368,24 @@ class Governor(object):
 
 class Task(object):
     
-    def __init__(self, sched, name, nice):
+    def __init__(self, sched, name, nice, schedclass, maxworkers=0, maxqueued=0):
         self._sched = sched
         self._cooperator = Cooperator(self._check, self._schedule)
         self._whenStateChanges = None
+        self._queue = deque()
         self.name = name
         self.nice = nice
+        self.schedclass = schedclass
+        self.maxworkers = maxworkers
+        self.maxqueued = maxqueued
         self.runningworkers = 0
         self.completedworkers = 0
+        self.rejectedworkers = 0
+        self.shedworkers = 0
         self.runningtime = 0.0
         self.waitingtime = 0.0
+        self.threadrunningtime = 0.0
+        self.threadwaitingtime = 0.0
         self.state = STATE_READY
         self.started = time()
 
@@ -140,7 +393,31 @@ class Task(object):
         return Governor(self, self._sched)
 
     def _schedule(self, callable_):
-        return self._sched._invoke(callable_)
+        return self._sched._invoke(self.schedclass, callable_)
+
+    @property
+    def queuedworkers(self):
+        return len(self._queue)
+
+    def deferToThread(self, f, *args, **kwds):
+        """
+        Call f in a thread from the thread pool of the task's scheduling
+        class.  The time f spends waiting for a thread and running is
+        charged to the task.
+
+        :param f: The function to call.
+        :type f: callable
+        :returns: A Deferred which fires with the result of f.
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        return self._sched._deferToThread(self.schedclass, self, f, args, kwds)
+
+    def _isOverloaded(self):
+        """
+        Returns True if workers are waiting for a slot in this task, or in
+        a task of another scheduling class.
+        """
+        return len(self._queue) > 0 or self._sched._isOverloaded(self.schedclass)
 
     def _changeState(self, state):
         if state == self.state:
@@ -154,19 +431,31 @@ class Task(object):
     def addWorker(self, iterator):
         """
         Adds a worker to the Task.  The worker needs to conform to the
-        iterator interface.
+        iterator interface.  If the task is already running the maximum
+        number of workers, then the worker is queued until a slot is free.
 
         :param iterator: the worker which is executed a step at a time.
         :type iterator: iter
         :returns: A new Worker.
         :rtype: :class:`terane.sched.Worker`
+        :raises SchedulerOverloaded: The task's queue is full.
         """
-        worker = Worker(self, iterator)
+        if self.maxworkers > 0 and self.runningworkers >= self.maxworkers:
+            if self.maxqueued > 0 and len(self._queue) >= self.maxqueued:
+                self.rejectedworkers += 1
+                raise SchedulerOverloaded("task %s has too many queued workers" % self.name)
+            worker = Worker(self, iterator)
+            self._queue.append(worker)
+        else:
+            worker = Worker(self, iterator)
+            self._startWorker(worker)
+        return worker
+
+    def _startWorker(self, worker):
         self.runningworkers += 1
         if self.state == STATE_READY:
             self._changeState(STATE_RUNNING)
-        worker.whenDone().addCallbacks(self._taskDone, self._taskError)
-        return worker
+        worker._start()
 
     def whenStateChanges(self):
         """
@@ -188,24 +477,24 @@ class Task(object):
         """
         cooperator = self._cooperator
         self._cooperator = None
+        while len(self._queue) > 0:
+            self._queue.popleft()._cancel()
         cooperator.stop()
 
-    def _taskDone(self, result):
+    def _workerFinished(self, worker):
         self.completedworkers += 1
         self.runningworkers -= 1
+        if self._cooperator == None:
+            if self.runningworkers == 0:
+                self._changeState(STATE_DONE)
+            return
+        # start any queued workers which now fit
+        while len(self._queue) > 0:
+            if self.maxworkers > 0 and self.runningworkers >= self.maxworkers:
+                break
+            self._startWorker(self._queue.popleft())
         if self.runningworkers == 0:
             self._changeState(STATE_READY)
-        return result
-
-    def _taskError(self, failure):
-        self.completedworkers += 1
-        self.runningworkers -= 1
-        if self.runningworkers == 0:
-            if self._cooperator == None:
-                self._changeState(STATE_DONE)
-            else:
-                self._changeState(STATE_READY)
-        return failure
 
 class Worker(object):
     """
@@ -216,11 +505,28 @@ class Worker(object):
         self._iterable = iterable
         self._waitResume = None
         self._waitingStart = None
-        self._ctask = task._cooperator.cooperate(self)
-        self._ctask.whenDone().addCallbacks(self._workerDone, self._workerError)
-        self._whenDone = None
+        self._ctask = None
+        self._whenDone = Deferred()
+        self._shed = False
         self.iterable = iterable
+        self.state = STATE_QUEUED
+        self.queued = time()
+        self.started = None
+        self.queuedtime = 0.0
+        self.runningtime = 0.0
+        self.waitingtime = 0.0
+
+    def _start(self):
+        self.started = time()
+        self.queuedtime = self.started - self.queued
         self.state = STATE_RUNNING
+        self._ctask = self._task._cooperator.cooperate(self)
+        self._ctask.whenDone().addCallbacks(self._workerDone, self._workerError)
+
+    def _cancel(self):
+        self.state = STATE_DONE
+        if self._whenDone != None:
+            self._whenDone.errback(Failure(TaskStopped()))
 
     def whenDone(self):
         """
@@ -238,14 +544,31 @@ class Worker(object):
         return self
 
     def next(self):
+        deadline = self._task.schedclass.deadline
+        if deadline > 0.0 and not self._shed and time() - self.started > deadline:
+            if self._task._isOverloaded():
+                self._waitResume = None
+                return self._shedWorker(deadline)
         if self._waitResume != None:
             toResume = self._waitResume
             self._waitResume = None
             return self._run(toResume)
-        else:
-            return self._run(self._iterable.next)
+        return self._run(self._iterable.next)
+
+    def _shedWorker(self, deadline):
+        self._shed = True
+        self._task.shedworkers += 1
+        logger.info("shedding worker in task %s after %f seconds", self._task.name, deadline)
+        error = DeadlineExceeded("worker exceeded the %s deadline of %f seconds" % (
+            self._task.schedclass.name, deadline))
+        # let a generator clean up after itself before it fails
+        if isinstance(self._iterable, GeneratorType):
+            return self._run(lambda: self._iterable.throw(error))
+        raise error
 
     def _run(self, op):
+        global _currentTask
+        _currentTask = self._task
         runningStart = time()
         try:
             result = op()
@@ -253,7 +576,9 @@ class Worker(object):
                 self._iterable = result
                 result = self._iterable.next()
         finally:
+            _currentTask = None
             runningEnd = time()
+            self.runningtime += runningEnd - runningStart
             self._task.runningtime += runningEnd - runningStart
         if isinstance(result, Deferred):
             self._waitingStart = runningEnd
@@ -263,6 +588,7 @@ class Worker(object):
 
     def _waitDone(self, result):
         waitingEnd = time()
+        self.waitingtime += waitingEnd - self._waitingStart
         self._task.waitingtime += waitingEnd - self._waitingStart
         self._waitingStart = None
         self.state = STATE_RUNNING
@@ -273,6 +599,7 @@ class Worker(object):
 
     def _waitError(self, failure):
         waitingEnd = time()
+        self.waitingtime += waitingEnd - self._waitingStart
         self._task.waitingtime += waitingEnd - self._waitingStart
         self._waitingStart = None
         self.state = STATE_RUNNING
@@ -285,18 +612,22 @@ class Worker(object):
     def _workerDone(self, result):
         if self._waitingStart:
             waitingEnd = time()
+            self.waitingtime += waitingEnd - self._waitingStart
             self._task.waitingtime += waitingEnd - self._waitingStart
             self._waitingStart = None
         self.state = STATE_DONE
+        self._task._workerFinished(self)
         if self._whenDone != None:
             self._whenDone.callback(self.iterable)
 
     def _workerError(self, failure):
         if self._waitingStart:
             waitingEnd = time()
+            self.waitingtime += waitingEnd - self._waitingStart
             self._task.waitingtime += waitingEnd - self._waitingStart
             self._waitingStart = None
         self.state = STATE_DONE
+        self._task._workerFinished(self)
         logger.exception(failure.value)
         if self._whenDone != None:
             self._whenDone.errback(failure)
@@ -92,6 +92,6 @@ class Signal(object):
         self._receivers = set()
         for d in receivers:
             if self.matchesKeywords(d.kwds):
-                logger.trace("signaling receiver %s" % d)
+                logger.trace("signaling receiver %s", d)
                 # return a copy of the result, so the receiver can modify it
                 d.callback(result.copy())
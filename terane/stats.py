@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Terane.  If not, see <http://www.gnu.org/licenses/>.
 
-import os, errno
+import os, errno, time
 from twisted.application.service import Service
 from twisted.internet import task
 from terane.settings import ConfigureError
@@ -56,10 +56,128 @@ class Stat(object):
 
     value = property(_getvalue,_setvalue)
 
+    volatile = property(lambda self: self._volatile)
+
+# histogram bucket i counts durations less than 2**i microseconds, except
+# for the last bucket, which counts everything longer.
+_NBUCKETS = 28
+_BUCKETBOUNDS = [float(2 ** i) / 1000000 for i in range(_NBUCKETS - 1)] + [float('inf')]
+
+class Histogram(object):
+    """
+    A histogram of durations, with log2-sized buckets ranging from one
+    microsecond to just over a minute.  Recording a value costs a
+    multiplication, a bit_length() and three additions, so histograms are
+    cheap enough to leave enabled.  Histograms are volatile; they are
+    not saved to the statistics file.
+
+    :param name: The name of the histogram.
+    :type name: str
+    :param labels: A sorted tuple of (label, value) pairs.
+    :type labels: tuple
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * _NBUCKETS
+
+    def record(self, value):
+        """
+        Record a duration.
+
+        :param value: The duration in seconds.
+        :type value: float
+        """
+        self.count += 1
+        self.sum += value
+        i = int(value * 1000000).bit_length()
+        if i >= _NBUCKETS:
+            i = _NBUCKETS - 1
+        self.buckets[i] += 1
+
+    def since(self, start):
+        """
+        Record the time elapsed since start.
+
+        :param start: A timestamp returned by time.time().
+        :type start: float
+        """
+        self.record(time.time() - start)
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket containing the specified quantile,
+        or 0.0 if no values have been recorded.
+
+        :param q: The quantile, between 0.0 and 1.0.
+        :type q: float
+        :rtype: float
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i,n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n > 0:
+                return _BUCKETBOUNDS[i]
+        return _BUCKETBOUNDS[-1]
+
+    def cumulative(self):
+        """
+        Return a list of (upper bound, count) pairs, where count is the
+        number of values less than or equal to the upper bound.
+
+        :rtype: list
+        """
+        counts = []
+        cumulative = 0
+        for bound,n in zip(_BUCKETBOUNDS, self.buckets):
+            cumulative += n
+            counts.append((bound, cumulative))
+        return counts
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            }
+
+class Counter(object):
+    """
+    A volatile counter which is identified by a name and a set of labels.
+
+    :param name: The name of the counter.
+    :type name: str
+    :param labels: A sorted tuple of (label, value) pairs.
+    :type labels: tuple
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def __iadd__(self, other):
+        self.value += other
+        return self
+
+def _formatLabels(name, labels):
+    if len(labels) == 0:
+        return name
+    return "%s{%s}" % (name, ','.join(["%s=%s" % (k,v) for k,v in labels]))
+
 class StatsManager(Service):
 
     def __init__(self):
         self._stats = {}
+        self._labelled = {}
         self._dirty = False
 
     def configure(self, settings):
@@ -108,6 +226,47 @@ class StatsManager(Service):
             self._stats[name] = s
         return s
 
+    def _getLabelled(self, cls, name, labels):
+        for c in name.split('.'):
+            if not c.isalnum():
+                raise ValueError("'name' must consist of only letters, numbers, and periods")
+        labels = tuple(sorted([(k,str(v)) for k,v in labels.items()]))
+        key = (name, labels)
+        if key in self._labelled:
+            m = self._labelled[key]
+            if not isinstance(m, cls):
+                raise TypeError("%s is not a %s" % (_formatLabels(name, labels), cls.__name__))
+        else:
+            m = cls(name, labels)
+            self._labelled[key] = m
+        return m
+
+    def getHistogram(self, name, labels):
+        """
+        Return the histogram with the specified name and labels, creating it
+        if necessary.
+        """
+        return self._getLabelled(Histogram, name, labels)
+
+    def getCounter(self, name, labels):
+        """
+        Return the counter with the specified name and labels, creating it
+        if necessary.
+        """
+        return self._getLabelled(Counter, name, labels)
+
+    def iterStats(self):
+        """
+        Returns an iterator which yields each scalar Stat.
+        """
+        return self._stats.itervalues()
+
+    def iterLabelled(self):
+        """
+        Returns an iterator which yields each labelled Histogram and Counter.
+        """
+        return self._labelled.itervalues()
+
     def showStats(self, name, recursive=False):
         """
         """
@@ -117,14 +276,19 @@ class StatsManager(Service):
                 if not c.isalnum():
                     raise ValueError("'name' must consist of only letters, numbers, and periods")
         if recursive == False:
-            try:
-                return [(name, self._stats[name].value)]
-            except:
-                return []
-        if name == '':
-            return sorted([(k,v.value) for k,v in self._stats.items()])
-        return sorted([(k,v.value) for k,v in self._stats.items()
-            if k == name or k.startswith("%s." % name)])
+            matches = lambda k: k == name
+        elif name == '':
+            matches = lambda k: True
+        else:
+            matches = lambda k: k == name or k.startswith("%s." % name)
+        results = [(k,v.value) for k,v in self._stats.items() if matches(k)]
+        for (k,labels),m in self._labelled.items():
+            if matches(k):
+                if isinstance(m, Histogram):
+                    results.append((_formatLabels(k, labels), m.summary()))
+                else:
+                    results.append((_formatLabels(k, labels), m.value))
+        return sorted(results)
 
     def _loadStats(self):
         """
@@ -183,3 +347,9 @@ def getStat(name, ivalue):
 
 def getVolatileStat(name, ivalue):
     return stats.getStat(name, type(ivalue), ivalue, True)
+
+def getHistogram(name, **labels):
+    return stats.getHistogram(name, labels)
+
+def getCounter(name, **labels):
+    return stats.getCounter(name, labels)
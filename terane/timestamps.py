@@ -0,0 +1,194 @@
+# Copyright 2010,2011,2012 Michael Frank <msfrank@syntaxjockey.com>
+#
+# This file is part of Terane.
+#
+# Terane is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Terane is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Terane.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Fast parsers for the timestamp formats found in common log files.  Each
+parser only understands one format, and caches its results keyed by the
+timestamp string, since consecutive log lines usually share the same second.
+Every parser returns a timezone-aware datetime.datetime in UTC; timestamps
+which don't specify a timezone are interpreted as local time.
+"""
+
+import time, datetime, calendar, email.utils
+from dateutil.tz import tzutc
+
+_utc = tzutc()
+
+_months = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+    }
+
+class TimestampCache(object):
+    """
+    Maps timestamp strings to datetimes, calling the parse function only
+    when the string hasn't been seen recently.  The most recent result is
+    checked first, then a dict of up to maxsize entries, which is emptied
+    when it fills up.
+
+    :param parse: A function which parses a timestamp string and returns a
+      datetime.datetime.
+    :type parse: callable
+    :param maxsize: The maximum number of cached timestamps.
+    :type maxsize: int
+    """
+
+    def __init__(self, parse, maxsize=4096):
+        self._parse = parse
+        self._maxsize = maxsize
+        self._cache = {}
+        self._lastkey = None
+        self._lastvalue = None
+
+    def __call__(self, s):
+        if s == self._lastkey:
+            return self._lastvalue
+        try:
+            value = self._cache[s]
+        except KeyError:
+            value = self._parse(s)
+            if len(self._cache) >= self._maxsize:
+                self._cache.clear()
+            self._cache[s] = value
+        self._lastkey = s
+        self._lastvalue = value
+        return value
+
+def _fromLocal(year, month, day, hour, minute, second):
+    ts = time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+    return datetime.datetime.fromtimestamp(ts, _utc)
+
+def _fromOffset(year, month, day, hour, minute, second, offset):
+    ts = calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)) - offset
+    return datetime.datetime.fromtimestamp(ts, _utc)
+
+def _parseOffset(s):
+    """
+    Parse a numeric timezone offset in the form +hhmm or +hh:mm, returning
+    the offset from UTC in seconds.
+    """
+    if s[0] not in '+-':
+        raise ValueError("invalid timezone offset '%s'" % s)
+    s = s.replace(':', '')
+    if len(s) != 5:
+        raise ValueError("invalid timezone offset '%s'" % s)
+    offset = (int(s[1:3]) * 3600) + (int(s[3:5]) * 60)
+    if s[0] == '-':
+        return -offset
+    return offset
+
+def _parseSyslog(s):
+    # Mmm dd hh:mm:ss, where the day may be padded with a space
+    if len(s) != 15 or s[3] != ' ' or s[6] != ' ' or s[9] != ':' or s[12] != ':':
+        raise ValueError("invalid syslog timestamp '%s'" % s)
+    month = _months[s[0:3]]
+    day = int(s[4:6])
+    hour, minute, second = int(s[7:9]), int(s[10:12]), int(s[13:15])
+    # syslog timestamps don't include the year.  assume the current year,
+    # unless that would put the timestamp in the future, in which case the
+    # message was most likely logged last year.
+    now = time.localtime()
+    year = now.tm_year
+    if (month, day) > (now.tm_mon, now.tm_mday + 1):
+        year -= 1
+    return _fromLocal(year, month, day, hour, minute, second)
+
+def _parseCLF(s):
+    # dd/Mmm/yyyy:hh:mm:ss +zzzz
+    if len(s) != 26 or s[2] != '/' or s[6] != '/' or s[11] != ':' or s[20] != ' ':
+        raise ValueError("invalid common log format timestamp '%s'" % s)
+    day, month, year = int(s[0:2]), _months[s[3:6]], int(s[7:11])
+    hour, minute, second = int(s[12:14]), int(s[15:17]), int(s[18:20])
+    return _fromOffset(year, month, day, hour, minute, second, _parseOffset(s[21:26]))
+
+def _parseMysql(s):
+    # yymmdd hh:mm:ss, where the hour may be padded with a space
+    date, sep, clock = s.strip().partition(' ')
+    clock = clock.strip()
+    if len(date) != 6 or len(clock) not in (7, 8):
+        raise ValueError("invalid mysql timestamp '%s'" % s)
+    hour, minute, second = [int(c) for c in clock.split(':')]
+    return _fromLocal(2000 + int(date[0:2]), int(date[2:4]), int(date[4:6]), hour, minute, second)
+
+def _parseRFC3339(s):
+    # yyyy-mm-ddThh:mm:ss followed by Z or a numeric offset.  fractional
+    # seconds have already been removed.
+    if len(s) < 20 or s[4] != '-' or s[7] != '-' or s[10] not in 'Tt ' or s[13] != ':' or s[16] != ':':
+        raise ValueError("invalid RFC3339 timestamp '%s'" % s)
+    year, month, day = int(s[0:4]), int(s[5:7]), int(s[8:10])
+    hour, minute, second = int(s[11:13]), int(s[14:16]), int(s[17:19])
+    # datetime can't represent a leap second
+    second = min(second, 59)
+    tz = s[19:]
+    if tz in ('Z', 'z'):
+        offset = 0
+    else:
+        offset = _parseOffset(tz)
+    return _fromOffset(year, month, day, hour, minute, second, offset)
+
+def _parseRFC2822(s):
+    parsed = email.utils.parsedate_tz(s)
+    if parsed == None:
+        raise ValueError("invalid RFC2822 timestamp '%s'" % s)
+    if parsed[9] == None:
+        return _fromLocal(*parsed[0:6])
+    return datetime.datetime.fromtimestamp(email.utils.mktime_tz(parsed), _utc)
+
+_syslogcache = TimestampCache(_parseSyslog)
+_clfcache = TimestampCache(_parseCLF)
+_mysqlcache = TimestampCache(_parseMysql)
+_rfc2822cache = TimestampCache(_parseRFC2822)
+_rfc3339cache = TimestampCache(_parseRFC3339)
+
+def parseSyslogTimestamp(s):
+    """
+    Parse a BSD syslog timestamp, such as 'Oct 11 22:14:15'.
+    """
+    return _syslogcache(s)
+
+def parseCLFTimestamp(s):
+    """
+    Parse an Apache common log format timestamp, such as
+    '10/Oct/2000:13:55:36 -0700'.
+    """
+    return _clfcache(s)
+
+def parseMysqlTimestamp(s):
+    """
+    Parse a MySQL server log timestamp, such as '120105  9:05:12'.
+    """
+    return _mysqlcache(s)
+
+def parseRFC2822Timestamp(s):
+    """
+    Parse an RFC2822 timestamp, such as 'Sat, 11 Oct 2003 22:14:15 -0700'.
+    """
+    return _rfc2822cache(s)
+
+def parseRFC3339Timestamp(s):
+    """
+    Parse an RFC3339 timestamp, such as '2003-10-11T22:14:15.003Z'.  The
+    fractional seconds are removed before the cache is consulted, so
+    timestamps within the same second share a cache entry.
+    """
+    if len(s) > 19 and s[19] == '.':
+        i = 20
+        while i < len(s) and s[i].isdigit():
+            i += 1
+        microsecond = int((s[20:i] + '000000')[:6])
+        return _rfc3339cache(s[:19] + s[i:]).replace(microsecond=microsecond)
+    return _rfc3339cache(s)
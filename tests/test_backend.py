@@ -51,7 +51,7 @@ class Backend_Index_Tests(unittest.TestCase):
             fieldname = u'fieldname'
             fieldspec = {u'fieldtype': u'pickledfield'}
             with index.new_txn() as txn:
-                index.add_field(txn, fieldname, fieldspec)
+                index.set_field(txn, fieldname, fieldspec)
             self.failUnless(index.get_field(None, fieldname) == fieldspec)
             fields = list(index.iter_fields(None))
             self.failUnless(len(fields) == 1)
@@ -81,21 +81,21 @@ class Backend_Segment_Tests(unittest.TestCase):
         try:
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
         finally:
             if segment: segment.close()
         try:
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.2', None)
+                self.index.set_segment(txn, u'store.2', None)
                 segment = Segment(self.env, txn, u'store.2')
         finally:
             if segment: segment.close()
         try:
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.3', None)
+                self.index.set_segment(txn, u'store.3', None)
                 segment = Segment(self.env, txn, u'store.3')
         finally:
             if segment: segment.close()
@@ -104,7 +104,7 @@ class Backend_Segment_Tests(unittest.TestCase):
 
     def test_delete_Segment(self):
         with self.index.new_txn() as txn:
-            self.index.add_segment(txn, u'store.1', None)
+            self.index.set_segment(txn, u'store.1', None)
             segment = Segment(self.env, txn, u'store.1')
         with self.index.new_txn() as txn:
             self.index.delete_segment(txn, u'store.1')
@@ -113,7 +113,7 @@ class Backend_Segment_Tests(unittest.TestCase):
         try:
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
                 segment.set_meta(txn, u'foo', True)
             self.failUnless(segment.get_meta(None, u'foo') == True)
@@ -125,7 +125,7 @@ class Backend_Segment_Tests(unittest.TestCase):
             key = [u'fieldname', u'fieldtype']
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
             with self.index.new_txn() as txn:
                 segment.set_field(txn, key, True)
@@ -137,7 +137,7 @@ class Backend_Segment_Tests(unittest.TestCase):
         try:
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
             key = [1, 1]
             # test writing an event, then retreiving it
@@ -153,11 +153,90 @@ class Backend_Segment_Tests(unittest.TestCase):
         finally:
             if segment: segment.close()
 
+    def test_read_event_fields(self):
+        try:
+            segment = None
+            with self.index.new_txn() as txn:
+                self.index.set_segment(txn, u'store.1', None)
+                segment = Segment(self.env, txn, u'store.1')
+            key = [1, 1]
+            event = {u'message': u'hello', u'hostname': u'host1',
+                     u'extra': [1, {u'nested': 2.0}, None], u'pid': 42}
+            with self.index.new_txn() as txn:
+                segment.set_event(txn, key, event)
+            self.failUnless(segment.get_event(None, key) == event)
+            self.failUnless(segment.get_event(None, key, None) == event)
+            fields = segment.get_event(None, key, [u'message', 'pid', u'missing'])
+            self.failUnless(fields == {u'message': u'hello', u'pid': 42})
+            self.failUnless(segment.get_event(None, key, []) == {})
+        finally:
+            if segment: segment.close()
+
+    def test_read_write_compressed_event(self):
+        try:
+            segment = None
+            with self.index.new_txn() as txn:
+                self.index.set_segment(txn, u'store.1', None)
+                segment = Segment(self.env, txn, u'store.1')
+            event = {u'message': u'sshd[123]: Accepted publickey for user ' * 20, u'pid': 123}
+            with self.index.new_txn() as txn:
+                segment.set_event(txn, [1, 1], event, 64)
+                segment.set_event(txn, [1, 2], {u'message': u'short'}, 64)
+            self.failUnless(segment.get_event(None, [1, 1]) == event)
+            self.failUnless(segment.get_event(None, [1, 1], [u'pid']) == {u'pid': 123})
+            self.failUnless(segment.get_event(None, [1, 2]) == {u'message': u'short'})
+            # the events iterator yields only the event identifiers
+            items = list(segment.iter_events(None, None, None, False))
+            self.failUnless(items == [([1, 1], None), ([1, 2], None)])
+        finally:
+            if segment: segment.close()
+
+    def test_pack_events(self):
+        try:
+            segment = None
+            with self.index.new_txn() as txn:
+                self.index.set_segment(txn, u'store.1', None)
+                segment = Segment(self.env, txn, u'store.1')
+            events = {}
+            with self.index.new_txn() as txn:
+                for i in range(100):
+                    event = {u'message': u'sshd[%i]: Accepted publickey for user%i' % (i, i % 7), u'pid': i}
+                    segment.set_event(txn, [1, i], event, 64 if i % 2 else 0)
+                    events[i] = event
+            # pack full blocks only
+            packed = []
+            last = None
+            while True:
+                with self.index.new_txn() as txn:
+                    last = segment.pack_events(txn, last, 1024)
+                if last == None:
+                    break
+                packed.append(last)
+            self.failUnless(len(packed) > 1)
+            self.failUnless(packed[-1] < [1, 99])
+            # pack the remaining events
+            with self.index.new_txn() as txn:
+                self.failUnless(segment.pack_events(txn, packed[-1], 1024, True) == [1, 99])
+            with self.index.new_txn() as txn:
+                self.failUnless(segment.pack_events(txn, None, 1024, True) == None)
+            # an event which arrives after later events were packed isn't packed
+            with self.index.new_txn() as txn:
+                segment.set_event(txn, [0, 1], {u'message': u'late'})
+            for i in reversed(range(100)):
+                self.failUnless(segment.get_event(None, [1, i]) == events[i])
+                self.failUnless(segment.get_event(None, [1, i], [u'pid']) == {u'pid': i})
+            self.failUnless(segment.get_event(None, [0, 1]) == {u'message': u'late'})
+            self.failUnlessRaises(KeyError, segment.get_event, None, [1, 100])
+            items = list(segment.iter_events(None, None, None, False))
+            self.failUnless(len(items) == 101)
+        finally:
+            if segment: segment.close()
+
     def test_read_write_term(self):
         try:
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
             key = [u'fieldname', u'fieldtype', u'foo']
             # test writing an event, then retreiving it
@@ -176,7 +255,7 @@ class Backend_Segment_Tests(unittest.TestCase):
             key = [u'fieldname', u'fieldtype', u'foo', 1, 1]
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
             # test writing an event, then retreiving it
             with self.index.new_txn() as txn:
@@ -196,7 +275,7 @@ class Backend_Segment_Tests(unittest.TestCase):
             prefix = [u'fieldname', u'fieldtype', u'foo']
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
                 segment.set_posting(txn, prefix + [1,1], True)
                 segment.set_posting(txn, prefix + [1,2], True)
@@ -245,7 +324,7 @@ class Backend_Segment_Tests(unittest.TestCase):
             prefix = [u'fieldname', u'fieldtype', u'foo']
             segment = None
             with self.index.new_txn() as txn:
-                self.index.add_segment(txn, u'store.1', None)
+                self.index.set_segment(txn, u'store.1', None)
                 segment = Segment(self.env, txn, u'store.1')
                 segment.set_posting(txn, prefix + [1,1], True)
                 segment.set_posting(txn, prefix + [1,2], True)
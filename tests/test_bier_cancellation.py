@@ -0,0 +1,20 @@
+import time
+from twisted.trial import unittest
+from terane.bier.searching import Cancellation, SearchCancelled
+
+class Cancellation_Tests(unittest.TestCase):
+    """Search cancellation tests."""
+
+    def test_cancel(self):
+        cancellation = Cancellation()
+        cancellation.check()
+        cancellation.cancel("client disconnected")
+        cancellation.cancel("ignored")
+        e = self.assertRaises(SearchCancelled, cancellation.check)
+        self.assertEqual(str(e), "client disconnected")
+
+    def test_deadline(self):
+        Cancellation(time.time() + 60.0).check()
+        cancellation = Cancellation(time.time() - 1.0)
+        self.assertRaises(SearchCancelled, cancellation.check)
+        self.assertEqual(cancellation.reason, "search exceeded its deadline")
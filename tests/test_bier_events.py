@@ -0,0 +1,44 @@
+import os
+from zope.component import getGlobalSiteManager
+from twisted.trial import unittest
+from terane.settings import _UnittestSettings
+from terane.sched import IScheduler, Scheduler
+from terane.bier import EventManager
+
+class EventManager_Tests(unittest.TestCase):
+    """EventManager identifier allocation tests."""
+
+    def setUp(self):
+        self.path = os.path.abspath(self.mktemp())
+        self.settings = _UnittestSettings()
+        self.settings.load({'server': {'id cache file': self.path, 'id cache size': '8'}})
+        scheduler = Scheduler()
+        getGlobalSiteManager().registerUtility(scheduler, IScheduler)
+        self.addCleanup(getGlobalSiteManager().unregisterUtility, scheduler, IScheduler)
+
+    def makeManager(self):
+        manager = EventManager(None)
+        manager.configure(self.settings)
+        manager.startService()
+        return manager
+
+    def readLast(self):
+        with open(self.path) as f:
+            return long(f.read(), 16)
+
+    def test_allocate(self):
+        manager = self.makeManager()
+        self.assertEqual(self.readLast(), 9)
+        # exhaust the first range before the reservation thread has run
+        offsets = [manager._allocateOffset() for i in range(20)]
+        self.assertEqual(offsets, range(1, 21))
+        self.assertTrue(self.readLast() > 20)
+        def restart(result):
+            self.assertEqual(self.readLast(), 21)
+            manager = self.makeManager()
+            self.assertEqual(manager._allocateOffset(), 21)
+            return manager.stopService()
+        d = manager.stopService()
+        if d == None:
+            return restart(None)
+        return d.addCallback(restart)
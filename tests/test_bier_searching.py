@@ -62,6 +62,7 @@ class Bier_Searching_Tests(unittest.TestCase):
             event = Event(ts, offset)
             event[contract.field_message] = message
             self.output.receiveEvent(event)
+        return self.output.whenReady()
 
     @inlineCallbacks
     def test_search_Every(self):
@@ -87,4 +88,4 @@ class Bier_Searching_Tests(unittest.TestCase):
 
     def tearDown(self):
         self.output.stopService()
-        self.plugin.stopService()
+        return self.plugin.stopService()
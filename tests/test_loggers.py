@@ -0,0 +1,29 @@
+from twisted.trial import unittest
+from terane.loggers import Logger, TRACE, DEBUG, INFO, NOTSET
+
+class Counted(object):
+    def __init__(self):
+        self.count = 0
+    def __str__(self):
+        self.count += 1
+        return 'counted'
+
+class Logger_Tests(unittest.TestCase):
+    """Logger tests."""
+
+    def test_is_enabled_for(self):
+        logger = Logger('test', INFO)
+        self.assertTrue(logger.isEnabledFor(INFO))
+        self.assertFalse(logger.isEnabledFor(DEBUG))
+        self.assertFalse(logger.isEnabledFor(TRACE))
+        # every level is enabled until logging is started
+        logger = Logger('test', NOTSET)
+        self.assertTrue(logger.isEnabledFor(TRACE))
+
+    def test_disabled_args_are_not_formatted(self):
+        logger = Logger('test', INFO)
+        arg = Counted()
+        logger.trace("trace %s", arg)
+        logger.debug("debug %s", arg)
+        logger.msg(TRACE, "msg %s", arg)
+        self.assertEqual(arg.count, 0)
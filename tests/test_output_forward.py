@@ -0,0 +1,120 @@
+import os
+from twisted.trial import unittest
+from terane.outputs.forward import ForwardOutput
+from terane.outputs.spool import Spool
+from terane.settings import _UnittestSettings
+
+class MockLink(object):
+    def __init__(self, name):
+        self.name = name
+        self.healthy = True
+        self.outstanding = []
+        self.sent = []
+    def send(self, piece):
+        self.outstanding.append((len(self.sent), piece))
+        self.sent.append(piece)
+
+class Output_Forward_Tests(unittest.TestCase):
+    """outputs.forward tests."""
+
+    def makeOutput(self, **params):
+        settings = _UnittestSettings()
+        params['forwarding collectors'] = 'a:1,b:2,c'
+        params['spool directory'] = os.path.abspath(self.mktemp())
+        params['batch size'] = '10'
+        params['send window'] = '2'
+        settings.load({'output:test': params})
+        output = ForwardOutput(None, 'test', None)
+        output.configure(settings.section('output:test'))
+        output._spool = Spool(output.spooldir)
+        output._links = [MockLink('a'), MockLink('b'), MockLink('c')]
+        self.addCleanup(output._spool.close)
+        return output
+
+    def appendRecords(self, output, count):
+        for i in range(count):
+            hostname = u"host%i" % (i % 7)
+            output._spool.append((0.0, [(u'hostname', u'literal', hostname)]))
+
+    def test_configure_collectors(self):
+        output = self.makeOutput()
+        self.assertEqual(output.collectors, [('a', 1), ('b', 2), ('c', 8643)])
+
+    def test_least_outstanding(self):
+        output = self.makeOutput()
+        self.appendRecords(output, 100)
+        output._send()
+        # every link fills its window with one batch per send
+        self.assertEqual([len(l.sent) for l in output._links], [2, 2, 2])
+        # acknowledging the first batch frees up the spool and the window
+        link = output._links[0]
+        linkseq,piece = link.outstanding.pop(0)
+        output._pieceDone(piece)
+        self.assertEqual(output._spool.ackedSeq, 10)
+        output._send()
+        self.assertEqual(len(link.sent), 3)
+
+    def test_out_of_order_ack(self):
+        output = self.makeOutput()
+        self.appendRecords(output, 20)
+        output._send()
+        # the second batch completes first, so nothing can be acked yet
+        pieces = [l.outstanding.pop(0)[1] for l in output._links if len(l.outstanding) > 0]
+        output._pieceDone(pieces[1])
+        self.assertEqual(output._spool.ackedSeq, 0)
+        output._pieceDone(pieces[0])
+        self.assertEqual(output._spool.ackedSeq, 20)
+
+    def test_hostname(self):
+        output = self.makeOutput(**{'balance policy': 'hostname'})
+        self.appendRecords(output, 10)
+        output._send()
+        targets = {}
+        for link in output._links:
+            for piece in link.sent:
+                for seq,record in piece.records:
+                    hostname = record[1][0][2]
+                    self.assertEqual(targets.setdefault(hostname, link), link)
+        self.assertEqual(sum([len(p.records) for l in output._links for p in l.sent]), 10)
+
+    def test_ejected_link(self):
+        output = self.makeOutput()
+        self.appendRecords(output, 10)
+        output._links[1].healthy = False
+        output._links[2].healthy = False
+        output._send()
+        link = output._links[0]
+        pieces = [piece for _,piece in link.outstanding]
+        link.outstanding = []
+        link.healthy = False
+        output._links[1].healthy = True
+        output._collectorDown(link, pieces, True)
+        self.assertEqual(output._links[1].sent, pieces)
+
+    def test_hostname_full_window(self):
+        output = self.makeOutput(**{'balance policy': 'hostname'})
+        self.appendRecords(output, 10)
+        output._send()
+        # the window of one link is full, the other windows are empty
+        full = [l for l in output._links if len(l.sent) > 0][0]
+        hostname = full.sent[0].records[0][1][1][0][2]
+        for link in output._links:
+            link.outstanding = []
+            link.sent = []
+        full.outstanding = [(0, None), (1, None)]
+        # the first batch only goes to the full link
+        for i in range(10):
+            output._spool.append((0.0, [(u'hostname', u'literal', hostname)]))
+        self.appendRecords(output, 10)
+        output._send()
+        self.assertEqual(full.sent, [])
+        # the pieces for the other links are not held up by the full link
+        others = [p for l in output._links for p in l.sent]
+        self.assertTrue(len(others) > 0)
+        queued = list(output._queue)
+        self.assertTrue(all([p.target is full for p in queued]))
+        self.assertEqual(sum([len(p.records) for p in others + queued]), 20)
+        # once the window opens, the queued pieces are sent
+        full.outstanding = []
+        output._send()
+        self.assertEqual(full.sent, queued)
@@ -0,0 +1,72 @@
+import os
+from twisted.trial import unittest
+from terane.outputs.spool import Spool
+
+class Output_Spool_Tests(unittest.TestCase):
+    """outputs.spool tests."""
+
+    def setUp(self):
+        self.path = os.path.abspath(self.mktemp())
+
+    def test_append_read(self):
+        spool = Spool(self.path)
+        for i in range(10):
+            self.assertEqual(spool.append(('record', i)), i + 1)
+        records = spool.read(4)
+        self.assertEqual([seq for seq,_ in records], [1, 2, 3, 4])
+        self.assertEqual(records[0][1], ('record', 0))
+        records = spool.read(100)
+        self.assertEqual([seq for seq,_ in records], range(5, 11))
+        self.assertEqual(spool.read(100), [])
+        spool.close()
+
+    def test_ack_rewind(self):
+        spool = Spool(self.path)
+        for i in range(10):
+            spool.append(i)
+        spool.read(10)
+        spool.ack(6)
+        self.assertEqual(spool.pending(), 4)
+        spool.rewind()
+        self.assertEqual([seq for seq,_ in spool.read(100)], [7, 8, 9, 10])
+        spool.close()
+
+    def test_reopen(self):
+        spool = Spool(self.path)
+        source = spool.source
+        for i in range(10):
+            spool.append(i)
+        spool.ack(3)
+        spool.close()
+        spool = Spool(self.path)
+        self.assertEqual(spool.source, source)
+        self.assertEqual(spool.ackedSeq, 3)
+        self.assertEqual(spool.lastSeq, 10)
+        self.assertEqual([r for _,r in spool.read(100)], range(3, 10))
+        self.assertEqual(spool.append('next'), 11)
+        spool.close()
+
+    def test_segments(self):
+        spool = Spool(self.path, segmentsize=64)
+        for i in range(100):
+            spool.append(i)
+        nsegments = len([n for n in os.listdir(self.path) if n.endswith('.spool')])
+        self.assertTrue(nsegments > 1)
+        self.assertEqual([r for _,r in spool.read(1000)], range(100))
+        spool.ack(100)
+        remaining = len([n for n in os.listdir(self.path) if n.endswith('.spool')])
+        self.assertEqual(remaining, 1)
+        spool.close()
+
+    def test_truncated_record(self):
+        spool = Spool(self.path)
+        for i in range(5):
+            spool.append(i)
+        spool.close()
+        segment = [n for n in os.listdir(self.path) if n.endswith('.spool')][0]
+        with open(os.path.join(self.path, segment), 'ab') as f:
+            f.write('\x00\x00\x00')
+        spool = Spool(self.path)
+        self.assertEqual(spool.lastSeq, 5)
+        self.assertEqual([r for _,r in spool.read(100)], range(5))
+        spool.close()
@@ -1,12 +1,17 @@
 from twisted.trial import unittest
-import os, sys, time, datetime
+from twisted.internet.defer import inlineCallbacks
+import os, sys, time, datetime, threading
 from dateutil.tz import tzutc
 from zope.interface import implements
+from zope.component import provideUtility
 from terane.outputs.store import StoreOutput, StoreOutputPlugin
+from terane.outputs.store.index import Index
+from terane.sched import Scheduler, IScheduler
 from terane.bier.interfaces import IFieldStore
 from terane.bier.event import Event, Contract
 from terane.bier.fields import IdentityField, TextField
 from terane.bier.evid import EVID
+from terane.bier.searching import IndexWarming
 from terane.loggers import StdoutHandler, startLogging, TRACE
 from terane.settings import _UnittestSettings
 
@@ -48,6 +53,7 @@ class Output_Store_Tests(unittest.TestCase):
         self.output.configure(settings.section('output:test'))
         self.plugin.startService()
         self.output.startService()
+        return self.output.whenReady()
 
     def test_get_contract(self):
         contract = self.output.getContract()
@@ -109,6 +115,108 @@ class Output_Store_Tests(unittest.TestCase):
         finally:
             searcher.close()
 
+    @inlineCallbacks
+    def test_prune_segments(self):
+        index = self.output.getIndex()
+        # write two events into each of two segments, then rotate
+        for batch in (Output_Store_Tests.test_data[0:2], Output_Store_Tests.test_data[2:4]):
+            writer = yield index.newWriter()
+            for ts,offset,message in batch:
+                yield writer.newEvent(EVID.fromDatetime(ts, offset), {u'message': message})
+            yield writer.close()
+            index._makeSegment()
+        first,second,current = index._segments
+        self.assertEqual(first.size, 2)
+        self.assertEqual(second.size, 2)
+        minId = EVID.fromDatetime(*Output_Store_Tests.test_data[2][0:2])
+        maxId = EVID.fromDatetime(*Output_Store_Tests.test_data[3][0:2])
+        self.assertEqual(second.minId, [minId.ts, minId.offset])
+        self.assertEqual(second.maxId, [maxId.ts, maxId.offset])
+        # the sealed ranges are stored in the table of contents
+        self.assertEqual([info.toTOC() for info in (first,second)],
+            [toc for name,toc in index.iter_segments(None)][0:2])
+        # close every segment which isn't in use
+        index._maxOpen = 1
+        with index._segmentLock:
+            evicted = index._evictSegments()
+        index._closeSegments(evicted)
+        self.assertEqual(first.segment, None)
+        # a search of the second segment's range doesn't open the first segment
+        searcher = yield index.newSearcher()
+        try:
+            searcher._getSearchers(minId, maxId)
+            self.assertEqual(searcher._segmentSearchers.keys(), [second.name, current.name])
+            self.assertEqual(first.segment, None)
+        finally:
+            yield searcher.close()
+
     def tearDown(self):
         self.output.stopService()
-        self.plugin.stopService()
+        return self.plugin.stopService()
+
+class Output_Store_Warming_Tests(unittest.TestCase):
+    """outputs.store tests while the index is opening."""
+
+    def setUp(self):
+        datadir = os.path.abspath(self.mktemp())
+        os.mkdir(datadir)
+        settings = _UnittestSettings()
+        settings.load({
+            'plugin:output:store': {
+                'data directory': datadir,
+                },
+            'output:test': {
+                'type': 'store',
+                }
+            })
+        self.plugin = StoreOutputPlugin()
+        self.plugin.configure(settings.section('plugin:output:store'))
+        self.output = StoreOutput(self.plugin, 'test', MockFieldStore())
+        self.output.configure(settings.section('output:test'))
+        # block Index.open() until the test lets it continue
+        self.opened = threading.Event()
+        realOpen = Index.open
+        def _open(index):
+            self.opened.wait()
+            return realOpen(index)
+        self.patch(Index, 'open', _open)
+        provideUtility(Scheduler(), IScheduler)
+        self.plugin.startService()
+        self.output.startService()
+
+    def test_warming(self):
+        index = self.output.getIndex()
+        d = self.assertFailure(index.newSearcher(), IndexWarming)
+        # events received while the index is opening are buffered
+        contract = Contract().sign()
+        ts,offset,message = Output_Store_Tests.test_data[0]
+        event = Event(ts, offset)
+        event[contract.field_message] = message
+        self.output.receiveEvent(event)
+        self.assertEqual(self.output._pendingCount, 1)
+        self.opened.set()
+        def _ready(ix):
+            self.assertTrue(ix is index)
+            self.assertEqual(self.output._pendingCount, 0)
+        d.addCallback(lambda _: self.output.whenReady())
+        return d.addCallback(_ready)
+
+    def test_stop_while_opening(self):
+        # stopping the plugin waits for the index to finish opening before
+        # the environment is closed
+        self.assertNotEqual(self.output._opening, None)
+        d = self.plugin.stopService()
+        self.assertNotEqual(self.plugin._env, None)
+        self.opened.set()
+        def _stopped(result):
+            self.assertEqual(self.output._index, None)
+            self.assertEqual(self.plugin._env, None)
+            self.assertFalse(self.output.running)
+        return d.addCallback(_stopped)
+
+    def tearDown(self):
+        self.opened.set()
+        if self.output.running:
+            self.output.stopService()
+        if self.plugin._env != None:
+            return self.plugin.stopService()
@@ -0,0 +1,59 @@
+from twisted.trial import unittest
+from terane.outputs.store.columns import ColumnStore
+
+class MockTxn(object):
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        return False
+    def id(self):
+        return 0
+
+class MockIndex(object):
+    def new_txn(self):
+        return MockTxn()
+
+class MockSegment(object):
+    def __init__(self):
+        self.meta = {}
+    def get_meta(self, txn, key, RMW=False):
+        return self.meta[key]
+    def set_meta(self, txn, key, value):
+        self.meta[key] = value
+
+class ColumnStore_Tests(unittest.TestCase):
+    """ColumnStore tests."""
+
+    def setUp(self):
+        self.segment = MockSegment()
+        self.columns = ColumnStore(self.segment, None)
+        self.columns.setColumns(None, ['hostname', 'input'])
+
+    def test_encode_decode(self):
+        ix = MockIndex()
+        event = {u'message': u'hello', u'hostname': u'host1', u'input': u'syslog'}
+        encoded = self.columns.encodeEvent(ix, event)
+        self.assertEqual(encoded, {u'message': u'hello', u'hostname': 0, u'input': 0})
+        self.assertEqual(event[u'hostname'], u'host1')
+        encoded = self.columns.encodeEvent(ix, {u'hostname': u'host2', u'input': [1]})
+        self.assertEqual(encoded, {u'hostname': 1, u'input': [[1]]})
+        self.assertEqual(self.segment.meta[u'column:hostname'], [u'host1', u'host2'])
+        self.assertEqual(self.columns.decodeEvent(encoded), {u'hostname': u'host2', u'input': [1]})
+        # the dictionaries are reloaded when the segment is reopened
+        columns = ColumnStore(self.segment, None)
+        self.assertEqual(columns.fieldnames, (u'hostname', u'input'))
+        self.assertEqual(columns.decodeEvent({u'hostname': 0}), {u'hostname': u'host1'})
+
+    def test_facets(self):
+        ix = MockIndex()
+        for hostname in [u'host1', u'host2', u'host1']:
+            encoded = self.columns.encodeEvent(ix, {u'hostname': hostname})
+            self.columns.countCodes(encoded)
+        # counts aren't stored until they are flushed
+        self.assertEqual(self.columns.getFacets(None, u'hostname'), {})
+        self.columns.flushCounts(ix)
+        self.assertEqual(self.segment.meta[u'column-counts:hostname'], [2, 1])
+        self.columns.countCodes(self.columns.encodeEvent(ix, {u'hostname': u'host3'}))
+        self.columns.flushCounts(ix)
+        self.assertEqual(self.columns.getFacets(None, u'hostname'), {u'host1': 2, u'host2': 1, u'host3': 1})
+        self.assertEqual(self.columns.getFacets(None, u'input'), {})
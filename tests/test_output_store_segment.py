@@ -0,0 +1,21 @@
+from twisted.trial import unittest
+from terane.bier.evid import EVID
+from terane.outputs.store.segment import SegmentInfo
+
+class SegmentInfo_Tests(unittest.TestCase):
+    """SegmentInfo tests."""
+
+    def test_legacy_toc(self):
+        info = SegmentInfo(u'test.1', u'uuid')
+        self.assertEqual(info.uuid, u'uuid')
+        # the range of a legacy segment is unknown, so it is always searched
+        self.assertTrue(info.overlaps(EVID(0, 0), EVID(1, 0)))
+        self.assertEqual(info.toTOC(), {u'uuid': u'uuid', u'min-id': None, u'max-id': None, u'size': None})
+
+    def test_overlaps(self):
+        info = SegmentInfo(u'test.1', {u'uuid': u'uuid', u'min-id': [10, 0], u'max-id': [20, 5], u'size': 3})
+        self.assertTrue(info.overlaps(EVID(0, 0), EVID(10, 0)))
+        self.assertTrue(info.overlaps(EVID(15, 0), EVID(16, 0)))
+        self.assertTrue(info.overlaps(EVID(30, 0), EVID(20, 5)))
+        self.assertFalse(info.overlaps(EVID(0, 0), EVID(9, 9)))
+        self.assertFalse(info.overlaps(EVID(30, 0), EVID(20, 6)))
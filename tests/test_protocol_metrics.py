@@ -0,0 +1,50 @@
+from twisted.trial import unittest
+from terane.stats import StatsManager
+from terane.protocols.metrics import formatMetrics
+
+class MockTask(object):
+    name = 'output:store'
+    runningworkers = 1
+    completedworkers = 5
+    queuedworkers = 2
+    rejectedworkers = 0
+    shedworkers = 1
+    runningtime = 0.25
+    waitingtime = 1.5
+    threadrunningtime = 0.5
+    threadwaitingtime = 0.125
+
+class MockClass(object):
+    name = 'ingest'
+    runningtime = 2.0
+    threads = 4
+    threadqueued = 3
+
+class MetricsFormat_Tests(unittest.TestCase):
+    """Prometheus metrics formatting tests."""
+
+    def test_format(self):
+        stats = StatsManager()
+        s = stats.getStat('terane.input.syslog.receivedmessages', long, 0, False)
+        s += 7
+        s = stats.getStat('terane.output.store.env.cachehitratio', float, 0.0, True)
+        s <<= 0.5
+        c = stats.getCounter('terane.route.received.events', {'route': 'a"b'})
+        c += 2
+        h = stats.getHistogram('terane.route.filter.seconds', {'route': 'r', 'filter': 'f'})
+        h.record(0.0015)
+        lines = formatMetrics(stats, [MockTask()], [MockClass()]).splitlines()
+        self.assertTrue('# TYPE terane_input_syslog_receivedmessages counter' in lines)
+        self.assertTrue('terane_input_syslog_receivedmessages 7' in lines)
+        self.assertTrue('# TYPE terane_output_store_env_cachehitratio gauge' in lines)
+        self.assertTrue('terane_output_store_env_cachehitratio 0.5' in lines)
+        self.assertTrue('terane_route_received_events{route="a\\"b"} 2' in lines)
+        self.assertTrue('# TYPE terane_route_filter_seconds histogram' in lines)
+        self.assertTrue('terane_route_filter_seconds_bucket{filter="f",route="r",le="0.001024"} 0' in lines)
+        self.assertTrue('terane_route_filter_seconds_bucket{filter="f",route="r",le="0.002048"} 1' in lines)
+        self.assertTrue('terane_route_filter_seconds_bucket{filter="f",route="r",le="+Inf"} 1' in lines)
+        self.assertTrue('terane_route_filter_seconds_count{filter="f",route="r"} 1' in lines)
+        self.assertTrue('terane_sched_task_completed_workers{task="output:store"} 5' in lines)
+        self.assertTrue('terane_sched_task_queued_workers{task="output:store"} 2' in lines)
+        self.assertTrue('terane_sched_task_thread_waiting_seconds{task="output:store"} 0.125' in lines)
+        self.assertTrue('terane_sched_class_thread_queue_depth{class="ingest"} 3' in lines)
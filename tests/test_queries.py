@@ -0,0 +1,52 @@
+from twisted.trial import unittest
+from twisted.internet.defer import succeed, fail
+from zope.interface import implements
+from zope.component import provideUtility
+from terane.sched import Scheduler, IScheduler
+from terane.routes import IIndexStore
+from terane.bier.searching import IndexWarming
+from terane.queries import QueryManager, QueryExecutionError
+
+class MockIndex(object):
+    def __init__(self, name, facets):
+        self.name = name
+        self.facets = facets
+    def getFacets(self, fieldname):
+        if isinstance(self.facets, Exception):
+            return fail(self.facets)
+        return succeed(self.facets.get(fieldname, {}))
+
+class MockIndexStore(object):
+    implements(IIndexStore)
+    def __init__(self, indices):
+        self.indices = dict([(index.name, index) for index in indices])
+    def getSearchableIndex(self, name):
+        return self.indices[name]
+    def iterSearchableIndices(self):
+        return self.indices.itervalues()
+    def iterSearchableNames(self):
+        return self.indices.iterkeys()
+
+class QueryManager_Tests(unittest.TestCase):
+    """QueryManager tests."""
+
+    def setUp(self):
+        provideUtility(Scheduler(), IScheduler)
+
+    def test_show_facets(self):
+        indexstore = MockIndexStore([
+            MockIndex('first', {u'hostname': {u'host1': 2, u'host2': 1}}),
+            MockIndex('second', {u'hostname': {u'host2': 4}}),
+            ])
+        queries = QueryManager(indexstore)
+        def check(result):
+            self.assertEqual(result.data, [[u'host2', 5], [u'host1', 2]])
+            self.assertEqual(result.meta['field'], u'hostname')
+        d = queries.showFacets(u'hostname').addCallback(check)
+        self.assertRaises(QueryExecutionError, queries.showFacets, u'hostname', ['missing'])
+        return d
+
+    def test_show_facets_warming(self):
+        indexstore = MockIndexStore([MockIndex('first', IndexWarming("index 'first' is warming"))])
+        queries = QueryManager(indexstore)
+        return self.assertFailure(queries.showFacets(u'hostname'), QueryExecutionError)
@@ -0,0 +1,116 @@
+import datetime
+from dateutil.tz import tzutc
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.task import deferLater
+from twisted.trial import unittest
+from terane.settings import _UnittestSettings
+from terane.signals import Signal
+from terane.bier.event import Contract, Event, EventBatch
+from terane.filters import StopFiltering
+from terane.routes import Route
+
+class MockField(object):
+    def validateValue(self, value):
+        return value
+
+class MockFieldStore(object):
+    def getField(self, fieldtype):
+        return MockField()
+
+class MockInput(object):
+    name = 'input'
+    def __init__(self):
+        self.contract = Contract().sign()
+        self.dispatcher = Signal()
+    def getContract(self):
+        return self.contract
+    def getDispatcher(self):
+        return self.dispatcher
+    def makeEvent(self, message):
+        event = Event(datetime.datetime.now(tzutc()), 0)
+        event[self.contract.field_message] = message
+        event[self.contract.field_hostname] = u'localhost'
+        event[self.contract.field_input] = u'input'
+        return event
+
+class MockFilter(object):
+    name = 'filter'
+    def __init__(self):
+        self.contract = Contract().sign()
+    def getContract(self):
+        return self.contract
+    def filter(self, event):
+        if event[self.contract.field_message] == u'drop':
+            raise StopFiltering()
+        return event
+
+class MockOutput(object):
+    name = 'output'
+    def __init__(self):
+        self.contract = Contract().sign()
+        self.batches = []
+        self.d = Deferred()
+        self.written = None
+    def getContract(self):
+        return self.contract
+    def receiveEvents(self, events):
+        self.batches.append(events)
+        self.d.callback(None)
+        return self.written
+
+class MockRouteManager(object):
+    def __init__(self):
+        self._inputs = {'input': MockInput()}
+        self._filters = {'filter': MockFilter()}
+        self._outputs = {'output': MockOutput()}
+        self._fieldstore = MockFieldStore()
+
+class Route_Tests(unittest.TestCase):
+    """Route tests."""
+
+    def setUp(self):
+        self.manager = MockRouteManager()
+        self.route = Route('test')
+        self.route.parent = self.manager
+        settings = _UnittestSettings()
+        settings.load({'route:test': {'input': 'input', 'filter': 'filter', 'output': 'output'}})
+        self.route.configure(settings.section('route:test'))
+        self.route.startService()
+        self.input = self.manager._inputs['input']
+        self.output = self.manager._outputs['output']
+
+    def tearDown(self):
+        self.route.stopService()
+
+    def test_receive_batch(self):
+        events = EventBatch([self.input.makeEvent(m) for m in (u'one', u'drop', u'two')])
+        self.input.getDispatcher().emitSignal(events)
+        def check(unused):
+            self.assertEqual(len(self.output.batches), 1)
+            messages = [e[self.input.contract.field_message] for e in self.output.batches[0]]
+            self.assertEqual(messages, [u'one', u'two'])
+        return self.output.d.addCallback(check)
+
+    def test_receive_single_event(self):
+        self.input.getDispatcher().emitSignal(self.input.makeEvent(u'one'))
+        def check(unused):
+            self.assertEqual(len(self.output.batches), 1)
+            self.assertEqual(len(self.output.batches[0]), 1)
+        return self.output.d.addCallback(check)
+
+    def test_batch_written(self):
+        self.output.written = Deferred()
+        events = EventBatch([self.input.makeEvent(u'one')])
+        events.trackWrites()
+        self.input.getDispatcher().emitSignal(events)
+        written = []
+        events.whenWritten().addCallback(written.append)
+        def received(unused):
+            # the output received the events but hasn't stored them yet
+            self.assertEqual(len(self.output.batches), 1)
+            self.assertEqual(written, [])
+            return deferLater(reactor, 0, self.output.written.callback, None)
+        def stored(unused):
+            self.assertEqual(len(written), 1)
+        return self.output.d.addCallback(received).addCallback(stored)
@@ -1,7 +1,8 @@
 from twisted.trial import unittest
 from twisted.internet import reactor
 from twisted.internet.task import deferLater
-from terane.sched import Scheduler, STATE_READY
+from terane.sched import (Scheduler, SchedulerOverloaded, DeadlineExceeded, currentTask,
+    STATE_READY, STATE_QUEUED, STATE_DONE, CLASS_INGEST, CLASS_INTERACTIVE)
 
 class Worker(object):
     def __init__(self):
@@ -32,6 +33,23 @@ class GeneratorWorker(object):
             self.niterations -= 1
         raise StopIteration()
 
+class SlowWorker(object):
+    def __init__(self):
+        self.closed = False
+    def next(self):
+        try:
+            while True:
+                yield deferLater(reactor, 0.1, lambda: None)
+        finally:
+            self.closed = True
+
+class BusyWorker(object):
+    def __init__(self):
+        self.stopped = False
+    def next(self):
+        if self.stopped:
+            raise StopIteration()
+
 class WorkerFailed(Exception):
     pass
 
@@ -86,6 +104,103 @@ class Scheduler_Tests(unittest.TestCase):
         task.addWorker(workers[0])
         return task.whenStateChanges().addCallback(self._taskDone, workers)
 
+    def test_worker_times(self):
+        task = self.scheduler.addTask('task 1')
+        worker = task.addWorker(DeferredWorker())
+        def check(result):
+            self.assertTrue(worker.waitingtime >= 2.5)
+            self.assertTrue(worker.runningtime < worker.waitingtime)
+            self.assertTrue(task.waitingtime >= worker.waitingtime)
+        return worker.whenDone().addCallback(check)
+
+    def test_max_workers(self):
+        task = self.scheduler.addTask('task 1', maxworkers=1, maxqueued=1)
+        first = task.addWorker(DeferredWorker())
+        second = task.addWorker(DeferredWorker())
+        self.assertEqual(task.runningworkers, 1)
+        self.assertEqual(task.queuedworkers, 1)
+        self.assertEqual(second.state, STATE_QUEUED)
+        self.assertRaises(SchedulerOverloaded, task.addWorker, DeferredWorker())
+        self.assertEqual(task.rejectedworkers, 1)
+        def check(result):
+            self.assertEqual(second.state, STATE_DONE)
+            self.assertTrue(second.queuedtime >= 2.5)
+            self.assertEqual(task.completedworkers, 2)
+        return second.whenDone().addCallback(check)
+
+    def test_weighted_classes(self):
+        ingest = self.scheduler.addTask('ingest', schedclass=CLASS_INGEST)
+        query = self.scheduler.addTask('query', schedclass=CLASS_INTERACTIVE)
+        ingest.addWorker(Worker())
+        query.addWorker(Worker())
+        classes = dict([(c.name, c) for c in self.scheduler.iterClasses()])
+        self.assertEqual(len(classes[CLASS_INGEST]._pending), 1)
+        self.assertEqual(len(classes[CLASS_INTERACTIVE]._pending), 1)
+        # the class with the smallest virtual time runs first
+        classes[CLASS_INGEST].vtime = 1.0
+        self.scheduler._tick()
+        self.assertEqual(len(classes[CLASS_INTERACTIVE]._pending), 0)
+        self.assertEqual(len(classes[CLASS_INGEST]._pending), 1)
+        return ingest.whenStateChanges()
+
+    def test_deadline_sheds_worker(self):
+        for schedclass in self.scheduler.iterClasses():
+            if schedclass.name == CLASS_INTERACTIVE:
+                schedclass.deadline = 0.2
+        task = self.scheduler.addTask('query', schedclass=CLASS_INTERACTIVE, maxworkers=1)
+        slow = SlowWorker()
+        worker = task.addWorker(slow)
+        # a queued worker means the task is overloaded
+        queued = task.addWorker(Worker())
+        def check(result):
+            self.flushLoggedErrors(DeadlineExceeded)
+            self.assertTrue(slow.closed)
+            self.assertEqual(task.shedworkers, 1)
+            return queued.whenDone()
+        d = self.assertFailure(worker.whenDone(), DeadlineExceeded)
+        return d.addCallback(check)
+
+    def test_deadline_ignores_pending_work(self):
+        for schedclass in self.scheduler.iterClasses():
+            if schedclass.name == CLASS_INTERACTIVE:
+                schedclass.deadline = 0.2
+        query = self.scheduler.addTask('query', schedclass=CLASS_INTERACTIVE, maxworkers=1)
+        slow = SlowWorker()
+        worker = query.addWorker(slow)
+        # steady ingest keeps the ingest class pending without queueing workers
+        ingest = self.scheduler.addTask('ingest', schedclass=CLASS_INGEST, maxworkers=1)
+        busy = BusyWorker()
+        ingest.addWorker(busy)
+        def check():
+            self.assertEqual(query.shedworkers, 0)
+            self.assertFalse(slow.closed)
+            # a queued worker in another class means the scheduler is overloaded
+            queued = ingest.addWorker(Worker())
+            d = self.assertFailure(worker.whenDone(), DeadlineExceeded)
+            def shed(result):
+                self.flushLoggedErrors(DeadlineExceeded)
+                self.assertEqual(query.shedworkers, 1)
+                busy.stopped = True
+                return queued.whenDone()
+            return d.addCallback(shed)
+        return deferLater(reactor, 0.5, check)
+
+    def test_thread_pool(self):
+        self.scheduler.startService()
+        task = self.scheduler.addTask('ingest', schedclass=CLASS_INGEST)
+        class ThreadWorker(object):
+            def next(worker):
+                self.assertIdentical(currentTask(), task)
+                result = yield task.deferToThread(lambda: 42)
+                self.assertEqual(result, 42)
+                raise StopIteration()
+        self.assertIdentical(currentTask(), None)
+        def check(result):
+            self.assertTrue(task.threadrunningtime > 0.0)
+            self.assertTrue(task.threadwaitingtime > 0.0)
+            self.scheduler.stopService()
+        return task.addWorker(ThreadWorker()).whenDone().addCallback(check)
+
     def test_worker_fails(self):
         task = self.scheduler.addTask('task 1')
         return self.assertFailure(task.addWorker(WorkerFailure()).whenDone(), WorkerFailed)
@@ -0,0 +1,35 @@
+from twisted.trial import unittest
+from terane.stats import StatsManager, Histogram
+
+class Histogram_Tests(unittest.TestCase):
+    """Histogram tests."""
+
+    def test_record(self):
+        h = Histogram('test', ())
+        for value in (0.0, 0.000001, 0.0015, 0.002, 100.0):
+            h.record(value)
+        self.assertEqual(h.count, 5)
+        self.assertAlmostEqual(h.sum, 100.003501)
+        self.assertEqual(sum(h.buckets), 5)
+        # 1500us and 2000us both fall into the bucket below 2048us
+        self.assertEqual(h.quantile(0.6), 0.002048)
+        self.assertEqual(h.quantile(1.0), float('inf'))
+
+    def test_empty(self):
+        self.assertEqual(Histogram('test', ()).quantile(0.5), 0.0)
+
+class StatsManager_Tests(unittest.TestCase):
+    """StatsManager tests."""
+
+    def test_labelled(self):
+        stats = StatsManager()
+        h = stats.getHistogram('terane.route.filter.seconds', {'route': 'r1', 'filter': 'f_1'})
+        self.assertIdentical(h, stats.getHistogram('terane.route.filter.seconds', {'filter': 'f_1', 'route': 'r1'}))
+        self.assertNotIdentical(h, stats.getHistogram('terane.route.filter.seconds', {'route': 'r2', 'filter': 'f_1'}))
+        self.assertRaises(TypeError, stats.getCounter, 'terane.route.filter.seconds', {'route': 'r1', 'filter': 'f_1'})
+        c = stats.getCounter('terane.route.received.events', {'route': 'r1'})
+        c += 3
+        h.record(0.5)
+        results = dict(stats.showStats('terane.route', True))
+        self.assertEqual(results['terane.route.received.events{route=r1}'], 3)
+        self.assertEqual(results['terane.route.filter.seconds{filter=f_1,route=r1}']['count'], 1)
@@ -0,0 +1,54 @@
+import datetime
+from dateutil.tz import tzutc
+from twisted.trial import unittest
+from terane.settings import _UnittestSettings, ConfigureError
+from terane.bier.event import Event
+from terane.filters import StopFiltering
+from terane.filters.regex import RegexFilter, MultiRegexFilter, _requiredLiteral
+import re
+
+class RegexFilter_Tests(unittest.TestCase):
+    """RegexFilter and MultiRegexFilter tests."""
+
+    def makeFilter(self, cls, params):
+        settings = _UnittestSettings()
+        settings.load({'filter:test': params})
+        f = cls(None, 'test')
+        f.configure(settings.section('filter:test'))
+        return f
+
+    def makeEvent(self, f, message):
+        event = Event(datetime.datetime.now(tzutc()), 0)
+        event[f.getContract().field_message] = message
+        return event
+
+    def test_required_literal(self):
+        self.assertEqual(_requiredLiteral(re.compile(r'sshd\[\d+\]: Accepted (\w+) for')), u']: Accepted ')
+        self.assertEqual(_requiredLiteral(re.compile(r'(?:foo)+bar(baz)?')), u'foo')
+        self.assertEqual(_requiredLiteral(re.compile(r'a|b')), None)
+        self.assertEqual(_requiredLiteral(re.compile(r'(?i)failed password')), None)
+
+    def test_regex(self):
+        f = self.makeFilter(RegexFilter, {'regex pattern': r'user (?P<user>\w+) logged in'})
+        event = f.filter(self.makeEvent(f, u'user alice logged in'))
+        self.assertEqual(event[f.getContract().field_user], u'alice')
+        self.assertRaises(StopFiltering, f.filter, self.makeEvent(f, u'something else'))
+
+    def test_multi_regex(self):
+        f = self.makeFilter(MultiRegexFilter, {
+            'regex patterns': 'accepted, failed, any',
+            'regex pattern accepted': r'Accepted (?P<method>\w+) for (?P<user>\w+)',
+            'regex pattern failed': r'Failed (?P<method>\w+) for (?P<user>\w+)',
+            'regex pattern any': r'(?P<word>\w+)$',
+            })
+        contract = f.getContract()
+        event = f.filter(self.makeEvent(f, u'Failed password for bob'))
+        self.assertEqual(event[contract.field_method], u'password')
+        self.assertEqual(event[contract.field_user], u'bob')
+        self.assertFalse(contract.field_word in event)
+        event = f.filter(self.makeEvent(f, u'hello'))
+        self.assertEqual(event[contract.field_word], u'hello')
+        self.assertRaises(StopFiltering, f.filter, self.makeEvent(f, u'no match'))
+
+    def test_missing_pattern(self):
+        self.assertRaises(ConfigureError, self.makeFilter, MultiRegexFilter, {'regex patterns': 'missing'})
@@ -0,0 +1,70 @@
+from twisted.trial import unittest
+from twisted.spread.pb import Error
+from twisted.internet.defer import Deferred
+from terane.inputs.collect import Collector, CollectInputPlugin
+
+class MockInput(object):
+    def __init__(self, plugin):
+        self.records = []
+        self.writes = []
+        plugin._inputs.append(self)
+    def _write(self, records):
+        self.records.append(records)
+        d = Deferred()
+        self.writes.append(d)
+        return d
+
+class Collector_Tests(unittest.TestCase):
+    """Collector tests."""
+
+    def test_reject_legacy_event(self):
+        collector = Collector('anonymous', CollectInputPlugin())
+        self.assertRaises(Error, collector.perspective_collect, {u'message': u'hello'})
+
+    def test_ack_after_write(self):
+        plugin = CollectInputPlugin()
+        input = MockInput(plugin)
+        collector = Collector('anonymous', plugin)
+        acks = []
+        d = collector.perspective_collectBatch('stream', [(1, 'a'), (2, 'b')])
+        d.addCallback(acks.append)
+        # the write is still pending, so the batch is not acknowledged
+        self.assertEqual(input.records, [['a', 'b']])
+        self.assertEqual(acks, [])
+        input.writes[0].callback(None)
+        self.assertEqual(acks, [2])
+
+    def test_ack_in_order(self):
+        plugin = CollectInputPlugin()
+        input = MockInput(plugin)
+        collector = Collector('anonymous', plugin)
+        acks = []
+        collector.perspective_collectBatch('stream', [(1, 'a')]).addCallback(acks.append)
+        collector.perspective_collectBatch('stream', [(2, 'b')]).addCallback(acks.append)
+        # the second batch waits for the first
+        input.writes[1].callback(None)
+        self.assertEqual(acks, [])
+        input.writes[0].callback(None)
+        self.assertEqual(sorted(acks), [1, 2])
+
+    def test_write_failed(self):
+        plugin = CollectInputPlugin()
+        input = MockInput(plugin)
+        collector = Collector('anonymous', plugin)
+        failures = []
+        d1 = collector.perspective_collectBatch('stream', [(1, 'a')])
+        d2 = collector.perspective_collectBatch('stream', [(2, 'b')])
+        d1.addErrback(failures.append)
+        d2.addErrback(failures.append)
+        input.writes[0].errback(Exception("disk full"))
+        input.writes[1].callback(None)
+        # neither batch is acknowledged, since the first batch was not stored
+        self.assertEqual(len(failures), 2)
+        failures[0].trap(Error)
+        failures[1].trap(Error)
+        # the replayed records are accepted again
+        acks = []
+        collector.perspective_collectBatch('stream', [(1, 'a'), (2, 'b')]).addCallback(acks.append)
+        self.assertEqual(input.records[-1], ['a', 'b'])
+        input.writes[-1].callback(None)
+        self.assertEqual(acks, [2])
@@ -1,11 +1,20 @@
-import os, sys
+import os, sys, datetime
+from dateutil.tz import tzutc
 from twisted.internet import reactor
 from twisted.internet.defer import Deferred
 from twisted.trial import unittest
 from terane.loggers import StdoutHandler, startLogging, TRACE
 from terane.settings import _UnittestSettings
+from terane.bier.event import Event
 from terane.inputs.file import FileInput, FileInputPlugin
 
+class MockEventFactory(object):
+    def __init__(self):
+        self.offset = 0
+    def makeEvent(self):
+        self.offset += 1
+        return Event(datetime.datetime.now(tzutc()), self.offset)
+
 class FileInput_Tests(unittest.TestCase):
     """FileInput tests."""
 
@@ -13,16 +22,14 @@ class FileInput_Tests(unittest.TestCase):
 
     def setUp(self):
         self.file_input = None
-        self.filename = os.path.abspath(self.mktemp())
+        self.dirname = os.path.abspath(self.mktemp())
+        os.mkdir(self.dirname)
+        self.filename = os.path.join(self.dirname, 'test.log')
         self.f = open(self.filename, 'w')
+        self.checkpoint = os.path.join(self.dirname, 'checkpoint')
+        self.lines = []
 
     def tearDown(self):
-        d = Deferred()
-        d.addCallback(self._delayedTearDown)
-        reactor.callLater(0.1, d.callback, None)
-        return d
-
-    def _delayedTearDown(self, unused):
         if self.file_input:
             self.file_input.stopService()
         self.file_input = None
@@ -30,28 +37,114 @@ class FileInput_Tests(unittest.TestCase):
             self.f.close()
         self.f = None
 
-    def writeLine(self, line):
-        self.f.write(line + '\n')
-        self.f.flush()
-        os.fsync(self.f.fileno())
-
-    def receiveEvent(self, event):
-        pass
- 
-    def test_receive_event(self):
-        self.file_input = FileInput()
-        self.file_input.setName('test_receive_event')
+    def startInput(self, **params):
+        self.file_input = FileInput(None, 'test', MockEventFactory())
         settings = _UnittestSettings()
-        settings.load({
-            'input:tempfile': {
-                'file path': self.filename,
-                'polling interval': 1
-                }
-            })
-        section = settings.section('input:tempfile')        
-        self.file_input.configure(section)
+        params.setdefault('file path', os.path.join(self.dirname, '*.log'))
+        params.setdefault('polling interval', '1')
+        params.setdefault('checkpoint file', self.checkpoint)
+        settings.load({'input:tempfile': params})
+        self.file_input.configure(settings.section('input:tempfile'))
         self.file_input.startService()
-        dispatcher = self.file_input.getDispatcher()
-        d = dispatcher.connect().addCallback(self.receiveEvent)
-        reactor.callLater(1, self.writeLine, "hello world!")
+        self.connect()
+
+    def connect(self):
+        d = self.file_input.getDispatcher().connectSignal()
+        d.addCallback(self.receiveEvent)
+
+    def receiveEvent(self, events):
+        for event in events:
+            self.lines.append(event[self.file_input.getContract().field_message])
+        self.connect()
+
+    def writeLine(self, f, line):
+        f.write(line + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+    def waitForLines(self, lines):
+        d = Deferred()
+        def check():
+            if sorted(self.lines) == sorted(lines):
+                d.callback(None)
+            else:
+                reactor.callLater(0.05, check)
+        check()
         return d
+
+    def test_receive_event(self):
+        self.startInput()
+        reactor.callLater(0.1, self.writeLine, self.f, "hello world!")
+        return self.waitForLines(["hello world!"])
+
+    def test_receive_event_polling(self):
+        self.startInput(**{'use inotify': 'false'})
+        reactor.callLater(0.1, self.writeLine, self.f, "hello world!")
+        return self.waitForLines(["hello world!"])
+
+    def test_glob_new_file(self):
+        self.startInput()
+        def writeFiles():
+            self.writeLine(self.f, "first")
+            with open(os.path.join(self.dirname, 'other.log'), 'w') as f:
+                self.writeLine(f, "second")
+            with open(os.path.join(self.dirname, 'other.txt'), 'w') as f:
+                self.writeLine(f, "ignored")
+        reactor.callLater(0.1, writeFiles)
+        return self.waitForLines(["first", "second"])
+
+    def _testRotation(self, **params):
+        self.startInput(**params)
+        def rotate():
+            self.writeLine(self.f, "before")
+            os.rename(self.filename, self.filename + '.1')
+            # the writer hasn't reopened its file yet
+            self.writeLine(self.f, "during")
+            self.f.close()
+            self.f = open(self.filename, 'w')
+            self.writeLine(self.f, "after")
+        reactor.callLater(0.1, rotate)
+        return self.waitForLines(["before", "during", "after"])
+
+    def test_rotation(self):
+        return self._testRotation()
+
+    def test_rotation_polling(self):
+        return self._testRotation(**{'use inotify': 'false'})
+
+    def test_resume_from_checkpoint(self):
+        self.startInput()
+        def restart(unused):
+            self.file_input.stopService()
+            self.writeLine(self.f, "while stopped")
+            self.lines = []
+            self.startInput()
+            return self.waitForLines(["while stopped"])
+        reactor.callLater(0.1, self.writeLine, self.f, "before stop")
+        return self.waitForLines(["before stop"]).addCallback(restart)
+
+    def test_resume_rotated(self):
+        self.startInput()
+        def restart(unused):
+            self.file_input.stopService()
+            self.writeLine(self.f, "rotated while stopped")
+            os.rename(self.filename, os.path.join(self.dirname, 'test.old'))
+            self.f.close()
+            self.f = open(self.filename, 'w')
+            self.writeLine(self.f, "new while stopped")
+            self.lines = []
+            self.startInput()
+            return self.waitForLines(["rotated while stopped", "new while stopped"])
+        reactor.callLater(0.1, self.writeLine, self.f, "before stop")
+        return self.waitForLines(["before stop"]).addCallback(restart)
+
+    def test_split_blocks(self):
+        self.startInput(**{'maximum line length': '16', 'loop chunk length': '16'})
+        def writeLong():
+            self.f.write("x" * 40 + "\nshort\nlonger line\npar")
+            self.f.flush()
+        def writeRest():
+            self.writeLine(self.f, "tial")
+        reactor.callLater(0.1, writeLong)
+        reactor.callLater(0.3, writeRest)
+        return self.waitForLines(["short", "longer line", "partial"])
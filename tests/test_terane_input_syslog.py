@@ -0,0 +1,173 @@
+import socket, datetime
+from dateutil.tz import tzutc
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.trial import unittest
+from terane.settings import _UnittestSettings, ConfigureError
+from terane.bier.event import Event
+from terane.inputs.syslog import SyslogInput, SyslogInputPlugin
+
+class MockEventFactory(object):
+    def __init__(self):
+        self.offset = 0
+    def makeEvent(self):
+        self.offset += 1
+        return Event(datetime.datetime.now(tzutc()), self.offset)
+
+class SyslogInput_Tests(unittest.TestCase):
+    """SyslogInput tests."""
+
+    timeout = 10
+
+    def setUp(self):
+        settings = _UnittestSettings()
+        settings.load({
+            'plugin:input:syslog': {
+                'syslog udp address': '127.0.0.1',
+                'syslog udp port': '0',
+                'syslog tcp enabled': 'true',
+                'syslog tcp address': '127.0.0.1',
+                'syslog tcp port': '0',
+                },
+            'input:test': {'syslog selectors': 'user.*'},
+            })
+        self.plugin = SyslogInputPlugin()
+        self.plugin.setName('input:syslog')
+        self.plugin.configure(settings.section('plugin:input:syslog'))
+        self.input = SyslogInput(self.plugin, 'test', MockEventFactory())
+        self.input.configure(settings.section('input:test'))
+        self.plugin.startService()
+        self.input.startService()
+        self.batches = []
+        self.connect()
+
+    def connect(self):
+        self.input.getDispatcher().connectSignal().addCallback(self.receiveEvents)
+
+    def receiveEvents(self, events):
+        self.batches.append(events)
+        self.connect()
+
+    def tearDown(self):
+        self.input.stopService()
+        self.plugin.stopService()
+
+    def test_receive_batch(self):
+        port = self.plugin._udplistener.getHost().port
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto('<14>Jan  1 00:00:00 host1 prog[123]: first', ('127.0.0.1', port))
+        # mail.info is not selected
+        sock.sendto('<22>Jan  1 00:00:00 host1 prog: ignored', ('127.0.0.1', port))
+        sock.sendto('<14>Jan  1 00:00:00 host2 prog: second', ('127.0.0.1', port))
+        sock.close()
+        d = Deferred()
+        def check():
+            if len(self.batches) == 0:
+                return reactor.callLater(0.05, check)
+            contract = self.input.getContract()
+            events = self.batches[0]
+            self.assertEqual([e[contract.field_message] for e in events], ['first', 'second'])
+            self.assertEqual(events[0][contract.field_hostname], 'host1')
+            self.assertEqual(events[0][contract.field_syslog_facility], u'user')
+            self.assertEqual(events[0][contract.field_syslog_pid], 123)
+            self.assertNotEqual(self.plugin._udplistener.kernelDrops(), None)
+            d.callback(None)
+        reactor.callLater(0.05, check)
+        return d
+
+    def waitForEvents(self, count):
+        d = Deferred()
+        def check():
+            events = [e for batch in self.batches for e in batch]
+            if len(events) < count:
+                return reactor.callLater(0.05, check)
+            d.callback(events)
+        reactor.callLater(0.05, check)
+        return d
+
+    def test_tcp_framing(self):
+        port = self.plugin._tcplistener.getHost().port
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect(('127.0.0.1', port))
+        first = '<14>Jan  1 00:00:00 host1 prog: first'
+        second = '<14>1 2003-10-11T22:14:15.003Z host2 app 42 ID47 - second'
+        sock.sendall('%i %s' % (len(first), first) + second[:10])
+        sock.sendall(second[10:] + '\n')
+        def check(events):
+            sock.close()
+            contract = self.input.getContract()
+            self.assertEqual([e[contract.field_message] for e in events], ['first', 'second'])
+            self.assertEqual(events[1][contract.field_hostname], 'host2')
+        return self.waitForEvents(2).addCallback(check)
+
+    def test_rfc5424(self):
+        contract = self.input.getContract()
+        event = self.input._process('127.0.0.1', 0,
+            '<14>1 2003-10-11T22:14:15.003Z mymachine.example.com evntslog - ID47 '
+            '[exampleSDID@32473 iut="3" eventSource="Appli\\"cation"][other x="]\\]"] '
+            '\xef\xbb\xbfAn application event')
+        self.assertEqual(event[contract.field_hostname], 'mymachine.example.com')
+        self.assertEqual(event[contract.field_syslog_tag], 'evntslog')
+        self.assertEqual(event[contract.field_syslog_msgid], 'ID47')
+        self.assertFalse(contract.field_syslog_pid in event)
+        self.assertEqual(event[contract.field_message], u'An application event')
+        self.assertEqual(event.ts.year, 2003)
+        fields = dict([(fn,v) for fn,ft,v in event])
+        self.assertEqual(fields[u'syslog_sd_exampleSDID_32473_iut'], u'3')
+        self.assertEqual(fields[u'syslog_sd_exampleSDID_32473_eventSource'], u'Appli"cation')
+        self.assertEqual(fields[u'syslog_sd_other_x'], u']]')
+
+    def test_rfc5424_invalid_sd_names(self):
+        event = self.input._process('127.0.0.1', 0,
+            '<14>1 2003-10-11T22:14:15.003Z host app - - '
+            '[%s a="1"][ok b\xff="2" %s="3" c="4"] msg' % ('x' * 33, 'y' * 33))
+        fields = dict([(fn,v) for fn,ft,v in event])
+        self.assertEqual([fn for fn in fields if fn.startswith(u'syslog_sd')], [u'syslog_sd_ok_c'])
+        self.assertEqual(event[self.input.getContract().field_message], 'msg')
+
+    def test_rfc5424_max_sd_fields(self):
+        settings = _UnittestSettings()
+        settings.load({'input:capped': {'syslog sd fields': '2'}})
+        input = SyslogInput(self.plugin, 'capped', MockEventFactory())
+        input.configure(settings.section('input:capped'))
+        contract = input.getContract()
+        event = input._process('127.0.0.1', 0,
+            '<14>1 2003-10-11T22:14:15.003Z host app - - '
+            '[a x="1" y="2" z="3"][b w="]\\\\"] msg')
+        fields = dict([(fn,v) for fn,ft,v in event])
+        self.assertEqual(fields[u'syslog_sd_a_x'], u'1')
+        self.assertEqual(fields[u'syslog_sd_a_y'], u'2')
+        self.assertEqual(event[contract.field_syslog_sd], u'[a z="3"][b w="\\]\\\\"]')
+        # parameters which already have a field still use it
+        event = input._process('127.0.0.1', 0,
+            '<14>1 2003-10-11T22:14:15.003Z host app - - [c v="4"][a y="5"] msg')
+        fields = dict([(fn,v) for fn,ft,v in event])
+        self.assertEqual(fields[u'syslog_sd_a_y'], u'5')
+        self.assertEqual(event[contract.field_syslog_sd], u'[c v="4"]')
+        self.assertEqual(len(input._sdassertions), 2)
+
+    def test_invalid_max_sd_fields(self):
+        settings = _UnittestSettings()
+        settings.load({'input:invalid': {'syslog sd fields': '-1'}})
+        input = SyslogInput(self.plugin, 'invalid', MockEventFactory())
+        self.assertRaises(ConfigureError, input.configure, settings.section('input:invalid'))
+
+    def test_default_selectors(self):
+        settings = _UnittestSettings()
+        settings.load({'input:default': {}})
+        input = SyslogInput(self.plugin, 'default', MockEventFactory())
+        input.configure(settings.section('input:default'))
+        # auth.info, cron.info and audit.info are selected by default
+        for pri in (4*8+6, 9*8+6, 13*8+6, 15*8+6, 23*8+7):
+            self.assertTrue(pri in input._selected)
+        self.assertEqual(len(input._selected), 24 * 8)
+
+    def test_invalid_selector(self):
+        settings = _UnittestSettings()
+        settings.load({
+            'input:facility': {'syslog selectors': 'nosuchfacility.*'},
+            'input:severity': {'syslog selectors': 'user.nosuchseverity'},
+            })
+        for name in ('facility', 'severity'):
+            input = SyslogInput(self.plugin, name, MockEventFactory())
+            self.assertRaises(ConfigureError, input.configure, settings.section('input:' + name))
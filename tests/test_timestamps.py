@@ -0,0 +1,61 @@
+import time, datetime
+from dateutil.tz import tzutc
+from twisted.trial import unittest
+from terane.timestamps import (TimestampCache, parseSyslogTimestamp, parseCLFTimestamp,
+    parseMysqlTimestamp, parseRFC2822Timestamp, parseRFC3339Timestamp)
+
+def localToUTC(*args):
+    ts = time.mktime(args + (0, 0, -1))
+    return datetime.datetime.fromtimestamp(ts, tzutc())
+
+class Timestamps_Tests(unittest.TestCase):
+    """Timestamp parser tests."""
+
+    def test_syslog(self):
+        ts = parseSyslogTimestamp('Jan  1 00:00:00')
+        year = time.localtime().tm_year
+        self.assertEqual(ts, localToUTC(year, 1, 1, 0, 0, 0))
+        self.assertEqual(ts.tzinfo, tzutc())
+        self.assertRaises(ValueError, parseSyslogTimestamp, 'Jan 1 00:00:00')
+        self.assertRaises(KeyError, parseSyslogTimestamp, 'Foo  1 00:00:00')
+
+    def test_clf(self):
+        ts = parseCLFTimestamp('10/Oct/2000:13:55:36 -0700')
+        self.assertEqual(ts, datetime.datetime(2000, 10, 10, 20, 55, 36, tzinfo=tzutc()))
+        self.assertRaises(ValueError, parseCLFTimestamp, '10/Oct/2000 13:55:36')
+
+    def test_mysql(self):
+        ts = parseMysqlTimestamp('120105  9:05:12')
+        self.assertEqual(ts, localToUTC(2012, 1, 5, 9, 5, 12))
+        ts = parseMysqlTimestamp('120105 19:05:12')
+        self.assertEqual(ts, localToUTC(2012, 1, 5, 19, 5, 12))
+
+    def test_rfc2822(self):
+        ts = parseRFC2822Timestamp('Sat, 11 Oct 2003 22:14:15 -0700')
+        self.assertEqual(ts, datetime.datetime(2003, 10, 12, 5, 14, 15, tzinfo=tzutc()))
+        self.assertRaises(ValueError, parseRFC2822Timestamp, 'not a date')
+
+    def test_rfc3339(self):
+        ts = parseRFC3339Timestamp('2003-10-11T22:14:15.003Z')
+        self.assertEqual(ts, datetime.datetime(2003, 10, 11, 22, 14, 15, 3000, tzinfo=tzutc()))
+        ts = parseRFC3339Timestamp('2003-08-24T05:14:15.000003-07:00')
+        self.assertEqual(ts, datetime.datetime(2003, 8, 24, 12, 14, 15, 3, tzinfo=tzutc()))
+        ts = parseRFC3339Timestamp('2003-08-24T05:14:15.000004-07:00')
+        self.assertEqual(ts.microsecond, 4)
+        self.assertRaises(ValueError, parseRFC3339Timestamp, '2003-08-24T05:14:15')
+
+    def test_cache(self):
+        calls = []
+        def parse(s):
+            calls.append(s)
+            return s.upper()
+        cache = TimestampCache(parse, maxsize=2)
+        self.assertEqual(cache('a'), 'A')
+        self.assertEqual(cache('a'), 'A')
+        self.assertEqual(cache('b'), 'B')
+        self.assertEqual(cache('a'), 'A')
+        self.assertEqual(calls, ['a', 'b'])
+        # the cache is emptied once it fills up
+        cache('c')
+        cache('a')
+        self.assertEqual(calls, ['a', 'b', 'c', 'a'])